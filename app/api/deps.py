@@ -2,7 +2,19 @@ from __future__ import annotations
 
 from collections.abc import Generator
 
+from fastapi import Depends, Request
+
+from app.core.registry import ServiceRegistry
 from app.db.session import SessionLocal
+from app.embeddings.batcher import EmbeddingMicroBatcher
+from app.ingest.pipeline import IngestionPipeline
+from app.ingest.queue import IngestionWorkerPool
+from app.ingest.reembed import ReembedWorker
+from app.llms.base import LLMClient
+from app.rag.query_cache import QueryCache
+from app.rag.retriever import RetrievalService
+from app.rag.semantic_cache import SemanticAnswerCache
+from app.vectorstore.base import VectorStore
 
 
 def get_session() -> Generator:
@@ -10,3 +22,41 @@ def get_session() -> Generator:
         yield session
 
 
+def get_services(request: Request) -> ServiceRegistry:
+    return request.app.state.services
+
+
+def get_vector_store(services: ServiceRegistry = Depends(get_services)) -> VectorStore:
+    return services.vector_store
+
+
+def get_retriever(services: ServiceRegistry = Depends(get_services)) -> RetrievalService:
+    return services.retriever
+
+
+def get_query_embedder(services: ServiceRegistry = Depends(get_services)) -> EmbeddingMicroBatcher:
+    return services.query_embedder
+
+
+def get_query_cache(services: ServiceRegistry = Depends(get_services)) -> QueryCache | None:
+    return services.query_cache
+
+
+def get_semantic_cache(services: ServiceRegistry = Depends(get_services)) -> SemanticAnswerCache | None:
+    return services.semantic_cache
+
+
+def get_pipeline(services: ServiceRegistry = Depends(get_services)) -> IngestionPipeline:
+    return services.pipeline
+
+
+def get_ingest_queue(services: ServiceRegistry = Depends(get_services)) -> IngestionWorkerPool:
+    return services.ingest_queue
+
+
+def get_reembedder(services: ServiceRegistry = Depends(get_services)) -> ReembedWorker:
+    return services.reembedder
+
+
+def get_llm(services: ServiceRegistry = Depends(get_services)) -> LLMClient:
+    return services.llm
@@ -1,16 +1,15 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
-from pathlib import Path
-
-from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
 from pydantic import BaseModel
 from sqlmodel import Session
 
-from app.api.deps import get_session
+from app.api.deps import get_ingest_queue, get_pipeline, get_session
+from app.core.settings import settings
 from app.db import crud
 from app.ingest.pipeline import IngestionPipeline
-from app.storage.local import save_upload
+from app.ingest.queue import IngestionWorkerPool
+from app.storage.local import link_blob, save_blob
 
 router = APIRouter()
 
@@ -19,6 +18,13 @@ class UploadResponse(BaseModel):
     doc_id: str
     filename: str
     status: str
+    # Set when the upload matched an already-ingested document (same sha256).
+    duplicate_of: str | None = None
+    tags: list[str] = []
+
+
+class DocumentTags(BaseModel):
+    tags: list[str]
 
 
 class IngestStartResponse(BaseModel):
@@ -26,15 +32,25 @@ class IngestStartResponse(BaseModel):
     state: str
 
 
-def utcnow() -> datetime:
-    return datetime.now(timezone.utc)
+class BulkIngestRequest(BaseModel):
+    # None ingests every document of the KB that is still `uploaded`.
+    doc_ids: list[str] | None = None
+    priority: int = 0
+
+
+class BulkIngestResponse(BaseModel):
+    batch_id: str | None
+    jobs: list[IngestStartResponse]
 
 
 @router.post("/{kb_id}/documents", response_model=list[UploadResponse])
 def upload_documents(
     kb_id: str,
     files: list[UploadFile] = File(...),
+    # Repeat the form field for several tags; applied to every uploaded file.
+    tags: list[str] | None = Form(None),
     session: Session = Depends(get_session),
+    pipeline: IngestionPipeline = Depends(get_pipeline),
 ) -> list[UploadResponse]:
     kb = crud.get_kb(session, kb_id)
     if not kb:
@@ -42,18 +58,81 @@ def upload_documents(
 
     out: list[UploadResponse] = []
     for f in files:
-        doc = crud.create_document(session, kb_id=kb_id, original_filename=f.filename or "upload", content_type=f.content_type)
-        save_upload(kb_id, doc.id, f)
-        out.append(UploadResponse(doc_id=doc.id, filename=doc.original_filename, status=doc.status))
+        blob = save_blob(f)
+        filename = f.filename or "upload"
+
+        existing = None
+        if settings.upload_dedup:
+            existing = crud.find_ready_document_by_hash(
+                session,
+                content_hash=blob.sha256,
+                embedding_model=crud.kb_embedding_model(session, kb_id),
+                prefer_kb_id=kb_id,
+            )
+        if existing and existing.kb_id == kb_id:
+            # Same bytes already ingested in this KB: hand back that document, with this upload's tags added.
+            merged = crud.normalize_tags([*(existing.tags or []), *(tags or [])])
+            if merged != (existing.tags or []):
+                existing = crud.set_document_tags(session, existing, merged)
+            out.append(
+                UploadResponse(
+                    doc_id=existing.id,
+                    filename=existing.original_filename,
+                    status=existing.status,
+                    duplicate_of=existing.id,
+                    tags=existing.tags or [],
+                )
+            )
+            continue
+
+        doc = crud.create_document(
+            session,
+            kb_id=kb_id,
+            original_filename=filename,
+            content_type=f.content_type,
+            content_hash=blob.sha256,
+            tags=tags,
+        )
+        crud.record_blob(session, sha256=blob.sha256, size=blob.size)
+        link_blob(kb_id, doc.id, filename, blob)
+
+        if existing:
+            # Ingested in another KB: copy its chunks and vectors instead of re-ingesting.
+            pipeline.clone_document(session=session, src=existing, doc=doc)
+        out.append(
+            UploadResponse(
+                doc_id=doc.id,
+                filename=doc.original_filename,
+                status=doc.status,
+                duplicate_of=existing.id if existing else None,
+                tags=doc.tags,
+            )
+        )
     return out
 
 
+@router.put("/{kb_id}/documents/{doc_id}/tags", response_model=DocumentTags)
+def set_document_tags(
+    kb_id: str,
+    doc_id: str,
+    payload: DocumentTags,
+    session: Session = Depends(get_session),
+) -> DocumentTags:
+    """Replace a document's tags; its chunks become filterable by them (`{"tags": "..."}`) without re-ingestion."""
+    doc = crud.get_document(session, doc_id)
+    if not doc or doc.kb_id != kb_id:
+        raise HTTPException(status_code=404, detail="document not found")
+    doc = crud.set_document_tags(session, doc, payload.tags)
+    return DocumentTags(tags=doc.tags)
+
+
 @router.post("/{kb_id}/documents/{doc_id}/ingest", response_model=IngestStartResponse)
 def start_ingest(
     kb_id: str,
     doc_id: str,
-    background: BackgroundTasks,
+    priority: int = 0,
     session: Session = Depends(get_session),
+    queue: IngestionWorkerPool = Depends(get_ingest_queue),
 ) -> IngestStartResponse:
     kb = crud.get_kb(session, kb_id)
     if not kb:
@@ -63,53 +142,44 @@ def start_ingest(
     if not doc or doc.kb_id != kb_id:
         raise HTTPException(status_code=404, detail="document not found")
 
-    job = crud.create_ingestion_job(session, kb_id=kb_id, doc_id=doc_id)
-
-    def _run(job_id: str) -> None:
-        # Separate session for background task.
-        from app.db.session import SessionLocal
-
-        with SessionLocal() as bg:
-            j = crud.get_job(bg, job_id)
-            if not j:
-                return
-            j.state = "running"
-            j.started_at = utcnow()
-            bg.add(j)
-            bg.commit()
-
-            try:
-                from app.core.settings import settings
-                raw_dir = settings.kb_files_dir / kb_id / "raw" / doc_id
-                # Take the first file in the raw dir (MVP).
-                files = sorted([p for p in raw_dir.glob("*") if p.is_file()])
-                if not files:
-                    raise ValueError("no raw file found for document")
-
-                pipeline = IngestionPipeline()
-                pipeline.ingest_document(
-                    session=bg,
-                    kb_id=kb_id,
-                    doc_id=doc_id,
-                    raw_path=files[0],
-                    content_type=doc.content_type,
-                )
-
-                j.state = "succeeded"
-                j.finished_at = utcnow()
-                bg.add(j)
-                bg.commit()
-            except Exception as e:
-                j.state = "failed"
-                j.error = str(e)
-                j.finished_at = utcnow()
-                bg.add(j)
-                bg.commit()
-
-    background.add_task(_run, job.id)
+    # The job row is the queue entry; a worker picks it up (also after a restart).
+    job = crud.create_ingestion_job(session, kb_id=kb_id, doc_id=doc_id, priority=priority)
+    queue.notify()
     return IngestStartResponse(job_id=job.id, state=job.state)
 
 
+@router.post("/{kb_id}/ingest", response_model=BulkIngestResponse)
+def start_bulk_ingest(
+    kb_id: str,
+    payload: BulkIngestRequest | None = None,
+    session: Session = Depends(get_session),
+    queue: IngestionWorkerPool = Depends(get_ingest_queue),
+) -> BulkIngestResponse:
+    kb = crud.get_kb(session, kb_id)
+    if not kb:
+        raise HTTPException(status_code=404, detail="knowledge base not found")
+
+    payload = payload or BulkIngestRequest()
+    if payload.doc_ids is None:
+        doc_ids = [d.id for d in crud.list_documents_by_status(session, kb_id, "uploaded")]
+    else:
+        doc_ids = list(dict.fromkeys(payload.doc_ids))
+        for doc_id in doc_ids:
+            doc = crud.get_document(session, doc_id)
+            if not doc or doc.kb_id != kb_id:
+                raise HTTPException(status_code=404, detail=f"document not found: {doc_id}")
+
+    if not doc_ids:
+        return BulkIngestResponse(batch_id=None, jobs=[])
+
+    jobs = crud.create_ingestion_batch(session, kb_id=kb_id, doc_ids=doc_ids, priority=payload.priority)
+    queue.notify()
+    return BulkIngestResponse(
+        batch_id=jobs[0].batch_id,
+        jobs=[IngestStartResponse(job_id=j.id, state=j.state) for j in jobs],
+    )
+
+
 @router.get("/{kb_id}/jobs/{job_id}")
 def get_job(kb_id: str, job_id: str, session: Session = Depends(get_session)) -> dict:
     kb = crud.get_kb(session, kb_id)
@@ -122,8 +192,11 @@ def get_job(kb_id: str, job_id: str, session: Session = Depends(get_session)) ->
         "id": job.id,
         "kb_id": job.kb_id,
         "doc_id": job.doc_id,
+        "batch_id": job.batch_id,
         "state": job.state,
         "error": job.error,
+        "priority": job.priority,
+        "attempts": job.attempts,
         "created_at": job.created_at,
         "started_at": job.started_at,
         "finished_at": job.finished_at,
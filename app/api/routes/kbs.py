@@ -5,8 +5,11 @@ from sqlmodel import Session
 
 from fastapi import APIRouter, Depends, HTTPException
 
-from app.api.deps import get_session
+from app.api.deps import get_reembedder, get_session
+from app.core.settings import settings
 from app.db import crud
+from app.db.models import KnowledgeBase, ReembedJob
+from app.ingest.reembed import ReembedWorker
 
 router = APIRouter()
 
@@ -16,16 +19,21 @@ class KBCreate(BaseModel):
     description: str | None = None
 
 
+class ReembedRequest(BaseModel):
+    # Defaults to the configured EMBEDDING_MODEL; others must be listed in REEMBED_ALLOWED_MODELS.
+    model: str | None = None
+
+
 @router.post("")
 def create_kb(payload: KBCreate, session: Session = Depends(get_session)) -> dict:
     kb = crud.create_kb(session, name=payload.name, description=payload.description)
-    return {"id": kb.id, "name": kb.name, "description": kb.description, "created_at": kb.created_at}
+    return _kb_out(kb)
 
 
 @router.get("")
 def list_kbs(session: Session = Depends(get_session)) -> list[dict]:
     kbs = crud.list_kbs(session)
-    return [{"id": kb.id, "name": kb.name, "description": kb.description, "created_at": kb.created_at} for kb in kbs]
+    return [_kb_out(kb) for kb in kbs]
 
 
 @router.get("/{kb_id}")
@@ -33,6 +41,108 @@ def get_kb(kb_id: str, session: Session = Depends(get_session)) -> dict:
     kb = crud.get_kb(session, kb_id)
     if not kb:
         raise HTTPException(status_code=404, detail="knowledge base not found")
-    return {"id": kb.id, "name": kb.name, "description": kb.description, "created_at": kb.created_at}
+    return _kb_out(kb)
+
+
+@router.post("/{kb_id}/reembed", status_code=202)
+def start_reembed(
+    kb_id: str,
+    payload: ReembedRequest | None = None,
+    session: Session = Depends(get_session),
+    worker: ReembedWorker = Depends(get_reembedder),
+) -> dict:
+    """
+    Re-embed the KB's stored chunks with another model in the background. Queries keep using the
+    current model and vectors until the new ones are complete, then switch over at once.
+    """
+    kb = crud.get_kb(session, kb_id)
+    if not kb:
+        raise HTTPException(status_code=404, detail="knowledge base not found")
+    model = (payload.model if payload else None) or settings.embedding_model
+    allowed = [settings.embedding_model, *settings.reembed_allowed_models]
+    if model not in allowed:
+        raise HTTPException(status_code=422, detail=f"model must be one of: {', '.join(allowed)}")
+    if model == (kb.embedding_model or settings.embedding_model):
+        raise HTTPException(status_code=409, detail=f"knowledge base already uses {model}")
+    if crud.active_reembed_job(session, kb_id) is not None:
+        raise HTTPException(status_code=409, detail="this knowledge base is already being re-embedded")
+
+    job = crud.create_reembed_job(session, kb, target_model=model)
+    worker.notify()
+    return _job_out(job)
+
+
+@router.get("/{kb_id}/reembed")
+def list_reembed_jobs(kb_id: str, session: Session = Depends(get_session)) -> list[dict]:
+    if not crud.get_kb(session, kb_id):
+        raise HTTPException(status_code=404, detail="knowledge base not found")
+    return [_job_out(j) for j in crud.list_reembed_jobs(session, kb_id)]
+
+
+@router.get("/{kb_id}/reembed/{job_id}")
+def get_reembed_job(kb_id: str, job_id: str, session: Session = Depends(get_session)) -> dict:
+    return _job_out(_reembed_job(session, kb_id, job_id))
+
+
+@router.delete("/{kb_id}/reembed/{job_id}")
+def cancel_reembed_job(
+    kb_id: str,
+    job_id: str,
+    session: Session = Depends(get_session),
+    worker: ReembedWorker = Depends(get_reembedder),
+) -> dict:
+    """Cancel a queued or running re-embedding; the KB keeps its current model and its shadow collection is dropped."""
+    job = _reembed_job(session, kb_id, job_id)
+    if not crud.cancel_reembed_job(session, job.id):
+        raise HTTPException(status_code=409, detail=f"re-embedding job is {job.state}")
+    worker.notify()
+    session.refresh(job)
+    return _job_out(job)
+
+
+def _reembed_job(session: Session, kb_id: str, job_id: str) -> ReembedJob:
+    if not crud.get_kb(session, kb_id):
+        raise HTTPException(status_code=404, detail="knowledge base not found")
+    job = crud.get_reembed_job(session, job_id)
+    if not job or job.kb_id != kb_id:
+        raise HTTPException(status_code=404, detail="re-embedding job not found")
+    return job
+
+
+def _kb_out(kb: KnowledgeBase) -> dict:
+    return {
+        "id": kb.id,
+        "name": kb.name,
+        "description": kb.description,
+        "created_at": kb.created_at,
+        "embedding_model": kb.embedding_model or settings.embedding_model,
+    }
 
 
+def _job_out(job: ReembedJob) -> dict:
+    # Progress rate over the job's running time so far (heartbeats are written after every step).
+    elapsed = None
+    if job.started_at and (job.finished_at or job.heartbeat_at):
+        elapsed = ((job.finished_at or job.heartbeat_at) - job.started_at).total_seconds()
+    rate = job.done / elapsed if elapsed and job.done else None
+    remaining = max(0, job.total - job.done)
+    return {
+        "id": job.id,
+        "kb_id": job.kb_id,
+        "state": job.state,
+        "error": job.error,
+        "source_model": job.source_model,
+        "target_model": job.target_model,
+        "generation": job.generation,
+        "done": job.done,
+        "total": job.total,
+        "progress": round(min(1.0, job.done / job.total), 4) if job.total else None,
+        "chunks_per_s": round(rate, 2) if rate else None,
+        "eta_s": round(remaining / rate, 1) if rate and job.state in ("queued", "running") else None,
+        "yielded_s": round(job.yielded_s, 2),
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "switched_at": job.switched_at,
+        "retired_at": job.retired_at,
+        "finished_at": job.finished_at,
+    }
@@ -1,45 +1,376 @@
 from __future__ import annotations
 
-from typing import Any
+import asyncio
+import json
+import logging
+from collections.abc import AsyncIterator, Awaitable
+from dataclasses import dataclass
+from typing import Any, TypeVar
 
+import numpy as np
 from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
-from sqlmodel import Session
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, field_validator
+from starlette.concurrency import run_in_threadpool
 
-from app.api.deps import get_session
+from app.api.deps import get_llm, get_query_cache, get_query_embedder, get_retriever, get_semantic_cache
+from app.core.settings import settings
 from app.db import crud
-from app.llms.gemini import GeminiClient
+from app.db.session import SessionLocal
+from app.embeddings.batcher import EmbeddingMicroBatcher
+from app.llms.base import LLMClient
 from app.rag.prompting import build_storyteller_system_prompt, build_user_prompt
+from app.rag.query_cache import QueryCache
 from app.rag.retriever import RetrievalService
+from app.rag.semantic_cache import SemanticAnswerCache
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+T = TypeVar("T")
+
 
 class QueryRequest(BaseModel):
     question: str
-    top_k: int | None = None
+    top_k: int | None = Field(None, ge=1, le=50)
     filters: dict[str, Any] | None = None
 
 
-@router.post("/{kb_id}/query")
-def query_kb(kb_id: str, payload: QueryRequest, session: Session = Depends(get_session)) -> dict:
-    kb = crud.get_kb(session, kb_id)
-    if not kb:
+class FederatedQueryRequest(BaseModel):
+    kb_ids: list[str]
+    question: str
+    sub_questions: list[str] = []
+    top_k: int | None = Field(None, ge=1, le=50)
+    filters: dict[str, Any] | None = None
+
+    @field_validator("question")
+    @classmethod
+    def _question_not_blank(cls, v: str) -> str:
+        if not v.strip():
+            raise ValueError("question must not be blank")
+        return v.strip()
+
+    @field_validator("sub_questions")
+    @classmethod
+    def _drop_blank_sub_questions(cls, v: list[str]) -> list[str]:
+        return [q.strip() for q in v if q.strip()]
+
+
+@dataclass
+class _Prepared:
+    """Everything `/query` knows before calling the LLM; `answer` is set when a cache already has it."""
+
+    kb_version: int
+    scope: str
+    query_vector: np.ndarray | None
+    contexts: list[dict[str, Any]]
+    system: str
+    user: str
+    answer_key: str | None = None
+    answer: str | None = None
+    cached: dict[str, Any] | None = None
+
+
+async def _prepare(
+    kb_id: str,
+    payload: QueryRequest,
+    *,
+    retriever: RetrievalService,
+    embedder: EmbeddingMicroBatcher,
+    cache: QueryCache | None,
+    semantic: SemanticAnswerCache | None,
+) -> _Prepared:
+    state = await run_in_threadpool(_kb_state, kb_id, retriever)
+    if state is None:
         raise HTTPException(status_code=404, detail="knowledge base not found")
+    kb_version, model = state
 
-    retriever = RetrievalService()
-    contexts = retriever.retrieve(kb_id=kb_id, question=payload.question, top_k=payload.top_k, where=payload.filters)
+    def embed() -> Awaitable[np.ndarray]:
+        # Question embeddings from concurrent requests share one forward pass (per embedding model).
+        return _deadline("embedding", embedder.embed(payload.question, model=model), settings.query_embed_timeout_s)
+
+    qv = None
+    scope = SemanticAnswerCache.scope(top_k=payload.top_k, filters=payload.filters)
+    if semantic is not None:
+        qv = await embed()
+        hit = semantic.lookup(
+            kb_id=kb_id, kb_version=kb_version, model=settings.gemini_model, scope=scope, query_vector=qv
+        )
+        if hit is not None:
+            entry, similarity = hit
+            return _Prepared(
+                kb_version=kb_version,
+                scope=scope,
+                query_vector=qv,
+                contexts=entry.contexts,
+                system="",
+                user="",
+                answer=entry.answer,
+                cached={
+                    "contexts": True,
+                    "answer": True,
+                    "semantic": {"question": entry.question, "similarity": similarity},
+                },
+            )
+
+    context_key = None
+    contexts = None
+    if cache is not None:
+        context_key = cache.context_key(
+            kb_id=kb_id,
+            kb_version=kb_version,
+            question=payload.question,
+            top_k=payload.top_k,
+            filters=payload.filters,
+        )
+        contexts = cache.get_contexts(context_key)
+    contexts_cached = contexts is not None
+
+    if contexts is None:
+        # A pending embedding is awaited inside retrieval, after the BM25 search has started.
+        query_vector = qv if qv is not None else asyncio.ensure_future(embed())
+        contexts = await _deadline(
+            "retrieval",
+            retriever.aretrieve_with_vector(
+                kb_id=kb_id,
+                query_vector=query_vector,
+                question=payload.question,
+                top_k=payload.top_k,
+                where=payload.filters,
+            ),
+            settings.query_retrieve_timeout_s,
+        )
+        if qv is None:
+            qv = query_vector.result()
+        if cache is not None:
+            cache.put_contexts(context_key, contexts)
 
     system = build_storyteller_system_prompt()
     user = build_user_prompt(payload.question, contexts=contexts)
 
-    client = GeminiClient()
-    answer = client.generate(system=system, user=user)
+    answer_key = None
+    answer = None
+    if cache is not None:
+        answer_key = cache.answer_key(model=settings.gemini_model, system=system, user=user)
+        answer = cache.get_answer(answer_key)
+
+    return _Prepared(
+        kb_version=kb_version,
+        scope=scope,
+        query_vector=qv,
+        contexts=contexts,
+        system=system,
+        user=user,
+        answer_key=answer_key,
+        answer=answer,
+        cached={"contexts": contexts_cached, "answer": answer is not None},
+    )
+
+
+def _remember(
+    kb_id: str,
+    payload: QueryRequest,
+    prep: _Prepared,
+    answer: str,
+    *,
+    cache: QueryCache | None,
+    semantic: SemanticAnswerCache | None,
+) -> None:
+    if cache is not None and prep.answer_key is not None:
+        cache.put_answer(prep.answer_key, answer)
+    if semantic is not None and prep.query_vector is not None:
+        semantic.store(
+            kb_id=kb_id,
+            kb_version=prep.kb_version,
+            model=settings.gemini_model,
+            scope=prep.scope,
+            query_vector=prep.query_vector,
+            question=payload.question,
+            answer=answer,
+            contexts=prep.contexts,
+        )
+
+
+@router.post("/query")
+async def query_kbs(
+    payload: FederatedQueryRequest,
+    retriever: RetrievalService = Depends(get_retriever),
+    embedder: EmbeddingMicroBatcher = Depends(get_query_embedder),
+    client: LLMClient = Depends(get_llm),
+) -> dict:
+    """
+    Federated `/query`: searches every KB in `kb_ids` for the question and each sub-question,
+    and answers from one merged, packed context list (see `RetrievalService.afederated_retrieve`).
+
+    All questions are embedded together (the micro-batcher coalesces them into one forward
+    pass, per embedding model when the KBs serve different ones) and every KB is searched
+    concurrently. The query and semantic caches are per KB, so this path does not use them.
+    """
+    kb_ids = list(dict.fromkeys(payload.kb_ids))
+    questions = list(dict.fromkeys((payload.question, *payload.sub_questions)))
+    if not kb_ids:
+        raise HTTPException(status_code=422, detail="kb_ids must not be empty")
+    if len(kb_ids) > settings.federated_max_kbs:
+        raise HTTPException(status_code=422, detail=f"at most {settings.federated_max_kbs} kb_ids per query")
+    if len(questions) > settings.federated_max_questions:
+        raise HTTPException(
+            status_code=422, detail=f"at most {settings.federated_max_questions} questions per query"
+        )
+
+    models = await run_in_threadpool(_kb_models, kb_ids, retriever)
+    missing = [kb_id for kb_id in kb_ids if kb_id not in models]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"knowledge bases not found: {', '.join(missing)}")
+
+    distinct = list(dict.fromkeys(models.values()))
+    vectors = await _deadline(
+        "embedding",
+        asyncio.gather(*(embedder.embed(q, model=m) for m in distinct for q in questions)),
+        settings.query_embed_timeout_s,
+    )
+    by_model = {m: np.stack(vectors[i * len(questions) : (i + 1) * len(questions)]) for i, m in enumerate(distinct)}
+    contexts = await _deadline(
+        "retrieval",
+        retriever.afederated_retrieve(
+            kb_ids=kb_ids,
+            questions=questions,
+            query_vectors=by_model[distinct[0]] if len(distinct) == 1 else {k: by_model[models[k]] for k in kb_ids},
+            top_k=payload.top_k,
+            where=payload.filters,
+        ),
+        settings.query_retrieve_timeout_s,
+    )
+
+    system = build_storyteller_system_prompt()
+    user = build_user_prompt(questions[0], contexts=contexts)
+    answer = await _deadline("generation", client.agenerate(system=system, user=user), settings.gemini_timeout_s)
+    return {
+        "kb_ids": kb_ids,
+        "question": questions[0],
+        "sub_questions": questions[1:],
+        "answer": answer,
+        "contexts": contexts,
+    }
+
+
+@router.post("/{kb_id}/query")
+async def query_kb(
+    kb_id: str,
+    payload: QueryRequest,
+    retriever: RetrievalService = Depends(get_retriever),
+    embedder: EmbeddingMicroBatcher = Depends(get_query_embedder),
+    client: LLMClient = Depends(get_llm),
+    cache: QueryCache | None = Depends(get_query_cache),
+    semantic: SemanticAnswerCache | None = Depends(get_semantic_cache),
+) -> dict:
+    prep = await _prepare(
+        kb_id, payload, retriever=retriever, embedder=embedder, cache=cache, semantic=semantic
+    )
+
+    answer = prep.answer
+    if answer is None:
+        answer = await _deadline(
+            "generation", client.agenerate(system=prep.system, user=prep.user), settings.gemini_timeout_s
+        )
+        _remember(kb_id, payload, prep, answer, cache=cache, semantic=semantic)
 
     return {
         "kb_id": kb_id,
         "question": payload.question,
         "answer": answer,
-        "contexts": contexts,
+        "contexts": prep.contexts,
+        "cached": prep.cached,
     }
 
+
+@router.post("/{kb_id}/query/stream")
+async def query_kb_stream(
+    kb_id: str,
+    payload: QueryRequest,
+    retriever: RetrievalService = Depends(get_retriever),
+    embedder: EmbeddingMicroBatcher = Depends(get_query_embedder),
+    client: LLMClient = Depends(get_llm),
+    cache: QueryCache | None = Depends(get_query_cache),
+    semantic: SemanticAnswerCache | None = Depends(get_semantic_cache),
+) -> StreamingResponse:
+    """
+    Server-Sent Events variant of `/query`: one `contexts` event as soon as retrieval is
+    done, a `token` event per text delta from the LLM, then `done` with the full answer
+    (or `error` if generation fails midway). Cached answers arrive as a single token.
+    """
+    # Retrieval runs before the response starts, so a missing KB is still a plain 404.
+    prep = await _prepare(
+        kb_id, payload, retriever=retriever, embedder=embedder, cache=cache, semantic=semantic
+    )
+
+    async def events() -> AsyncIterator[str]:
+        yield _sse("contexts", {"kb_id": kb_id, "question": payload.question, "contexts": prep.contexts})
+        if prep.answer is not None:
+            yield _sse("token", {"text": prep.answer})
+            yield _sse("done", {"answer": prep.answer, "cached": prep.cached})
+            return
+
+        parts: list[str] = []
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.gemini_timeout_s
+        stream = client.agenerate_stream(system=prep.system, user=prep.user)
+        try:
+            while True:
+                try:
+                    text = await asyncio.wait_for(stream.__anext__(), timeout=max(0.0, deadline - loop.time()))
+                except StopAsyncIteration:
+                    break
+                parts.append(text)
+                yield _sse("token", {"text": text})
+        except asyncio.TimeoutError:
+            logger.warning("streaming generation for kb %s exceeded %gs", kb_id, settings.gemini_timeout_s)
+            yield _sse("error", {"detail": f"generation exceeded {settings.gemini_timeout_s:g}s deadline"})
+            return
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("streaming generation failed for kb %s", kb_id)
+            yield _sse("error", {"detail": str(exc)})
+            return
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+        answer = "".join(parts)
+        _remember(kb_id, payload, prep, answer, cache=cache, semantic=semantic)
+        yield _sse("done", {"answer": answer, "cached": prep.cached})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _kb_state(kb_id: str, retriever: RetrievalService) -> tuple[int, str] | None:
+    """(version, model to embed the question with) of the KB, or None if it does not exist."""
+    # Short-lived session: a request-scoped one would hold a pooled connection through the LLM call.
+    with SessionLocal() as session:
+        kb = crud.get_kb(session, kb_id)
+        version = None if kb is None else (kb.version or 0)
+    return None if version is None else (version, retriever.embedding_model(kb_id))
+
+
+def _kb_models(kb_ids: list[str], retriever: RetrievalService) -> dict[str, str]:
+    """Model to embed the questions with, per existing KB; missing KBs are absent."""
+    with SessionLocal() as session:
+        found = [kb_id for kb_id in kb_ids if crud.get_kb(session, kb_id) is not None]
+    return {kb_id: retriever.embedding_model(kb_id) for kb_id in found}
+
+
+async def _deadline(stage: str, aw: Awaitable[T], timeout_s: float) -> T:
+    """Await one `/query` stage, turning an exceeded deadline into a 504 naming the stage."""
+    try:
+        return await asyncio.wait_for(aw, timeout=timeout_s)
+    except asyncio.TimeoutError:
+        logger.warning("/query %s exceeded %gs deadline", stage, timeout_s)
+        raise HTTPException(status_code=504, detail=f"{stage} exceeded {timeout_s:g}s deadline") from None
+
+
+def _sse(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.api.deps import (
+    get_ingest_queue,
+    get_query_cache,
+    get_query_embedder,
+    get_reembedder,
+    get_retriever,
+    get_semantic_cache,
+    get_vector_store,
+)
+from app.core.settings import settings
+from app.embeddings.batcher import EmbeddingMicroBatcher
+from app.embeddings.cache import get_embedding_cache
+from app.ingest.queue import IngestionWorkerPool
+from app.ingest.reembed import ReembedWorker
+from app.rag.query_cache import QueryCache
+from app.rag.retriever import RetrievalService
+from app.rag.semantic_cache import SemanticAnswerCache
+from app.vectorstore.base import VectorStore
+
+router = APIRouter()
+
+
+@router.get("/embedding-cache")
+def embedding_cache_stats() -> dict:
+    cache = get_embedding_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@router.get("/query-embedder")
+def query_embedder_stats(batcher: EmbeddingMicroBatcher = Depends(get_query_embedder)) -> dict:
+    return batcher.stats()
+
+
+@router.get("/query-cache")
+def query_cache_stats(cache: QueryCache | None = Depends(get_query_cache)) -> dict:
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@router.get("/semantic-cache")
+def semantic_cache_stats(cache: SemanticAnswerCache | None = Depends(get_semantic_cache)) -> dict:
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@router.get("/context-packing")
+def context_packing_stats(retriever: RetrievalService = Depends(get_retriever)) -> dict:
+    return {"enabled": settings.rag_packing, **retriever.packing_stats.snapshot()}
+
+
+@router.get("/reranker")
+def reranker_stats(retriever: RetrievalService = Depends(get_retriever)) -> dict:
+    if retriever.reranker is None:
+        return {"enabled": False}
+    return {"enabled": True, **retriever.reranker.stats()}
+
+
+@router.get("/ingest-queue")
+def ingest_queue_stats(queue: IngestionWorkerPool = Depends(get_ingest_queue)) -> dict:
+    return queue.stats()
+
+
+@router.get("/reembed")
+def reembed_stats(worker: ReembedWorker = Depends(get_reembedder)) -> dict:
+    return worker.stats()
+
+
+@router.get("/vector-store/{kb_id}")
+def vector_store_stats(kb_id: str, vs: VectorStore = Depends(get_vector_store)) -> dict:
+    stats = getattr(vs, "stats", None)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="vector store does not report stats")
+    return {"store": type(vs).__name__, **stats(kb_id)}
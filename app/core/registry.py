@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import logging
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.embeddings.batcher import EmbeddingMicroBatcher
+    from app.ingest.pipeline import IngestionPipeline
+    from app.ingest.queue import IngestionWorkerPool
+    from app.ingest.reembed import ReembedWorker
+    from app.llms.base import LLMClient
+    from app.rag.query_cache import QueryCache
+    from app.rag.retriever import RetrievalService
+    from app.rag.semantic_cache import SemanticAnswerCache
+    from app.vectorstore.base import VectorStore
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceRegistry:
+    """
+    Application-scoped holder for expensive, long-lived clients.
+
+    Everything is built lazily on first use and then shared by every request, so the
+    Chroma client, the HF model and the Gemini SDK client are created once per process.
+    """
+
+    def __init__(self, *, llm: LLMClient | None = None) -> None:
+        self._lock = threading.Lock()
+        self._vector_store: VectorStore | None = None
+        self._retriever: RetrievalService | None = None
+        self._pipeline: IngestionPipeline | None = None
+        # Pass `llm` (e.g. app.llms.fake.FakeLLMClient) to run without a Gemini API key.
+        self._llm: LLMClient | None = llm
+        self._batcher: EmbeddingMicroBatcher | None = None
+        self._ingest_queue: IngestionWorkerPool | None = None
+        self._reembedder: ReembedWorker | None = None
+        self._query_cache: QueryCache | None = None
+        self._semantic_cache: SemanticAnswerCache | None = None
+
+    @property
+    def vector_store(self) -> VectorStore:
+        if self._vector_store is None:
+            with self._lock:
+                if self._vector_store is None:
+                    from app.vectorstore.factory import create_vector_store
+
+                    self._vector_store = create_vector_store()
+        return self._vector_store
+
+    @property
+    def retriever(self) -> RetrievalService:
+        if self._retriever is None:
+            vs = self.vector_store
+            with self._lock:
+                if self._retriever is None:
+                    from app.rag.retriever import RetrievalService
+
+                    self._retriever = RetrievalService(vector_store=vs)
+        return self._retriever
+
+    @property
+    def pipeline(self) -> IngestionPipeline:
+        if self._pipeline is None:
+            vs = self.vector_store
+            with self._lock:
+                if self._pipeline is None:
+                    from app.ingest.pipeline import IngestionPipeline
+
+                    self._pipeline = IngestionPipeline(vector_store=vs)
+        return self._pipeline
+
+    @property
+    def ingest_queue(self) -> IngestionWorkerPool:
+        if self._ingest_queue is None:
+            vs = self.vector_store
+            with self._lock:
+                if self._ingest_queue is None:
+                    from app.core.settings import settings
+                    from app.ingest.pipeline import IngestionPipeline
+                    from app.ingest.queue import IngestionWorkerPool
+
+                    self._ingest_queue = IngestionWorkerPool(
+                        lambda: IngestionPipeline(vector_store=vs),
+                        workers=settings.ingest_workers,
+                        lease_s=settings.ingest_lease_s,
+                        poll_interval_s=settings.ingest_poll_interval_s,
+                        max_attempts=settings.ingest_max_attempts,
+                    )
+        return self._ingest_queue
+
+    @property
+    def reembedder(self) -> ReembedWorker:
+        if self._reembedder is None:
+            vs = self.vector_store
+            with self._lock:
+                if self._reembedder is None:
+                    from app.embeddings.hf_dense import HuggingFaceDenseEmbedder
+                    from app.ingest.reembed import ReembedWorker
+
+                    # Yields to live question embedding (no query embedder yet means no query traffic).
+                    self._reembedder = ReembedWorker(
+                        embedder=HuggingFaceDenseEmbedder(),
+                        vector_store=vs,  # type: ignore[arg-type]
+                        query_idle_s=lambda: self._batcher.idle_s() if self._batcher is not None else float("inf"),
+                    )
+        return self._reembedder
+
+    @property
+    def query_embedder(self) -> EmbeddingMicroBatcher:
+        if self._batcher is None:
+            with self._lock:
+                if self._batcher is None:
+                    from app.core.settings import settings
+                    from app.embeddings.batcher import EmbeddingMicroBatcher
+                    from app.embeddings.hf_dense import HuggingFaceDenseEmbedder
+
+                    self._batcher = EmbeddingMicroBatcher(
+                        HuggingFaceDenseEmbedder(),
+                        max_batch=settings.query_embed_max_batch,
+                        max_wait_ms=settings.query_embed_max_wait_ms,
+                        threads=settings.query_embed_threads,
+                        max_queue=settings.query_embed_max_queue,
+                    )
+        return self._batcher
+
+    @property
+    def query_cache(self) -> QueryCache | None:
+        """None when QUERY_CACHE_ENABLED is false."""
+        from app.core.settings import settings
+
+        if self._query_cache is None and settings.query_cache_enabled:
+            with self._lock:
+                if self._query_cache is None:
+                    from app.rag.query_cache import QueryCache
+
+                    self._query_cache = QueryCache(
+                        max_items=settings.query_cache_max_items,
+                        ttl_s=settings.query_cache_ttl_s,
+                        answers=settings.query_answer_cache_enabled,
+                    )
+        return self._query_cache
+
+    @property
+    def semantic_cache(self) -> SemanticAnswerCache | None:
+        """None when SEMANTIC_CACHE_ENABLED is false."""
+        from app.core.settings import settings
+
+        if self._semantic_cache is None and settings.semantic_cache_enabled:
+            with self._lock:
+                if self._semantic_cache is None:
+                    from app.rag.semantic_cache import SemanticAnswerCache
+
+                    self._semantic_cache = SemanticAnswerCache(
+                        threshold=settings.semantic_cache_threshold,
+                        max_entries=settings.semantic_cache_max_entries,
+                        ttl_s=settings.semantic_cache_ttl_s,
+                    )
+        return self._semantic_cache
+
+    @property
+    def llm(self) -> LLMClient:
+        # Not built during warm-up: a missing API key must not prevent ingestion-only use.
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    from app.llms.gemini import GeminiClient
+
+                    self._llm = GeminiClient()
+        return self._llm
+
+    async def aclose(self) -> None:
+        if self._ingest_queue is not None:
+            self._ingest_queue.stop(timeout=5.0)
+        if self._reembedder is not None:
+            self._reembedder.stop(timeout=5.0)
+        if self._batcher is not None:
+            await self._batcher.aclose()
+        if self._retriever is not None:
+            self._retriever.close()
+
+    def warmup(self) -> None:
+        """Load the embedding (and re-ranking) model and open the vector store before serving traffic."""
+        from app.embeddings.hf_dense import HuggingFaceDenseEmbedder
+
+        try:
+            # Bypass the embedding cache so the model itself is loaded and exercised.
+            HuggingFaceDenseEmbedder(use_cache=False).embed_texts(["warmup"])
+            if self.retriever.reranker is not None:
+                self.retriever.reranker.warmup()
+        except Exception:  # noqa: BLE001
+            logger.exception("service warm-up failed; clients will be created on first use")
@@ -21,16 +21,160 @@ class Settings(BaseSettings):
     data_dir: Path = backend_root / "data"
     sqlite_path: Path = data_dir / "app.db"
     chroma_dir: Path = data_dir / "chroma"
+    numpy_store_dir: Path = data_dir / "vectors"
     kb_files_dir: Path = data_dir / "kb"
+    blob_dir: Path = data_dir / "blobs"
+
+    # Reuse an already-ingested document when the same file (same sha256) is uploaded again
+    upload_dedup: bool = True
+
+    # Load the embedding model and open the vector store at startup instead of on first request
+    service_warmup: bool = True
 
     # Embeddings (local HF)
     embedding_model: str = "antoinelouis/colbert-xm"
     embedding_device: str = "cpu"
     embedding_max_length: int = 256
+    # Inputs are length-sorted and batched until either limit is hit (tokens = rows * longest row).
+    embedding_batch_size: int = 32
+    embedding_token_budget: int = 8192
+
+    # Persistent embedding cache keyed by (model, max_length, text digest)
+    embedding_cache_enabled: bool = True
+    embedding_cache_path: Path = data_dir / "embedding_cache.db"
+    embedding_cache_max_bytes: int = 1024 * 1024 * 1024
+    embedding_cache_memory_items: int = 20000
+
+    # Concurrent /query question embeddings are coalesced into one forward pass
+    query_embed_max_batch: int = 16
+    query_embed_max_wait_ms: float = 5.0
+    # Dedicated embedding threads (batches in flight) and queued questions before callers wait
+    query_embed_threads: int = 1
+    query_embed_max_queue: int = 256
+    # Vector/BM25 search threads for /query, separate from the request threadpool
+    query_retrieval_threads: int = 8
+    # /query stage deadlines (504 when exceeded); the Gemini call is bounded by gemini_timeout_s
+    query_embed_timeout_s: float = 10.0
+    query_retrieve_timeout_s: float = 10.0
+
+    # Ingestion queue (worker threads in the API process; 0 disables processing)
+    ingest_workers: int = 2
+    ingest_lease_s: float = 120.0
+    ingest_poll_interval_s: float = 2.0
+    ingest_max_attempts: int = 3
+    ingest_stats_window_s: float = 300.0
+    # Bulk ingest: documents per worker claim, chunks per embed/upsert window
+    ingest_bulk_max_docs: int = 64
+    ingest_embed_window: int = 512
+    # Raw files larger than this are extracted, chunked and indexed as a stream
+    ingest_stream_threshold_bytes: int = 16 * 1024 * 1024
+
+    # Re-embedding a KB with another model (POST /kbs/{kb_id}/reembed) from its stored chunks into a
+    # shadow collection; the KB keeps serving its current model until the switch. With reembed_auto,
+    # KBs on a model other than embedding_model are queued at startup.
+    reembed_auto: bool = True
+    reembed_poll_interval_s: float = 5.0
+    # A running job whose heartbeat is older than this is requeued; its worker heartbeats after every
+    # step and every reembed_lease_s / 4 while it waits.
+    reembed_lease_s: float = 60.0
+    # Models POST /reembed may switch a KB to besides embedding_model (a JSON list in the env); each
+    # is loaded with from_pretrained, i.e. downloaded from the Hub on first use.
+    reembed_allowed_models: list[str] = []
+    # Chunks read (and written to the shadow collection) per page, and embedded per throttled step
+    reembed_page_size: int = 1024
+    reembed_step_size: int = 32
+    # Live queries first: before each step, wait until the query embedder has been idle this long
+    # (for at most reembed_max_yield_s), then sleep to keep the job under this share of wall time.
+    reembed_query_idle_ms: float = 200.0
+    reembed_max_yield_s: float = 5.0
+    reembed_duty_cycle: float = 0.5
+    # The replaced collection is kept this long after the switch for searches still using it
+    reembed_drop_grace_s: float = 60.0
+
+    # Extraction: "inline" (threads in the ingesting process) or "process" (shared process pool)
+    extract_mode: str = "inline"
+    extract_workers: int = 4
+    extract_timeout_s: float = 300.0
+    # PDFs with more pages than this are split into page ranges extracted in parallel
+    extract_pdf_pages_per_task: int = 32
+
+    # Vector store backend: "chroma" or "numpy" (in-process, memory-mapped segments)
+    vector_store: str = "chroma"
+    # Chroma: pre-filtered candidate sets up to this size are scored exactly from their fetched
+    # vectors; larger ones are passed to the HNSW query as a chunk_id $in filter.
+    chroma_exact_max_ids: int = 5000
+    # Stored precision: float32|float16|int8 (per-dimension scales)|binary (sign bits, Hamming-estimated)
+    numpy_store_dtype: str = "float32"
+    # Lossy dtypes: re-score top_k * N candidates against a float32 copy kept on disk (0: no copy, no re-scoring)
+    numpy_store_rescore: int = 4
+    # Segments are merged in the background past this count or this share of deleted rows
+    numpy_store_max_segments: int = 8
+    numpy_store_compact_dead_ratio: float = 0.25
+    # "flat" (exact) or "ivf" (k-means inverted lists, trained during compaction). KBs and filtered
+    # candidate sets up to ivf_min_rows rows are always searched exactly; ivf_nlist=0 picks ~4*sqrt(rows).
+    numpy_store_index: str = "flat"
+    ivf_nlist: int = 0
+    ivf_nprobe: int = 8
+    ivf_min_rows: int = 20000
 
     # Retrieval
     rag_top_k: int = 6
-    rag_max_context_chars: int = 12000
+    rag_max_context_chars: int = 12000  # only used with rag_packing=false
+    # Context packing: over-fetch top_k * rag_pack_overfetch candidates, drop near-duplicates and
+    # diversify with MMR, merge overlapping neighbours, then fit the best subset into the token budget.
+    rag_packing: bool = True
+    rag_pack_overfetch: int = 4
+    rag_pack_mmr_lambda: float = 0.7
+    rag_pack_dedup_threshold: float = 0.95
+    rag_context_token_budget: int = 3000
+    rag_chars_per_token: float = 4.0
+    # Optional cross-encoder re-ranking of the top rerank_candidates hits (after BM25 fusion, before
+    # packing). Past rerank_budget_ms per query, the remaining candidates keep their retrieval order.
+    rerank_enabled: bool = False
+    rerank_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    rerank_device: str = "cpu"
+    rerank_candidates: int = 30
+    rerank_batch_size: int = 16
+    rerank_max_length: int = 384
+    rerank_budget_ms: float = 150.0
+    # Scores per (question digest, chunk id)
+    rerank_cache_items: int = 50000
+    rerank_cache_ttl_s: float = 3600.0
+    # Hybrid retrieval: BM25 (SQLite FTS5) fused with dense hits; weight 0 disables lexical search
+    rag_hybrid_lexical_weight: float = 0.3
+    rag_hybrid_candidates: int = 30
+    rag_rrf_k: int = 60
+    # Resolve `filters` to candidate chunk ids in SQLite (app.db.filters) before the vector search:
+    # "auto" only for filters on keys the vector store does not carry (tags), "always", or "off".
+    # BM25 search applies filters in SQLite unless "off"; clauses it cannot express are left to the
+    # vector store and disable BM25 fusion.
+    rag_filter_prefilter: str = "auto"
+    # Federated /kbs/query: caps on KBs and questions (main + sub-questions) per request
+    federated_max_kbs: int = 8
+    federated_max_questions: int = 4
+
+    # /query cache: contexts per (KB version, normalized question, top_k, filters); optionally
+    # Gemini answers per prompt hash. Entries expire after the TTL or are evicted LRU.
+    query_cache_enabled: bool = True
+    query_cache_max_items: int = 2048
+    query_cache_ttl_s: float = 600.0
+    query_answer_cache_enabled: bool = False
+    # Semantic answer cache: reuse the answer of a past question whose embedding has cosine
+    # similarity >= threshold, for the same KB version, model, top_k and filters.
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.92
+    semantic_cache_max_entries: int = 1024  # per KB
+    semantic_cache_ttl_s: float = 3600.0
+
+    # Late interaction (ColBERT MaxSim) re-ranking over per-token embeddings
+    retrieval_mode: str = "dense"  # dense|late_interaction
+    late_interaction_dir: Path = data_dir / "late_interaction"
+    late_interaction_dim: int = 128
+    late_interaction_dtype: str = "float16"  # float16|int8
+    late_interaction_candidates: int = 100
+    late_interaction_max_segments: int = 16
+    # Per-token embeddings of recent questions kept in memory (they bypass the query micro-batcher)
+    late_interaction_query_cache_items: int = 256
 
     # Gemini
     gemini_api_key: str | None = None
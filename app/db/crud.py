@@ -1,8 +1,15 @@
 from __future__ import annotations
 
+from datetime import datetime, timedelta
+from typing import Any
+from uuid import uuid4
+
+from sqlalchemy import and_, delete, func, literal_column, or_, update
 from sqlmodel import Session, select
 
-from app.db.models import Chunk, Document, IngestionJob, KnowledgeBase
+from app.core.settings import settings
+from app.db import filters, fts
+from app.db.models import Blob, Chunk, Document, EmbeddingRecord, IngestionJob, KnowledgeBase, ReembedJob, utcnow
 
 
 def create_kb(session: Session, *, name: str, description: str | None) -> KnowledgeBase:
@@ -21,14 +28,45 @@ def get_kb(session: Session, kb_id: str) -> KnowledgeBase | None:
     return session.get(KnowledgeBase, kb_id)
 
 
+def bump_kb_version(session: Session, kb_id: str) -> None:
+    """Mark the KB's searchable content as changed; committed with the caller's transaction."""
+    session.execute(
+        update(KnowledgeBase).where(KnowledgeBase.id == kb_id).values(version=func.coalesce(KnowledgeBase.version, 0) + 1)
+    )
+
+
+def kb_embedding_model(session: Session, kb_id: str) -> str:
+    """Model the KB's serving vectors were built with (the configured one until its first chunk is embedded)."""
+    # Read the column rather than a possibly stale KnowledgeBase from the session's identity map.
+    model = session.exec(select(KnowledgeBase.embedding_model).where(KnowledgeBase.id == kb_id)).first()
+    return model or settings.embedding_model
+
+
+def record_kb_embedding_model(session: Session, kb_id: str, model: str) -> None:
+    """Fix the KB's model on its first embedded chunk; committed with the caller's transaction."""
+    session.execute(
+        update(KnowledgeBase)
+        .where(KnowledgeBase.id == kb_id, KnowledgeBase.embedding_model.is_(None))
+        .values(embedding_model=model)
+    )
+
+
 def create_document(
     session: Session,
     *,
     kb_id: str,
     original_filename: str,
     content_type: str | None,
+    content_hash: str | None = None,
+    tags: list[str] | None = None,
 ) -> Document:
-    doc = Document(kb_id=kb_id, original_filename=original_filename, content_type=content_type)
+    doc = Document(
+        kb_id=kb_id,
+        original_filename=original_filename,
+        content_type=content_type,
+        content_hash=content_hash,
+        tags=normalize_tags(tags or []),
+    )
     session.add(doc)
     session.commit()
     session.refresh(doc)
@@ -39,23 +77,223 @@ def get_document(session: Session, doc_id: str) -> Document | None:
     return session.get(Document, doc_id)
 
 
+def set_document_tags(session: Session, doc: Document, tags: list[str]) -> Document:
+    """Replace a document's tags, re-index them on its chunks and invalidate the KB's query caches."""
+    doc.tags = normalize_tags(tags)
+    session.add(doc)
+    filters.set_document_tags(session, kb_id=doc.kb_id, doc_id=doc.id, tags=doc.tags)
+    bump_kb_version(session, doc.kb_id)
+    session.commit()
+    session.refresh(doc)
+    return doc
+
+
+def normalize_tags(tags: list[str]) -> list[str]:
+    return list(dict.fromkeys(t.strip() for t in tags if t and t.strip()))
+
+
+def record_blob(session: Session, *, sha256: str, size: int) -> Blob:
+    blob = session.get(Blob, sha256)
+    if blob is None:
+        blob = Blob(sha256=sha256, size=size)
+        session.add(blob)
+        session.commit()
+    return blob
+
+
+def find_ready_document_by_hash(
+    session: Session,
+    *,
+    content_hash: str,
+    embedding_model: str,
+    prefer_kb_id: str | None = None,
+) -> Document | None:
+    """A `ready` document with these raw bytes whose served vectors were built with `embedding_model`."""
+    embedded = (
+        select(Chunk.id)
+        .join(EmbeddingRecord, EmbeddingRecord.chunk_id == Chunk.id)
+        .where(Chunk.doc_id == Document.id, EmbeddingRecord.embedding_model == embedding_model)
+        .exists()
+    )
+    # A KB being re-embedded has records for the new model before its collection serves them.
+    serving = select(KnowledgeBase.id).where(KnowledgeBase.embedding_model == embedding_model)
+    stmt = select(Document).where(
+        Document.content_hash == content_hash, Document.status == "ready", Document.kb_id.in_(serving), embedded
+    )
+    if prefer_kb_id:
+        stmt = stmt.order_by((Document.kb_id == prefer_kb_id).desc(), Document.created_at)
+    return session.exec(stmt.limit(1)).first()
+
+
+def list_chunks_for_doc(session: Session, doc_id: str) -> list[Chunk]:
+    stmt = select(Chunk).where(Chunk.doc_id == doc_id).order_by(Chunk.chunk_index)
+    return list(session.exec(stmt))
+
+
+def get_chunk_offsets(session: Session, chunk_ids: list[str]) -> dict[str, tuple[int | None, int | None]]:
+    """(start_offset, end_offset) per chunk id; unknown ids are absent."""
+    out: dict[str, tuple[int | None, int | None]] = {}
+    for i in range(0, len(chunk_ids), 500):
+        stmt = select(Chunk.id, Chunk.start_offset, Chunk.end_offset).where(Chunk.id.in_(chunk_ids[i : i + 500]))
+        out.update({cid: (start, end) for cid, start, end in session.exec(stmt)})
+    return out
+
+
 def list_documents_for_kb(session: Session, kb_id: str) -> list[Document]:
     stmt = select(Document).where(Document.kb_id == kb_id).order_by(Document.created_at.desc())
     return list(session.exec(stmt))
 
 
-def create_ingestion_job(session: Session, *, kb_id: str, doc_id: str) -> IngestionJob:
-    job = IngestionJob(kb_id=kb_id, doc_id=doc_id)
+def create_ingestion_job(session: Session, *, kb_id: str, doc_id: str, priority: int = 0) -> IngestionJob:
+    job = IngestionJob(kb_id=kb_id, doc_id=doc_id, priority=priority)
     session.add(job)
     session.commit()
     session.refresh(job)
     return job
 
 
+def create_ingestion_batch(session: Session, *, kb_id: str, doc_ids: list[str], priority: int = 0) -> list[IngestionJob]:
+    batch_id = str(uuid4())
+    jobs = [IngestionJob(kb_id=kb_id, doc_id=d, priority=priority, batch_id=batch_id) for d in doc_ids]
+    session.add_all(jobs)
+    session.commit()
+    for j in jobs:
+        session.refresh(j)
+    return jobs
+
+
+def list_documents_by_status(session: Session, kb_id: str, status: str) -> list[Document]:
+    stmt = select(Document).where(Document.kb_id == kb_id, Document.status == status).order_by(Document.created_at)
+    return list(session.exec(stmt))
+
+
 def get_job(session: Session, job_id: str) -> IngestionJob | None:
     return session.get(IngestionJob, job_id)
 
 
+def claim_next_job(session: Session, *, worker_id: str, lease_s: float) -> IngestionJob | None:
+    """Atomically move the highest-priority queued job to `running` under a lease for `worker_id`."""
+    stmt = (
+        select(IngestionJob.id)
+        .where(IngestionJob.state == "queued")
+        .order_by(IngestionJob.priority.desc(), IngestionJob.created_at)
+        .limit(1)
+    )
+    job_id = session.exec(stmt).first()
+    if job_id is None:
+        return None
+
+    now = utcnow()
+    res = session.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id == job_id, IngestionJob.state == "queued")
+        .values(
+            state="running",
+            worker_id=worker_id,
+            attempts=IngestionJob.attempts + 1,
+            started_at=now,
+            heartbeat_at=now,
+            lease_expires_at=now + timedelta(seconds=lease_s),
+            error=None,
+        )
+    )
+    session.commit()
+    if res.rowcount != 1:
+        # Another worker (possibly in another process) claimed it first.
+        return None
+    return session.get(IngestionJob, job_id)
+
+
+def claim_batch_jobs(
+    session: Session,
+    *,
+    batch_id: str,
+    worker_id: str,
+    lease_s: float,
+    limit: int,
+) -> list[IngestionJob]:
+    """Claim up to `limit` further queued jobs of a bulk batch for the worker that claimed one of them."""
+    if limit <= 0:
+        return []
+    stmt = (
+        select(IngestionJob.id)
+        .where(IngestionJob.batch_id == batch_id, IngestionJob.state == "queued")
+        .order_by(IngestionJob.created_at)
+        .limit(limit)
+    )
+    ids = list(session.exec(stmt))
+    if not ids:
+        return []
+
+    now = utcnow()
+    session.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id.in_(ids), IngestionJob.state == "queued")
+        .values(
+            state="running",
+            worker_id=worker_id,
+            attempts=IngestionJob.attempts + 1,
+            started_at=now,
+            heartbeat_at=now,
+            lease_expires_at=now + timedelta(seconds=lease_s),
+            error=None,
+        )
+    )
+    session.commit()
+    claimed = select(IngestionJob).where(
+        IngestionJob.id.in_(ids), IngestionJob.state == "running", IngestionJob.worker_id == worker_id
+    )
+    return list(session.exec(claimed))
+
+
+def extend_job_leases(session: Session, *, job_ids: list[str], worker_id: str, lease_s: float) -> None:
+    if not job_ids:
+        return
+    now = utcnow()
+    session.execute(
+        update(IngestionJob)
+        .where(IngestionJob.id.in_(job_ids), IngestionJob.worker_id == worker_id, IngestionJob.state == "running")
+        .values(heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease_s))
+    )
+    session.commit()
+
+
+def requeue_expired_jobs(session: Session, *, max_attempts: int) -> int:
+    """Requeue `running` jobs whose lease lapsed; jobs out of attempts are failed instead."""
+    now = utcnow()
+    # Jobs left `running` by builds without leases have no expiry and count as orphaned.
+    expired = or_(IngestionJob.lease_expires_at.is_(None), IngestionJob.lease_expires_at < now)
+    failed = session.execute(
+        update(IngestionJob)
+        .where(IngestionJob.state == "running", expired, IngestionJob.attempts >= max_attempts)
+        .values(state="failed", error="lease expired (worker lost)", finished_at=now, worker_id=None)
+    )
+    requeued = session.execute(
+        update(IngestionJob)
+        .where(IngestionJob.state == "running", expired)
+        .values(state="queued", worker_id=None, lease_expires_at=None)
+    )
+    session.commit()
+    return int(requeued.rowcount or 0) + int(failed.rowcount or 0)
+
+
+def job_queue_stats(session: Session, *, window_s: float) -> dict[str, Any]:
+    by_state = dict(session.exec(select(IngestionJob.state, func.count()).group_by(IngestionJob.state)).all())
+    since = utcnow() - timedelta(seconds=window_s)
+    finished = session.exec(
+        select(func.count()).where(IngestionJob.state == "succeeded", IngestionJob.finished_at >= since)
+    ).one()
+    return {
+        "queued": int(by_state.get("queued", 0)),
+        "running": int(by_state.get("running", 0)),
+        "succeeded": int(by_state.get("succeeded", 0)),
+        "failed": int(by_state.get("failed", 0)),
+        "window_s": window_s,
+        "succeeded_in_window": int(finished),
+        "jobs_per_min": float(finished) * 60.0 / window_s if window_s else 0.0,
+    }
+
+
 def upsert_chunk(session: Session, chunk: Chunk) -> Chunk:
     session.add(chunk)
     session.commit()
@@ -63,3 +301,237 @@ def upsert_chunk(session: Session, chunk: Chunk) -> Chunk:
     return chunk
 
 
+def list_chunk_states(session: Session, doc_id: str, embedding_model: str) -> list[tuple[Chunk, str | None]]:
+    """Chunks of a document with `embedding_model` if a vector was built with it, else None."""
+    stmt = (
+        select(Chunk, EmbeddingRecord.embedding_model)
+        .join(
+            EmbeddingRecord,
+            (EmbeddingRecord.chunk_id == Chunk.id) & (EmbeddingRecord.embedding_model == embedding_model),
+            isouter=True,
+        )
+        .where(Chunk.doc_id == doc_id)
+        .order_by(Chunk.chunk_index)
+    )
+    return list(session.exec(stmt))
+
+
+def update_chunk_positions(session: Session, rows: list[dict[str, Any]]) -> None:
+    """Bulk-update chunk_index/offsets of existing chunks; each dict carries the chunk `id`."""
+    if rows:
+        session.execute(update(Chunk), rows)
+
+
+def delete_chunks(session: Session, chunk_ids: list[str]) -> None:
+    for i in range(0, len(chunk_ids), 500):
+        part = chunk_ids[i : i + 500]
+        session.execute(delete(EmbeddingRecord).where(EmbeddingRecord.chunk_id.in_(part)))
+        # Before the rows go: the external-content FTS index reads their rowid and text.
+        fts.delete_chunks(session, part)
+        session.execute(delete(Chunk).where(Chunk.id.in_(part)))
+        filters.delete_chunks(session, part)
+
+
+def create_reembed_job(session: Session, kb: KnowledgeBase, *, target_model: str) -> ReembedJob:
+    """Queue a re-embedding of `kb`; the caller makes sure none is queued or running."""
+    source_model = kb.embedding_model or settings.embedding_model
+    # A fresh generation, so a shadow collection left by a failed job is never written into again,
+    # and no records from one: the job skips chunks that already have a `target_model` record.
+    last = session.exec(select(func.max(ReembedJob.generation)).where(ReembedJob.kb_id == kb.id)).one()
+    delete_embedding_records(session, kb_id=kb.id, model=source_model, keep=True)
+    job = ReembedJob(
+        kb_id=kb.id,
+        source_model=source_model,
+        target_model=target_model,
+        generation=max(kb.index_generation or 0, last or 0) + 1,
+    )
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+
+def get_reembed_job(session: Session, job_id: str) -> ReembedJob | None:
+    return session.get(ReembedJob, job_id)
+
+
+def list_reembed_jobs(session: Session, kb_id: str) -> list[ReembedJob]:
+    stmt = select(ReembedJob).where(ReembedJob.kb_id == kb_id).order_by(ReembedJob.created_at.desc())
+    return list(session.exec(stmt))
+
+
+def active_reembed_job(session: Session, kb_id: str) -> ReembedJob | None:
+    stmt = select(ReembedJob).where(ReembedJob.kb_id == kb_id, ReembedJob.state.in_(["queued", "running"]))
+    return session.exec(stmt.limit(1)).first()
+
+
+def queue_model_migrations(session: Session, *, model: str) -> list[ReembedJob]:
+    """Queue a re-embedding to `model` for every KB serving another model that has none queued or running."""
+    busy = select(ReembedJob.kb_id).where(ReembedJob.state.in_(["queued", "running"]))
+    stmt = select(KnowledgeBase).where(
+        KnowledgeBase.embedding_model.is_not(None),
+        KnowledgeBase.embedding_model != model,
+        KnowledgeBase.id.not_in(busy),
+    )
+    return [create_reembed_job(session, kb, target_model=model) for kb in list(session.exec(stmt))]
+
+
+def claim_reembed_job(session: Session, *, worker_id: str, stale_s: float) -> ReembedJob | None:
+    """Move the oldest queued re-embedding to `running`; running ones without a recent heartbeat are requeued first."""
+    now = utcnow()
+    session.execute(
+        update(ReembedJob)
+        .where(
+            ReembedJob.state == "running",
+            or_(ReembedJob.heartbeat_at.is_(None), ReembedJob.heartbeat_at < now - timedelta(seconds=stale_s)),
+        )
+        .values(state="queued", worker_id=None)
+    )
+    session.commit()
+    job_id = session.exec(
+        select(ReembedJob.id).where(ReembedJob.state == "queued").order_by(ReembedJob.created_at).limit(1)
+    ).first()
+    if job_id is None:
+        return None
+    res = session.execute(
+        update(ReembedJob)
+        .where(ReembedJob.id == job_id, ReembedJob.state == "queued")
+        .values(
+            state="running",
+            worker_id=worker_id,
+            heartbeat_at=now,
+            started_at=func.coalesce(ReembedJob.started_at, now),
+            error=None,
+        )
+    )
+    session.commit()
+    if res.rowcount != 1:
+        return None
+    return session.get(ReembedJob, job_id)
+
+
+def update_reembed_job(session: Session, job_id: str, *, claimed_by: str, **values: Any) -> bool:
+    """
+    Update a running job still claimed by worker `claimed_by`; False once it was cancelled or requeued
+    (the worker must then let go of it). Committed with the caller's transaction.
+    """
+    res = session.execute(
+        update(ReembedJob)
+        .where(ReembedJob.id == job_id, ReembedJob.state == "running", ReembedJob.worker_id == claimed_by)
+        .values(**values)
+    )
+    return res.rowcount == 1
+
+
+def cancel_reembed_job(session: Session, job_id: str) -> bool:
+    res = session.execute(
+        update(ReembedJob)
+        .where(ReembedJob.id == job_id, ReembedJob.state.in_(["queued", "running"]))
+        .values(state="cancelled", finished_at=utcnow())
+    )
+    session.commit()
+    return res.rowcount == 1
+
+
+def kb_index_route(session: Session, kb_id: str) -> tuple[int, int | None, str]:
+    """(serving generation, generation being built or None, serving model) of a KB's vector collections."""
+    kb = session.get(KnowledgeBase, kb_id)
+    shadow = session.exec(
+        select(ReembedJob.generation).where(ReembedJob.kb_id == kb_id, ReembedJob.state == "running").limit(1)
+    ).first()
+    if kb is None:
+        return 0, shadow, settings.embedding_model
+    return kb.index_generation or 0, shadow, kb.embedding_model or settings.embedding_model
+
+
+def generation_model(session: Session, kb_id: str, generation: int) -> str:
+    """Embedding model of one generation of a KB's vectors: the serving model, or the target of the job building it."""
+    kb = session.get(KnowledgeBase, kb_id)
+    serving_model = (kb.embedding_model if kb is not None else None) or settings.embedding_model
+    if kb is None or generation == (kb.index_generation or 0):
+        return serving_model
+    target = session.exec(
+        select(ReembedJob.target_model).where(ReembedJob.kb_id == kb_id, ReembedJob.generation == generation).limit(1)
+    ).first()
+    return target or serving_model
+
+
+def count_chunks(session: Session, kb_id: str) -> int:
+    return int(session.exec(select(func.count()).select_from(Chunk).where(Chunk.kb_id == kb_id)).one())
+
+
+def list_chunks_to_reembed(
+    session: Session, *, kb_id: str, model: str, after_rowid: int, limit: int
+) -> list[tuple[int, str, str]]:
+    """
+    (rowid, chunk id, text) of the KB's chunks without a `model` vector, in insertion (rowid)
+    order after `after_rowid`, so chunks ingested meanwhile are reached by later pages.
+    """
+    rowid = literal_column("chunk.rowid")
+    has_vector = (
+        select(EmbeddingRecord.id)
+        .where(EmbeddingRecord.chunk_id == Chunk.id, EmbeddingRecord.embedding_model == model)
+        .exists()
+    )
+    stmt = (
+        select(rowid, Chunk.id, Chunk.text)
+        .where(Chunk.kb_id == kb_id, rowid > after_rowid, ~has_vector)
+        .order_by(rowid)
+        .limit(limit)
+    )
+    return [(int(r), cid, t) for r, cid, t in session.exec(stmt)]
+
+
+def chunk_vector_rows(session: Session, chunk_ids: list[str]) -> dict[str, tuple[Chunk, str]]:
+    """Existing chunks by id, with their document's filename (the vector metadata fallback source name)."""
+    out: dict[str, tuple[Chunk, str]] = {}
+    for i in range(0, len(chunk_ids), 500):
+        stmt = (
+            select(Chunk, Document.original_filename)
+            .join(Document, Document.id == Chunk.doc_id)
+            .where(Chunk.id.in_(chunk_ids[i : i + 500]))
+        )
+        out.update({c.id: (c, name) for c, name in session.exec(stmt)})
+    return out
+
+
+def delete_embedding_records(session: Session, *, kb_id: str, model: str, keep: bool = False) -> None:
+    """Drop the KB's embedding records of `model` (of every other model with `keep`); committed by the caller."""
+    same = EmbeddingRecord.embedding_model == model
+    session.execute(
+        delete(EmbeddingRecord).where(
+            EmbeddingRecord.chunk_id.in_(select(Chunk.id).where(Chunk.kb_id == kb_id)), ~same if keep else same
+        )
+    )
+
+
+def switch_kb_index(session: Session, *, kb_id: str, model: str, generation: int) -> None:
+    """Serve the KB from `generation`, built with `model`; committed with the caller's transaction."""
+    session.execute(
+        update(KnowledgeBase)
+        .where(KnowledgeBase.id == kb_id)
+        .values(embedding_model=model, index_generation=generation)
+    )
+    delete_embedding_records(session, kb_id=kb_id, model=model, keep=True)
+    # Cached contexts and semantic-cache question vectors are from the old model.
+    bump_kb_version(session, kb_id)
+
+
+def list_retirable_reembed_jobs(session: Session, *, switched_before: datetime) -> list[ReembedJob]:
+    """
+    Re-embeddings whose unused collection is not dropped yet: the replaced one once past its
+    grace period after a switch, or the shadow of a cancelled or failed job.
+    """
+    stmt = select(ReembedJob).where(
+        ReembedJob.retired_at.is_(None),
+        or_(
+            and_(ReembedJob.state == "succeeded", ReembedJob.switched_at < switched_before),
+            ReembedJob.state.in_(["cancelled", "failed"]),
+        ),
+    )
+    return list(session.exec(stmt.order_by(ReembedJob.created_at)))
+
+
+def reembed_job_stats(session: Session) -> dict[str, int]:
+    by_state = dict(session.exec(select(ReembedJob.state, func.count()).group_by(ReembedJob.state)).all())
+    return {state: int(by_state.get(state, 0)) for state in ("queued", "running", "succeeded", "failed", "cancelled")}
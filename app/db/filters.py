@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from sqlalchemy import Engine, text
+from sqlmodel import Session
+
+from app.db.models import Chunk
+
+# One row per (chunk, metadata key, value): scalar chunk metadata (source_name, source_type,
+# page_start, page_end, ...) plus one row per tag of the chunk's document. Kept in sync by the
+# ingestion pipeline so `where` filters resolve to chunk ids with index lookups, not scans.
+_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS chunk_attr (
+        chunk_id TEXT NOT NULL,
+        kb_id TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value_text TEXT,
+        value_num REAL
+    )
+    """,
+    # chunk_id is the last column so lookups never touch the table itself.
+    "CREATE INDEX IF NOT EXISTS ix_chunk_attr_text ON chunk_attr (kb_id, key, value_text, chunk_id)",
+    "CREATE INDEX IF NOT EXISTS ix_chunk_attr_num ON chunk_attr (kb_id, key, value_num, chunk_id)",
+    "CREATE INDEX IF NOT EXISTS ix_chunk_attr_chunk ON chunk_attr (chunk_id)",
+]
+
+# Keys answered from indexed `chunk` columns rather than chunk_attr.
+_COLUMNS = {"kb_id": "kb_id", "doc_id": "doc_id", "chunk_id": "id", "chunk_index": "chunk_index"}
+_ALL = "SELECT id FROM chunk WHERE kb_id = :kb_id"
+_NONE = "SELECT id FROM chunk WHERE 0"
+_COMPARE = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+_BACKFILL = [
+    """
+    INSERT INTO chunk_attr (chunk_id, kb_id, key, value_text, value_num)
+    SELECT c.id, c.kb_id, j.key,
+           CASE WHEN j.type = 'text' THEN j.value END,
+           CASE WHEN j.type IN ('integer', 'real', 'true', 'false') THEN j.value END
+    FROM chunk AS c, json_each(c.meta) AS j
+    WHERE j.type IN ('text', 'integer', 'real', 'true', 'false')
+      AND j.key NOT IN ('kb_id', 'doc_id', 'chunk_id', 'chunk_index', 'tags')
+    """,
+    """
+    INSERT INTO chunk_attr (chunk_id, kb_id, key, value_text, value_num)
+    SELECT c.id, c.kb_id, 'tags', t.value, NULL
+    FROM chunk AS c JOIN document AS d ON d.id = c.doc_id, json_each(d.tags) AS t
+    WHERE d.tags IS NOT NULL AND t.type = 'text'
+    """,
+]
+
+
+class UnsupportedFilter(ValueError):
+    """A `where` clause the SQLite pre-filter cannot express; the vector store evaluates it instead."""
+
+
+def init_filters(engine: Engine) -> None:
+    with engine.begin() as conn:
+        existed = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'chunk_attr'")).first() is not None
+        for ddl in _DDL:
+            conn.execute(text(ddl))
+        if not existed:
+            # Backfill chunks ingested before the filter index existed.
+            for sql in _BACKFILL:
+                conn.execute(text(sql))
+
+
+def index_chunks(session: Session, rows: list[Chunk]) -> None:
+    if not rows:
+        return
+    doc_ids = list({r.doc_id for r in rows})
+    tags: dict[str, list[str]] = {}
+    for i in range(0, len(doc_ids), 500):
+        part = doc_ids[i : i + 500]
+        binds = ", ".join(f":d{j}" for j in range(len(part)))
+        found = session.execute(
+            text(f"SELECT id, tags FROM document WHERE id IN ({binds})"), {f"d{j}": d for j, d in enumerate(part)}
+        )
+        tags.update({doc_id: _load_tags(raw) for doc_id, raw in found})
+
+    values = []
+    for r in rows:
+        for key, value in (r.meta or {}).items():
+            if key in _COLUMNS or key == "tags":
+                continue
+            cols = _value_columns(value)
+            if cols is not None:
+                values.append({"chunk_id": r.id, "kb_id": r.kb_id, "key": key, "text": cols[0], "num": cols[1]})
+        for tag in tags.get(r.doc_id, []):
+            values.append({"chunk_id": r.id, "kb_id": r.kb_id, "key": "tags", "text": tag, "num": None})
+    if values:
+        session.execute(
+            text(
+                "INSERT INTO chunk_attr (chunk_id, kb_id, key, value_text, value_num) "
+                "VALUES (:chunk_id, :kb_id, :key, :text, :num)"
+            ),
+            values,
+        )
+
+
+def delete_chunks(session: Session, chunk_ids: list[str]) -> None:
+    if chunk_ids:
+        session.execute(text("DELETE FROM chunk_attr WHERE chunk_id = :chunk_id"), [{"chunk_id": c} for c in chunk_ids])
+
+
+def set_document_tags(session: Session, *, kb_id: str, doc_id: str, tags: list[str]) -> None:
+    """Replace the `tags` rows of every chunk of `doc_id`."""
+    session.execute(
+        text("DELETE FROM chunk_attr WHERE key = 'tags' AND chunk_id IN (SELECT id FROM chunk WHERE doc_id = :doc_id)"),
+        {"doc_id": doc_id},
+    )
+    for tag in tags:
+        session.execute(
+            text(
+                "INSERT INTO chunk_attr (chunk_id, kb_id, key, value_text, value_num) "
+                "SELECT id, :kb_id, 'tags', :tag, NULL FROM chunk WHERE doc_id = :doc_id"
+            ),
+            {"kb_id": kb_id, "tag": tag, "doc_id": doc_id},
+        )
+
+
+def compile_where(where: dict[str, Any]) -> tuple[str, dict[str, Any]]:
+    """
+    Translate a Chroma-style `where` ($and/$or, $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte) into a
+    SELECT of matching chunk ids (column `id`), with bind parameters; the caller binds `:kb_id`.
+
+    Each field clause is an index-only lookup in chunk_attr (or an indexed `chunk` column), and
+    $and/$or/$ne become INTERSECT/UNION/EXCEPT over those id sets, so the cost follows the
+    number of matching rows rather than the size of the KB. As in the vector stores,
+    `$ne`/`$nin` only match chunks that have the key; a multi-valued key (`tags`) matches
+    `$eq` when any value does, and `$ne` when none does.
+    """
+    params: dict[str, Any] = {}
+
+    def bind(value: Any) -> str:
+        name = f"w{len(params)}"
+        params[name] = value
+        return f":{name}"
+
+    def combine(op: str, sets: list[str]) -> str:
+        # SQLite does not allow parenthesized compound operands; wrap each one as a subquery.
+        return f" {op} ".join(f"SELECT id FROM ({q})" for q in sets)
+
+    def clause(w: dict[str, Any]) -> str:
+        if not isinstance(w, dict):
+            raise UnsupportedFilter(f"filter must be an object, got {type(w).__name__}")
+        sets = []
+        for key, cond in w.items():
+            if key in {"$and", "$or"}:
+                subs = [clause(sub) for sub in cond]
+                if not subs:
+                    sets.append(_ALL if key == "$and" else _NONE)
+                else:
+                    sets.append(combine("INTERSECT" if key == "$and" else "UNION", subs))
+            elif key.startswith("$"):
+                raise UnsupportedFilter(f"unsupported filter operator: {key}")
+            else:
+                ops = cond if isinstance(cond, dict) else {"$eq": cond}
+                sets.extend(field(key, op, value) for op, value in ops.items())
+        if not sets:
+            return _ALL
+        return sets[0] if len(sets) == 1 else combine("INTERSECT", sets)
+
+    def field(key: str, op: str, value: Any) -> str:
+        if op in {"$in", "$nin"}:
+            values = list(value)
+        elif op in _COMPARE:
+            values = [value]
+        else:
+            raise UnsupportedFilter(f"unsupported filter operator: {op}")
+        if op in {"$gt", "$gte", "$lt", "$lte"} and not _is_number(value):
+            raise UnsupportedFilter(f"{op} filter on '{key}' requires a numeric value")
+
+        column = _COLUMNS.get(key)
+        if column is not None:
+            if op in {"$in", "$nin"}:
+                if not values:
+                    return _NONE if op == "$in" else _ALL
+                cond = f"{column} {'IN' if op == '$in' else 'NOT IN'} ({', '.join(bind(v) for v in values)})"
+            else:
+                cond = f"{column} {_COMPARE[op]} {bind(value)}"
+            return f"SELECT id FROM chunk WHERE kb_id = :kb_id AND {cond}"
+
+        # No DISTINCT: it costs a temp B-tree per leaf; compounds dedupe anyway, callers do otherwise.
+        attr = f"SELECT chunk_id AS id FROM chunk_attr WHERE kb_id = :kb_id AND key = {bind(key)}"
+        if op in {"$gt", "$gte", "$lt", "$lte"}:
+            return f"{attr} AND value_num {_COMPARE[op]} {bind(float(value))}"
+        texts, nums = [], []
+        for v in values:
+            cols = _value_columns(v)
+            if cols is None:
+                raise UnsupportedFilter(f"unsupported filter value for '{key}': {v!r}")
+            if cols[0] is not None:
+                texts.append(cols[0])
+            else:
+                nums.append(cols[1])
+        matches = [f"value_text IN ({', '.join(bind(t) for t in texts)})"] if texts else []
+        matches += [f"value_num IN ({', '.join(bind(n) for n in nums)})"] if nums else []
+        hit = f"{attr} AND ({' OR '.join(matches) or '0'})"
+        if op in {"$eq", "$in"}:
+            return hit
+        return f"{attr} EXCEPT {hit}"
+
+    return clause(where), params
+
+
+def supports(where: dict[str, Any] | None) -> bool:
+    if not where:
+        return True
+    try:
+        compile_where(where)
+    except (UnsupportedFilter, TypeError):
+        return False
+    return True
+
+
+def matching_chunk_ids(session: Session, *, kb_id: str, where: dict[str, Any]) -> list[str]:
+    ids, params = compile_where(where)
+    return list(dict.fromkeys(r[0] for r in session.execute(text(ids), {**params, "kb_id": kb_id})))
+
+
+def keys(where: dict[str, Any]) -> set[str]:
+    """Metadata keys referenced anywhere in `where`."""
+    out: set[str] = set()
+    for key, cond in where.items():
+        if key in {"$and", "$or"}:
+            for sub in cond:
+                out |= keys(sub)
+        elif not key.startswith("$"):
+            out.add(key)
+    return out
+
+
+def _value_columns(value: Any) -> tuple[str | None, float | None] | None:
+    """(value_text, value_num) for a scalar metadata value, None for anything else."""
+    if isinstance(value, str):
+        return value, None
+    if isinstance(value, (bool, int, float)):
+        return None, float(value)
+    return None
+
+
+def _is_number(v: Any) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _load_tags(raw: Any) -> list[str]:
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    return [t for t in (raw or []) if isinstance(t, str)]
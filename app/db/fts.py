@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import Any
+
+from sqlalchemy import Engine, text
+from sqlmodel import Session
+
+from app.db import filters
+from app.db.models import Chunk
+
+# External-content FTS5 index over chunk text, kept in sync by the ingestion pipeline. Its rowid
+# is chunk.rowid, so the text is not stored twice, a deletion is a rowid lookup and matches are
+# restricted to one knowledge base through chunk's kb_id index. (chunk.rowid is implicit, so the
+# index would need a 'rebuild' after a VACUUM, which may renumber it.)
+_DDL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS chunk_fts USING fts5(
+    text,
+    content = 'chunk',
+    content_rowid = 'rowid',
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_MAX_TERMS = 32
+
+
+def init_fts(engine: Engine) -> None:
+    with engine.begin() as conn:
+        ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'chunk_fts'")).scalar()
+        if ddl is not None and "content_rowid" not in ddl:
+            # The first version stored its own copy of the text keyed by unindexed chunk ids.
+            conn.execute(text("DROP TABLE chunk_fts"))
+            ddl = None
+        conn.execute(text(_DDL))
+        if ddl is None:
+            # Index chunks ingested before the lexical index (or this layout of it) existed.
+            conn.execute(text("INSERT INTO chunk_fts (chunk_fts) VALUES ('rebuild')"))
+
+
+def index_chunks(session: Session, rows: list[Chunk]) -> None:
+    """Index flushed `chunk` rows."""
+    for i in range(0, len(rows), 500):
+        part = rows[i : i + 500]
+        binds = ", ".join(f":c{j}" for j in range(len(part)))
+        session.execute(
+            text(f"INSERT INTO chunk_fts (rowid, text) SELECT rowid, text FROM chunk WHERE id IN ({binds})"),
+            {f"c{j}": r.id for j, r in enumerate(part)},
+        )
+
+
+def delete_chunks(session: Session, chunk_ids: list[str]) -> None:
+    """Unindex chunks; call before their `chunk` rows are deleted, since FTS5 needs the indexed text to remove them."""
+    for i in range(0, len(chunk_ids), 500):
+        part = chunk_ids[i : i + 500]
+        binds = ", ".join(f":c{j}" for j in range(len(part)))
+        session.execute(
+            text(
+                "INSERT INTO chunk_fts (chunk_fts, rowid, text) "
+                f"SELECT 'delete', rowid, text FROM chunk WHERE id IN ({binds})"
+            ),
+            {f"c{j}": c for j, c in enumerate(part)},
+        )
+
+
+def to_match_query(question: str) -> str | None:
+    """OR together the question's terms, each quoted so FTS5 syntax in user input is inert."""
+    terms = list(dict.fromkeys(t.lower() for t in _TOKEN.findall(question)))[:_MAX_TERMS]
+    if not terms:
+        return None
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+def search(
+    session: Session, *, kb_id: str, question: str, limit: int, where: dict[str, Any] | None = None
+) -> list[dict[str, Any]]:
+    """
+    BM25-ranked chunks of one KB matching any term of `question`, best first; `where` is applied
+    in the same statement via `filters.compile_where`, so selective filters do not starve `limit`.
+    """
+    match = to_match_query(question)
+    if match is None:
+        return []
+    ids, params = filters.compile_where(where) if where else (None, {})
+    condition = f"c.id IN ({ids})" if ids else "1"
+    rows = session.execute(
+        text(
+            "SELECT c.id, c.doc_id, c.chunk_index, c.text, c.meta, f.rank "
+            "FROM chunk_fts AS f JOIN chunk AS c ON c.rowid = f.rowid "
+            f"WHERE chunk_fts MATCH :match AND c.kb_id = :kb_id AND ({condition}) "
+            "ORDER BY f.rank LIMIT :limit"
+        ),
+        {**params, "match": match, "kb_id": kb_id, "limit": limit},
+    ).all()
+
+    out: list[dict[str, Any]] = []
+    for chunk_id, doc_id, chunk_index, body, meta, rank in rows:
+        meta = json.loads(meta) if isinstance(meta, str) else dict(meta or {})
+        out.append(
+            {
+                "id": chunk_id,
+                "doc_id": doc_id,
+                "chunk_index": chunk_index,
+                "text": body,
+                "source_name": meta.get("source_name"),
+                "meta": meta,
+                # FTS5 rank is negated BM25 (lower is better).
+                "score": -float(rank),
+            }
+        )
+    return out
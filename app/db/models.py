@@ -18,6 +18,13 @@ class KnowledgeBase(SQLModel, table=True):
     name: str
     description: str | None = None
     created_at: datetime = Field(default_factory=utcnow)
+    # Bumped whenever ingestion changes the KB's chunks; query caches key on it.
+    version: int = 0
+    # Model the serving vectors were built with; questions are embedded with it. Unset until the
+    # first chunk is embedded (settings.embedding_model is used then). Changed by re-embedding.
+    embedding_model: str | None = None
+    # Re-embedding builds generation n + 1 in a shadow collection and switches to it (see app.vectorstore.routing).
+    index_generation: int = 0
 
 
 class Document(SQLModel, table=True):
@@ -27,10 +34,22 @@ class Document(SQLModel, table=True):
     original_filename: str
     content_type: str | None = None
     status: str = Field(default="uploaded", index=True)  # uploaded|ingesting|ready|error
+    # sha256 of the raw file (see Blob).
+    content_hash: str | None = Field(default=None, index=True)
+    # User-assigned labels; filterable per chunk as `{"tags": "..."}` (see app.db.filters).
+    tags: list[str] = Field(default_factory=list, sa_column=Column(SQLiteJSON))
 
     created_at: datetime = Field(default_factory=utcnow)
 
 
+class Blob(SQLModel, table=True):
+    # Content-addressed raw file under settings.blob_dir, shared by all documents with the same bytes
+    # (those whose Document.content_hash equals sha256).
+    sha256: str = Field(primary_key=True)
+    size: int
+    created_at: datetime = Field(default_factory=utcnow)
+
+
 class IngestionJob(SQLModel, table=True):
     id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
     kb_id: str = Field(index=True, foreign_key="knowledgebase.id")
@@ -39,6 +58,16 @@ class IngestionJob(SQLModel, table=True):
     state: str = Field(default="queued", index=True)  # queued|running|succeeded|failed
     error: str | None = None
 
+    # Jobs created by one bulk ingest share a batch and are processed together.
+    batch_id: str | None = Field(default=None, index=True)
+    # Higher runs first; ties are served oldest first.
+    priority: int = Field(default=0, index=True)
+    attempts: int = 0
+    # A running job whose lease expires (worker crashed) is put back in the queue.
+    worker_id: str | None = None
+    lease_expires_at: datetime | None = Field(default=None, index=True)
+    heartbeat_at: datetime | None = None
+
     started_at: datetime | None = None
     finished_at: datetime | None = None
 
@@ -52,6 +81,8 @@ class Chunk(SQLModel, table=True):
 
     chunk_index: int = Field(index=True)
     text: str
+    # sha256 of `text`; lets re-ingestion keep unchanged chunks and their vectors.
+    content_hash: str | None = Field(default=None, index=True)
 
     start_offset: int | None = None
     end_offset: int | None = None
@@ -61,7 +92,39 @@ class Chunk(SQLModel, table=True):
     )
 
 
+class ReembedJob(SQLModel, table=True):
+    id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
+    kb_id: str = Field(index=True, foreign_key="knowledgebase.id")
+
+    source_model: str
+    target_model: str
+    # Generation built in the shadow collection, and the serving one it replaced at the switch.
+    generation: int
+    replaced_generation: int | None = None
+    state: str = Field(default="queued", index=True)  # queued|running|succeeded|failed|cancelled
+    error: str | None = None
+
+    # Chunks are read in rowid order; pages up to `cursor` are in the shadow collection.
+    cursor: int = 0
+    total: int = 0
+    done: int = 0
+    # Time the job held back for live query embeddings and its duty cycle (throttling).
+    yielded_s: float = 0.0
+
+    worker_id: str | None = None
+    heartbeat_at: datetime | None = None
+    started_at: datetime | None = None
+    switched_at: datetime | None = None
+    # When the collection left unused was dropped: the replaced one (reembed_drop_grace_s after the
+    # switch), or the shadow of a cancelled or failed job.
+    retired_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    created_at: datetime = Field(default_factory=utcnow)
+
+
 class EmbeddingRecord(SQLModel, table=True):
+    # One per (chunk, model): a chunk being re-embedded has one for each model until the switch.
     id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
     chunk_id: str = Field(index=True, foreign_key="chunk.id")
 
@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+from sqlalchemy import inspect, literal, text
 from sqlmodel import Session, SQLModel, create_engine
 
 from app.core.settings import settings
-from app.db import models  # noqa: F401
+from app.db import filters, fts, models  # noqa: F401
 
 engine = create_engine(
     f"sqlite:///{settings.sqlite_path}",
@@ -14,6 +15,59 @@ engine = create_engine(
 def init_db() -> None:
     # MVP: create tables automatically. Alembic scaffolding can be added later.
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
+    _drop_blob_refcount()
+    _record_kb_models()
+    fts.init_fts(engine)
+    filters.init_filters(engine)
+
+
+def _record_kb_models() -> None:
+    # KBs from before KnowledgeBase.embedding_model: take the model most of their vectors were built
+    # with, so changing EMBEDDING_MODEL never pairs their vectors with another model's questions.
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+                UPDATE knowledgebase SET embedding_model = (
+                    SELECT e.embedding_model FROM embeddingrecord AS e JOIN chunk AS c ON c.id = e.chunk_id
+                    WHERE c.kb_id = knowledgebase.id
+                    GROUP BY e.embedding_model ORDER BY COUNT(*) DESC LIMIT 1
+                )
+                WHERE embedding_model IS NULL
+                """
+            )
+        )
+
+
+def _drop_blob_refcount() -> None:
+    # Blob.refcount was never decremented and has been removed; it is NOT NULL without a default,
+    # so inserts into databases that still have it would fail.
+    if "refcount" in {c["name"] for c in inspect(engine).get_columns("blob")}:
+        with engine.begin() as conn:
+            conn.execute(text('ALTER TABLE "blob" DROP COLUMN "refcount"'))
+
+
+def _add_missing_columns() -> None:
+    # create_all() never alters existing tables, so add columns introduced since the
+    # database was created. New columns are added as nullable with their scalar default.
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing:
+                    continue
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{col.name}" {col.type.compile(dialect=engine.dialect)}'
+                default = getattr(col.default, "arg", None)
+                if default is not None and not callable(default):
+                    bound = literal(default).compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+                    ddl += f" DEFAULT {bound}"
+                conn.execute(text(ddl))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
 
 
 class SessionLocal(Session):
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+
+from app.embeddings.hf_dense import HuggingFaceDenseEmbedder, with_model
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Pending:
+    text: str
+    future: asyncio.Future
+    model: str | None = None
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class EmbeddingMicroBatcher:
+    """
+    Coalesces concurrent single-text embedding requests into one forward pass.
+
+    Requests that arrive within `max_wait_ms` of the first queued one (or while every
+    executor thread is busy with a previous batch) are embedded together, up to
+    `max_batch` texts. At most `threads` batches run at once on a dedicated executor, and
+    at most `max_queue` questions wait for one; further callers block in `embed`. The
+    consumer task is started lazily on the running event loop.
+
+    Questions for a KB still served by another model than the embedder's (see
+    `KnowledgeBase.embedding_model`) pass `model`; a batch runs one forward pass per model.
+    """
+
+    def __init__(
+        self,
+        embedder: HuggingFaceDenseEmbedder,
+        *,
+        max_batch: int,
+        max_wait_ms: float,
+        threads: int = 1,
+        max_queue: int = 0,
+        executor: Executor | None = None,
+    ) -> None:
+        self._embedder = embedder
+        self._max_batch = max(1, max_batch)
+        self._max_wait_s = max(0.0, max_wait_ms) / 1000.0
+        self._threads = max(1, threads)
+        self._max_queue = max(0, max_queue)
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=self._threads, thread_name_prefix="query-embed")
+        self._queue: asyncio.Queue[_Pending] | None = None
+        self._task: asyncio.Task | None = None
+        self._inflight: set[asyncio.Task] = set()
+        self._stats_lock = threading.Lock()
+
+        self._last_active = 0.0
+
+        self.batches = 0
+        self.items = 0
+        self.queue_wait_s = 0.0
+        self.abandoned = 0
+
+    async def embed(self, text: str, *, model: str | None = None) -> np.ndarray:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(maxsize=self._max_queue)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        assert self._queue is not None
+        self._last_active = time.monotonic()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Pending(text=text, future=fut, model=model))
+        return await fut
+
+    def idle_s(self) -> float:
+        """Seconds since a question was last queued or embedded; 0 while any is. Safe to call from any thread."""
+        if self._inflight or (self._queue is not None and not self._queue.empty()):
+            return 0.0
+        return time.monotonic() - self._last_active
+
+    async def _collect(self, queue: asyncio.Queue[_Pending]) -> list[_Pending]:
+        batch: list[_Pending] = []
+        dropped = 0
+
+        def add(p: _Pending) -> None:
+            nonlocal dropped
+            # Callers whose deadline passed while queued have cancelled their future; skip them.
+            if p.future.done():
+                dropped += 1
+            else:
+                batch.append(p)
+
+        while not batch:
+            add(await queue.get())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._max_wait_s
+        while len(batch) < self._max_batch:
+            # Take whatever is already queued without waiting.
+            while len(batch) < self._max_batch and not queue.empty():
+                add(queue.get_nowait())
+            remaining = deadline - loop.time()
+            if len(batch) >= self._max_batch or remaining <= 0:
+                break
+            try:
+                add(await asyncio.wait_for(queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        if dropped:
+            with self._stats_lock:
+                self.abandoned += dropped
+        return batch
+
+    async def _run(self) -> None:
+        assert self._queue is not None
+        queue = self._queue
+        slots = asyncio.Semaphore(self._threads)
+        while True:
+            # Wait for a free thread before collecting, so requests keep coalescing meanwhile.
+            await slots.acquire()
+            try:
+                batch = await self._collect(queue)
+            except BaseException:
+                slots.release()
+                raise
+            started = time.perf_counter()
+            with self._stats_lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.queue_wait_s += sum(started - p.enqueued_at for p in batch)
+            task = asyncio.get_running_loop().create_task(self._dispatch(batch, slots))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: list[_Pending], slots: asyncio.Semaphore) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            vectors = await loop.run_in_executor(self._executor, self._embed, batch)
+        except Exception as e:  # noqa: BLE001
+            logger.exception("query embedding batch of %d failed", len(batch))
+            for p in batch:
+                if not p.future.done():
+                    p.future.set_exception(e)
+            return
+        finally:
+            self._last_active = time.monotonic()
+            slots.release()
+
+        for p, v in zip(batch, vectors):
+            if not p.future.done():
+                p.future.set_result(v)
+
+    def _embed(self, batch: list[_Pending]) -> list[np.ndarray]:
+        by_model: dict[str | None, list[int]] = {}
+        for i, p in enumerate(batch):
+            by_model.setdefault(p.model, []).append(i)
+        out: list[np.ndarray] = [np.empty(0, dtype=np.float32)] * len(batch)
+        for model, idx in by_model.items():
+            vectors = with_model(self._embedder, model).embed_texts([batch[i].text for i in idx])
+            for i, v in zip(idx, vectors):
+                out[i] = v
+        return out
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._inflight):
+            task.cancel()
+        if self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "max_batch": self._max_batch,
+                "max_wait_ms": self._max_wait_s * 1000.0,
+                "threads": self._threads,
+                "max_queue": self._max_queue,
+                "queued": self._queue.qsize() if self._queue is not None else 0,
+                "inflight_batches": len(self._inflight),
+                "abandoned": self.abandoned,
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": (self.items / self.batches) if self.batches else 0.0,
+                "fill_ratio": (self.items / (self.batches * self._max_batch)) if self.batches else 0.0,
+                "avg_queue_wait_ms": (self.queue_wait_s / self.items * 1000.0) if self.items else 0.0,
+            }
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from app.core.settings import settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    model TEXT NOT NULL,
+    max_length INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    dims INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (model, max_length, digest)
+);
+CREATE INDEX IF NOT EXISTS ix_embedding_cache_last_access ON embedding_cache (last_access);
+"""
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: SQLite blob table on disk + in-memory LRU.
+
+    Entries are keyed by (model, max_length, sha256(text)) so changing either embedding
+    setting never serves a stale vector. The disk table is trimmed by least-recent access
+    once it grows past `max_bytes`.
+    """
+
+    def __init__(self, *, path: Path, max_bytes: int, memory_items: int) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._max_bytes = max_bytes
+        self._memory_items = memory_items
+        self._memory: OrderedDict[tuple[str, int, str], np.ndarray] = OrderedDict()
+
+        row = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0), COUNT(*) FROM embedding_cache").fetchone()
+        self._disk_bytes = int(row[0])
+        self._disk_entries = int(row[1])
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, key: tuple[str, int, str], vec: np.ndarray) -> None:
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, *, model: str, max_length: int, digests: list[str]) -> list[np.ndarray | None]:
+        out: list[np.ndarray | None] = [None] * len(digests)
+        pending: dict[str, list[int]] = {}
+
+        with self._lock:
+            for i, d in enumerate(digests):
+                key = (model, max_length, d)
+                vec = self._memory.get(key)
+                if vec is not None:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    out[i] = vec
+                else:
+                    pending.setdefault(d, []).append(i)
+
+            if pending:
+                found: list[tuple[str, int, bytes]] = []
+                keys = list(pending)
+                # Stay well under SQLite's bound-parameter limit.
+                for j in range(0, len(keys), 500):
+                    part = keys[j : j + 500]
+                    marks = ",".join("?" * len(part))
+                    found.extend(
+                        self._conn.execute(
+                            f"SELECT digest, dims, vector FROM embedding_cache "
+                            f"WHERE model = ? AND max_length = ? AND digest IN ({marks})",
+                            (model, max_length, *part),
+                        ).fetchall()
+                    )
+
+                now = time.time()
+                for d, dims, blob in found:
+                    vec = np.frombuffer(blob, dtype=np.float32, count=dims)
+                    self._remember((model, max_length, d), vec)
+                    for i in pending.pop(d):
+                        out[i] = vec
+                        self.disk_hits += 1
+                if found:
+                    self._conn.executemany(
+                        "UPDATE embedding_cache SET last_access = ? WHERE model = ? AND max_length = ? AND digest = ?",
+                        [(now, model, max_length, d) for d, _, _ in found],
+                    )
+
+                self.misses += sum(len(v) for v in pending.values())
+        return out
+
+    def put_many(self, *, model: str, max_length: int, digests: list[str], vectors: list[np.ndarray]) -> None:
+        if not digests:
+            return
+        now = time.time()
+        rows = []
+        with self._lock:
+            for d, v in zip(digests, vectors):
+                vec = np.ascontiguousarray(v, dtype=np.float32)
+                self._remember((model, max_length, d), vec)
+                rows.append((model, max_length, d, int(vec.shape[0]), vec.tobytes(), now))
+
+            self._conn.execute("BEGIN")
+            try:
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO embedding_cache (model, max_length, digest, dims, vector, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                inserted = self._conn.total_changes - before
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            if inserted:
+                # Vectors from one model share a size, so the first row is representative.
+                self._disk_bytes += inserted * len(rows[0][4])
+                self._disk_entries += inserted
+            if self._disk_bytes > self._max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Trim to 90% of the budget so we don't evict on every subsequent insert.
+        target = int(self._max_bytes * 0.9)
+        while self._disk_bytes > target and self._disk_entries > 0:
+            avg = max(1, self._disk_bytes // self._disk_entries)
+            n = max(1, (self._disk_bytes - target) // avg + 1)
+            victims = self._conn.execute(
+                "SELECT model, max_length, digest, LENGTH(vector) FROM embedding_cache ORDER BY last_access LIMIT ?",
+                (n,),
+            ).fetchall()
+            if not victims:
+                break
+            self._conn.executemany(
+                "DELETE FROM embedding_cache WHERE model = ? AND max_length = ? AND digest = ?",
+                [(m, ml, d) for m, ml, d, _ in victims],
+            )
+            for m, ml, d, size in victims:
+                self._memory.pop((m, ml, d), None)
+                self._disk_bytes -= int(size)
+                self._disk_entries -= 1
+                self.evictions += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "disk_entries": self._disk_entries,
+                "disk_bytes": self._disk_bytes,
+                "max_bytes": self._max_bytes,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_embedding_cache() -> EmbeddingCache | None:
+    if not settings.embedding_cache_enabled:
+        return None
+    return EmbeddingCache(
+        path=settings.embedding_cache_path,
+        max_bytes=settings.embedding_cache_max_bytes,
+        memory_items=settings.embedding_cache_memory_items,
+    )
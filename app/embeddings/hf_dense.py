@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from collections.abc import Iterator
 from functools import lru_cache
 
 import numpy as np
@@ -7,6 +8,7 @@ import torch
 from transformers import AutoModel, AutoTokenizer
 
 from app.core.settings import settings
+from app.embeddings.cache import EmbeddingCache, get_embedding_cache, text_digest
 
 
 def _mean_pool(last_hidden: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
@@ -17,11 +19,12 @@ def _mean_pool(last_hidden: torch.Tensor, attention_mask: torch.Tensor) -> torch
     return summed / counts
 
 
-@lru_cache(maxsize=1)
-def _load() -> tuple[AutoTokenizer, AutoModel, torch.device]:
+# Two models at most: a KB's serving model and the one it is being re-embedded with.
+@lru_cache(maxsize=2)
+def _load(name: str) -> tuple[AutoTokenizer, AutoModel, torch.device]:
     device = torch.device(settings.embedding_device)
-    tok = AutoTokenizer.from_pretrained(settings.embedding_model)
-    model = AutoModel.from_pretrained(settings.embedding_model)
+    tok = AutoTokenizer.from_pretrained(name)
+    model = AutoModel.from_pretrained(name)
     model.eval()
     model.to(device)
     return tok, model, device
@@ -33,34 +36,144 @@ class HuggingFaceDenseEmbedder:
 
     Note: ColBERT checkpoints are typically used with late-interaction retrieval.
     For this MVP (Chroma dense vector store), we compute a pooled dense vector.
+
+    Vectors are served from the persistent embedding cache when available; only texts
+    that were never embedded with the current model settings hit the model. `model`
+    defaults to EMBEDDING_MODEL.
     """
 
-    def embed_texts(self, texts: list[str]) -> list[list[float]]:
-        tok, model, device = _load()
-        out_vectors: list[list[float]] = []
-
-        # Simple batching to avoid OOM on CPU.
-        batch_size = 8
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i : i + batch_size]
-            enc = tok(
-                batch,
-                padding=True,
-                truncation=True,
-                max_length=settings.embedding_max_length,
-                return_tensors="pt",
-            )
+    def __init__(
+        self, *, model: str | None = None, cache: EmbeddingCache | None = None, use_cache: bool = True
+    ) -> None:
+        self.model = model or settings.embedding_model
+        self._cache = (cache or get_embedding_cache()) if use_cache else None
+
+    def embed_texts(self, texts: list[str]) -> np.ndarray:
+        """[len(texts), dim] float32 matrix, rows in input order."""
+        if self._cache is None or not texts:
+            return self._embed_uncached(texts)
+
+        model, max_length = self.model, settings.embedding_max_length
+        digests = [text_digest(t) for t in texts]
+        cached = self._cache.get_many(model=model, max_length=max_length, digests=digests)
+
+        # Embed each distinct missing text once, even if it repeats within the batch.
+        missing: dict[str, str] = {}
+        for d, t, v in zip(digests, texts, cached):
+            if v is None:
+                missing.setdefault(d, t)
+        if missing:
+            fresh = self._embed_uncached(list(missing.values()))
+            self._cache.put_many(model=model, max_length=max_length, digests=list(missing), vectors=fresh)
+            by_digest = dict(zip(missing, fresh))
+            cached = [v if v is not None else by_digest[d] for d, v in zip(digests, cached)]
+
+        out = np.empty((len(texts), cached[0].shape[0]), dtype=np.float32)
+        for i, v in enumerate(cached):
+            out[i] = v
+        return out
+
+    def embed_tokens(self, texts: list[str]) -> list[np.ndarray]:
+        """
+        Per-token L2-normalized embeddings (special and padding tokens dropped), one
+        [n_tokens, hidden] float32 matrix per text, for late-interaction (MaxSim) scoring.
+
+        These are the backbone's last hidden states; the ColBERT projection head is not
+        part of the `AutoModel` checkpoint, so stores reduce dimensionality themselves.
+        """
+        out: list[np.ndarray] = [np.zeros((0, 0), dtype=np.float32)] * len(texts)
+        for idx, hidden, enc in self._forward(texts, special_tokens_mask=True):
+            keep = enc["attention_mask"].bool() & ~enc["special_tokens_mask"].bool()
+            hidden = torch.nn.functional.normalize(hidden, p=2, dim=2)
+            arr = hidden.cpu().numpy().astype(np.float32)
+            mask = keep.cpu().numpy()
+            for row, i in enumerate(idx):
+                out[i] = np.ascontiguousarray(arr[row][mask[row]])
+        return out
+
+    def _embed_uncached(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        out: np.ndarray | None = None
+        for idx, hidden, enc in self._forward(texts):
+            pooled = _mean_pool(hidden, enc["attention_mask"])
+            # L2 normalize (helps cosine-like similarity even if store uses L2)
+            pooled = torch.nn.functional.normalize(pooled, p=2, dim=1)
+            vecs = pooled.detach().cpu().numpy().astype(np.float32)
+
+            if out is None:
+                out = np.empty((len(texts), vecs.shape[1]), dtype=np.float32)
+            # Scatter back so callers see vectors in input order.
+            out[idx] = vecs
+
+        assert out is not None
+        return out
+
+    def _forward(
+        self,
+        texts: list[str],
+        *,
+        special_tokens_mask: bool = False,
+    ) -> Iterator[tuple[list[int], torch.Tensor, dict[str, torch.Tensor]]]:
+        """Run the model over length-bucketed batches; yields (input indices, last hidden state, encoding)."""
+        tok, model, device = _load(self.model)
+        if not texts:
+            return
+
+        enc_all = tok(
+            texts,
+            padding=False,
+            truncation=True,
+            max_length=settings.embedding_max_length,
+            return_special_tokens_mask=special_tokens_mask,
+        )
+        input_ids: list[list[int]] = enc_all["input_ids"]
+
+        for idx in plan_batches(
+            [len(ids) for ids in input_ids],
+            batch_size=settings.embedding_batch_size,
+            token_budget=settings.embedding_token_budget,
+        ):
+            features = {k: [enc_all[k][i] for i in idx] for k in enc_all.keys()}
+            enc = tok.pad(features, padding=True, return_tensors="pt")
             enc = {k: v.to(device) for k, v in enc.items()}
+            # Not a model input; handed back to the caller alongside the attention mask.
+            special = enc.pop("special_tokens_mask", None)
             with torch.no_grad():
                 res = model(**enc)
-                pooled = _mean_pool(res.last_hidden_state, enc["attention_mask"])
-                # L2 normalize (helps cosine-like similarity even if store uses L2)
-                pooled = torch.nn.functional.normalize(pooled, p=2, dim=1)
-                vecs = pooled.detach().cpu().numpy().astype(np.float32)
+            if special is not None:
+                enc["special_tokens_mask"] = special
+            yield idx, res.last_hidden_state, enc
+
 
-            for v in vecs:
-                out_vectors.append(v.tolist())
+def with_model(embedder: HuggingFaceDenseEmbedder, model: str | None) -> HuggingFaceDenseEmbedder:
+    """`embedder`, or an embedder for `model` when that is another model (weights are loaded once per model)."""
+    if model is None or model == getattr(embedder, "model", settings.embedding_model):
+        return embedder
+    return HuggingFaceDenseEmbedder(model=model)
 
-        return out_vectors
 
+def plan_batches(lengths: list[int], *, batch_size: int, token_budget: int) -> list[list[int]]:
+    """
+    Group input indices into length-sorted batches.
 
+    Inputs are sorted longest-first so each batch pads to a similar length, and a batch
+    is closed once `rows * longest_row` would exceed `token_budget` or it holds
+    `batch_size` rows. A single over-budget input still gets its own batch.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches: list[list[int]] = []
+    current: list[int] = []
+    longest = 0
+    for i in order:
+        n = max(1, lengths[i])
+        width = max(longest, n)
+        if current and (len(current) >= batch_size or (len(current) + 1) * width > token_budget):
+            batches.append(current)
+            current, width = [], n
+        current.append(i)
+        longest = width
+    if current:
+        batches.append(current)
+    return batches
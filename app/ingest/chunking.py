@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from bisect import bisect_right
+from collections.abc import Iterable, Iterator, Sequence
 from dataclasses import dataclass
 from typing import Any
 
@@ -23,40 +25,86 @@ def chunk_text(
     text = text or ""
     if not text.strip():
         return []
+    return list(chunk_stream([text], chunk_size=chunk_size, overlap=overlap, base_meta=base_meta))
 
-    base_meta = dict(base_meta or {})
-    chunks: list[TextChunk] = []
 
-    i = 0
+def chunk_stream(
+    segments: Iterable[str],
+    *,
+    chunk_size: int = 1200,
+    overlap: int = 150,
+    base_meta: dict[str, Any] | None = None,
+) -> Iterator[TextChunk]:
+    """
+    Chunk text that arrives as consecutive segments (pages, paragraphs, file blocks).
+
+    Produces exactly the chunks `chunk_text` would for the concatenated segments, with
+    offsets into that concatenation, while only buffering about one segment plus one
+    chunk of text.
+    """
+    base_meta = dict(base_meta or {})
+    buf = ""  # text[buf_start:]
+    buf_start = 0
     start = 0
-    n = len(text)
-    while start < n:
-        end = min(n, start + chunk_size)
+    i = 0
 
+    def _emit(begin: int, end: int) -> TextChunk | None:
+        nonlocal i
+        chunk = buf[begin - buf_start : end - buf_start].strip()
+        if not chunk:
+            return None
+        out = TextChunk(index=i, text=chunk, start_offset=begin, end_offset=end, meta=dict(base_meta))
+        i += 1
+        return out
+
+    def _cut_end(begin: int, n: int) -> int:
+        end = min(n, begin + chunk_size)
         # Try not to cut mid-paragraph if possible (best-effort).
         if end < n:
-            window = text[start:end]
+            window = buf[begin - buf_start : end - buf_start]
             last_break = max(window.rfind("\n\n"), window.rfind("\n"))
             if last_break > chunk_size * 0.6:
-                end = start + last_break
-
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(
-                TextChunk(
-                    index=i,
-                    text=chunk,
-                    start_offset=start,
-                    end_offset=end,
-                    meta=dict(base_meta),
-                )
-            )
-            i += 1
+                end = begin + last_break
+        return end
+
+    for seg in segments:
+        if not seg:
+            continue
+        buf += seg
+        seen = buf_start + len(buf)
+        # A chunk is final once text beyond its window has arrived.
+        while seen - start > chunk_size:
+            end = _cut_end(start, seen)
+            c = _emit(start, end)
+            if c is not None:
+                yield c
+            start = max(0, end - overlap)
+        # Drop text no future chunk can reach.
+        if start > buf_start:
+            buf = buf[start - buf_start :]
+            buf_start = start
 
+    n = buf_start + len(buf)
+    while start < n:
+        end = _cut_end(start, n)
+        c = _emit(start, end)
+        if c is not None:
+            yield c
         if end >= n:
             break
         start = max(0, end - overlap)
 
-    return chunks
 
+def annotate_pages(chunks: Iterable[TextChunk], page_offsets: Sequence[int]) -> Iterator[TextChunk]:
+    """
+    Add `page_start`/`page_end` (1-based) to each chunk's meta, where `page_offsets[i]` is the
+    offset at which page i + 1 starts in the extracted text.
 
+    `page_offsets` may still be growing while a streamed extraction is consumed: a chunk is
+    only emitted once text past its end has arrived, so the pages it spans are known by then.
+    """
+    for c in chunks:
+        if page_offsets and c.start_offset is not None and c.end_offset is not None:
+            c.meta["page_start"] = max(1, bisect_right(page_offsets, c.start_offset))
+            c.meta["page_end"] = max(1, bisect_right(page_offsets, max(c.start_offset, c.end_offset - 1)))
+        yield c
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
+from collections.abc import Iterator
 from dataclasses import dataclass
-from typing import Any, Protocol
+from typing import Any, Protocol, runtime_checkable
 
 
 @dataclass(frozen=True)
@@ -10,9 +11,21 @@ class ExtractedText:
     meta: dict[str, Any]
 
 
+@dataclass(frozen=True)
+class ExtractedStream:
+    # Consecutive text segments; their concatenation is the extracted text.
+    segments: Iterator[str]
+    meta: dict[str, Any]
+
+
 class Extractor(Protocol):
     def can_handle(self, *, path: str, content_type: str | None) -> bool: ...
 
     def extract(self, *, path: str, content_type: str | None) -> ExtractedText: ...
 
 
+@runtime_checkable
+class StreamingExtractor(Protocol):
+    """Extractor that can yield text incrementally so large files are never held in memory whole."""
+
+    def extract_stream(self, *, path: str, content_type: str | None) -> ExtractedStream: ...
@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+import codecs
+from collections.abc import Iterator
 from pathlib import Path
 
+_BLOCK_CHARS = 1024 * 1024
+
 
 def ext_lower(path: str) -> str:
     return Path(path).suffix.lower().lstrip(".")
@@ -16,3 +20,22 @@ def read_text_file(path: str) -> str:
         return p.read_text(encoding="latin-1", errors="replace")
 
 
+def detect_text_encoding(path: str) -> str:
+    """Return "utf-8" if the whole file decodes as UTF-8, else "latin-1" (same policy as read_text_file)."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with Path(path).open("rb") as f:
+        try:
+            while block := f.read(_BLOCK_CHARS):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return "latin-1"
+    return "utf-8"
+
+
+def iter_text_file(path: str, *, block_chars: int = _BLOCK_CHARS) -> Iterator[str]:
+    """Yield a text file in blocks of about `block_chars` characters."""
+    encoding = detect_text_encoding(path)
+    with Path(path).open("r", encoding=encoding, errors="replace") as f:
+        while block := f.read(block_chars):
+            yield block
@@ -1,8 +1,14 @@
 from __future__ import annotations
 
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from pathlib import Path
 
-from app.ingest.extractors.base import ExtractedText, Extractor
+from app.core.settings import settings
+from app.ingest.extractors.base import ExtractedStream, ExtractedText, Extractor, StreamingExtractor
 from app.ingest.extractors.html import HtmlExtractor
 from app.ingest.extractors.pdf import PdfExtractor
 from app.ingest.extractors.plaintext import PlainTextExtractor
@@ -10,7 +16,17 @@ from app.ingest.extractors.structured import StructuredTextExtractor
 
 
 class ExtractorDispatcher:
-    def __init__(self) -> None:
+    """
+    Routes a file to the first extractor that can handle it.
+
+    In `process` mode (EXTRACT_MODE) extraction runs in a shared process pool so the
+    CPU-bound PDF/HTML parsing neither holds the GIL of the ingesting process nor
+    serializes across files. Large PDFs are split into page ranges that are extracted
+    in parallel and reassembled in page order.
+    """
+
+    def __init__(self, *, mode: str | None = None) -> None:
+        self._mode = mode or settings.extract_mode
         self._extractors: list[Extractor] = [
             PdfExtractor(),
             HtmlExtractor(),
@@ -18,13 +34,27 @@ class ExtractorDispatcher:
             PlainTextExtractor(),
         ]
 
-    def extract(self, *, path: str, content_type: str | None) -> ExtractedText:
+    def _find(self, *, path: str, content_type: str | None) -> Extractor | None:
         for ext in self._extractors:
             if ext.can_handle(path=path, content_type=content_type):
-                out = ext.extract(path=path, content_type=content_type)
-                # Always attach file name for citations.
-                out.meta.setdefault("source_name", Path(path).name)
-                return out
+                return ext
+        return None
+
+    def extract(self, *, path: str, content_type: str | None) -> ExtractedText:
+        if self._mode != "process":
+            return self.extract_inline(path=path, content_type=content_type)
+        out = self.extract_many([(path, content_type)])[0]
+        if isinstance(out, Exception):
+            raise out
+        return out
+
+    def extract_inline(self, *, path: str, content_type: str | None) -> ExtractedText:
+        ext = self._find(path=path, content_type=content_type)
+        if ext is not None:
+            out = ext.extract(path=path, content_type=content_type)
+            # Always attach file name for citations.
+            out.meta.setdefault("source_name", Path(path).name)
+            return out
 
         # Fallback: best-effort decode as text.
         data = Path(path).read_bytes()
@@ -34,4 +64,126 @@ class ExtractorDispatcher:
             text = data.decode("latin-1", errors="replace")
         return ExtractedText(text=text, meta={"source_type": "fallback", "source_name": Path(path).name})
 
+    def extract_stream(self, *, path: str, content_type: str | None) -> ExtractedStream:
+        """
+        Extract incrementally, in this process. Extractors without a streaming
+        implementation yield their whole text as a single segment.
+        """
+        ext = self._find(path=path, content_type=content_type)
+        if isinstance(ext, StreamingExtractor):
+            out = ext.extract_stream(path=path, content_type=content_type)
+            out.meta.setdefault("source_name", Path(path).name)
+            return out
+        whole = self.extract_inline(path=path, content_type=content_type)
+        return ExtractedStream(segments=iter([whole.text]), meta=whole.meta)
+
+    def extract_many(self, files: list[tuple[str, str | None]]) -> list[ExtractedText | Exception]:
+        """Extract several files at once; failures (including timeouts) are returned in place, not raised."""
+        if not files:
+            return []
+        if self._mode != "process":
+            workers = max(1, min(settings.extract_workers, len(files)))
+            tpool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extract")
+            try:
+                futs = [tpool.submit(self.extract_inline, path=p, content_type=ct) for p, ct in files]
+                return [_result_or_error([f], settings.extract_timeout_s)[0] for f in futs]
+            finally:
+                # A thread cannot be interrupted: one that timed out finishes in the background.
+                tpool.shutdown(wait=False, cancel_futures=True)
+
+        pool = _process_pool(settings.extract_workers)
+        pages_per_task = max(1, settings.extract_pdf_pages_per_task)
+        plans: list[tuple[str, list[Future]] | Exception] = []
+        for path, ct in files:
+            ext = self._find(path=path, content_type=ct)
+            try:
+                if isinstance(ext, PdfExtractor):
+                    n = ext.page_count(path=path)
+                    if n > pages_per_task:
+                        futs = [
+                            pool.submit(_extract_pdf_pages, path, start, min(n, start + pages_per_task))
+                            for start in range(0, n, pages_per_task)
+                        ]
+                        plans.append(("pdf", futs))
+                        continue
+                plans.append(("file", [pool.submit(_extract_file, path, ct)]))
+            except Exception as e:  # noqa: BLE001
+                # Includes a pool recycled by another caller since it was fetched.
+                plans.append(e)
+
+        out: list[ExtractedText | Exception] = []
+        pdf = PdfExtractor()
+        timed_out = False
+        for (path, _), plan in zip(files, plans):
+            if isinstance(plan, Exception):
+                out.append(plan)
+                continue
+            kind, futs = plan
+            parts = _result_or_error(futs, settings.extract_timeout_s)
+            err = next((p for p in parts if isinstance(p, Exception)), None)
+            timed_out = timed_out or isinstance(err, TimeoutError)
+            if err is not None:
+                out.append(err)
+            elif kind == "pdf":
+                pages = [page for part in parts for page in part]
+                res = pdf.assemble(pages)
+                res.meta.setdefault("source_name", Path(path).name)
+                out.append(res)
+            else:
+                out.append(parts[0])
+        if timed_out:
+            # The timed-out tasks still occupy worker processes; replace the pool once this batch is done.
+            _recycle_pool(pool)
+        return out
+
+
+def _result_or_error(futs: list[Future], timeout_s: float) -> list:
+    """Wait for all futures of one file under a single per-file deadline."""
+    deadline = time.monotonic() + timeout_s
+    out: list = []
+    for f in futs:
+        try:
+            out.append(f.result(timeout=max(0.0, deadline - time.monotonic())))
+        except FutureTimeoutError:
+            for g in futs:
+                g.cancel()
+            return [TimeoutError(f"extraction timed out after {timeout_s:.0f}s")]
+        except Exception as e:  # noqa: BLE001
+            out.append(e)
+    return out
+
+
+_pool_lock = threading.Lock()
+_pool: ProcessPoolExecutor | None = None
+
+
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    # Shared by every dispatcher in the process; workers are spawned on first use. Spawned, not
+    # forked: the ingesting process is multithreaded and has torch loaded.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _recycle_pool(pool: ProcessPoolExecutor) -> None:
+    """Terminate `pool`'s workers (including ones stuck on a timed-out task); the next call starts a new pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return
+        _pool = None
+    # Tasks other dispatchers still had in it fail with BrokenProcessPool, and their ingestion job is retried.
+    procs = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for proc in procs:
+        proc.terminate()
+
+
+def _extract_file(path: str, content_type: str | None) -> ExtractedText:
+    return ExtractorDispatcher(mode="inline").extract_inline(path=path, content_type=content_type)
+
 
+def _extract_pdf_pages(path: str, start: int, stop: int) -> list[str]:
+    return PdfExtractor().extract_pages(path=path, start=start, stop=stop)
@@ -1,9 +1,35 @@
 from __future__ import annotations
 
+from collections.abc import Iterator
+from html.parser import HTMLParser
+
 from bs4 import BeautifulSoup
 
-from app.ingest.extractors.base import ExtractedText
-from app.ingest.extractors.common import ext_lower, read_text_file
+from app.ingest.extractors.base import ExtractedStream, ExtractedText
+from app.ingest.extractors.common import ext_lower, iter_text_file, read_text_file
+
+_SKIP_TAGS = {"script", "style", "noscript"}
+
+
+class _TextCollector(HTMLParser):
+    """Incremental text collector mirroring `soup.get_text("\\n")` minus script/style/noscript."""
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self._skip_depth = 0
+        self.parts: list[str] = []
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in _SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data: str) -> None:
+        if not self._skip_depth:
+            self.parts.append(data)
 
 
 class HtmlExtractor:
@@ -23,4 +49,23 @@ class HtmlExtractor:
         text = soup.get_text("\n")
         return ExtractedText(text=text, meta={"source_type": "html"})
 
+    def extract_stream(self, *, path: str, content_type: str | None) -> ExtractedStream:
+        def _segments() -> Iterator[str]:
+            parser = _TextCollector()
+            first = True
+            blocks = iter_text_file(path)
+            while True:
+                block = next(blocks, None)
+                if block is None:
+                    parser.close()
+                else:
+                    parser.feed(block)
+                if parser.parts:
+                    seg = "\n".join(parser.parts)
+                    parser.parts.clear()
+                    yield seg if first else "\n" + seg
+                    first = False
+                if block is None:
+                    return
 
+        return ExtractedStream(segments=_segments(), meta={"source_type": "html"})
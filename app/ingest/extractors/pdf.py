@@ -1,8 +1,10 @@
 from __future__ import annotations
 
+from collections.abc import Iterator
+
 from pypdf import PdfReader
 
-from app.ingest.extractors.base import ExtractedText
+from app.ingest.extractors.base import ExtractedStream, ExtractedText
 from app.ingest.extractors.common import ext_lower
 
 
@@ -16,14 +18,60 @@ class PdfExtractor:
 
     def extract(self, *, path: str, content_type: str | None) -> ExtractedText:
         reader = PdfReader(path)
+        pages = self._extract_range(reader, 0, len(reader.pages))
+        return self.assemble(pages)
+
+    def extract_stream(self, *, path: str, content_type: str | None) -> ExtractedStream:
+        reader = PdfReader(path)
+
+        # Filled in as pages are yielded, so it always covers the text consumed so far.
+        page_offsets: list[int] = []
+
+        def _segments() -> Iterator[str]:
+            # Same layout as assemble(): non-empty pages separated by a blank line.
+            first = True
+            pos = 0
+            for i in range(len(reader.pages)):
+                page = self._extract_range(reader, i, i + 1)[0]
+                if not page:
+                    page_offsets.append(pos)
+                    continue
+                seg = page if first else "\n\n" + page
+                page_offsets.append(pos + len(seg) - len(page))
+                pos += len(seg)
+                yield seg
+                first = False
+
+        return ExtractedStream(
+            segments=_segments(),
+            meta={"source_type": "pdf", "pages": len(reader.pages), "page_offsets": page_offsets},
+        )
+
+    def page_count(self, *, path: str) -> int:
+        return len(PdfReader(path).pages)
+
+    def extract_pages(self, *, path: str, start: int, stop: int) -> list[str]:
+        """Extract pages [start, stop) so large PDFs can be split across worker processes."""
+        return self._extract_range(PdfReader(path), start, stop)
+
+    def assemble(self, pages: list[str]) -> ExtractedText:
+        text = "\n\n".join([p for p in pages if p])
+        # Start offset of each page in `text`, for per-chunk page numbers.
+        page_offsets: list[int] = []
+        pos = 0
+        for p in pages:
+            if p and pos:
+                pos += 2
+            page_offsets.append(pos)
+            pos += len(p)
+        return ExtractedText(text=text, meta={"source_type": "pdf", "pages": len(pages), "page_offsets": page_offsets})
+
+    def _extract_range(self, reader: PdfReader, start: int, stop: int) -> list[str]:
         pages: list[str] = []
-        for i, page in enumerate(reader.pages):
+        for i in range(start, min(stop, len(reader.pages))):
             try:
-                txt = page.extract_text() or ""
+                txt = reader.pages[i].extract_text() or ""
             except Exception:
                 txt = ""
             pages.append(f"[page {i+1}]\n{txt}".strip())
-        text = "\n\n".join([p for p in pages if p])
-        return ExtractedText(text=text, meta={"source_type": "pdf", "pages": len(reader.pages)})
-
-
+        return pages
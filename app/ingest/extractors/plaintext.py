@@ -1,7 +1,7 @@
 from __future__ import annotations
 
-from app.ingest.extractors.base import ExtractedText
-from app.ingest.extractors.common import ext_lower, read_text_file
+from app.ingest.extractors.base import ExtractedStream, ExtractedText
+from app.ingest.extractors.common import ext_lower, iter_text_file, read_text_file
 
 
 class PlainTextExtractor:
@@ -16,4 +16,5 @@ class PlainTextExtractor:
         text = read_text_file(path)
         return ExtractedText(text=text, meta={"source_type": "text"})
 
-
+    def extract_stream(self, *, path: str, content_type: str | None) -> ExtractedStream:
+        return ExtractedStream(segments=iter_text_file(path), meta={"source_type": "text"})
@@ -1,29 +1,83 @@
 from __future__ import annotations
 
 import logging
-from datetime import datetime, timezone
+from collections.abc import Iterator
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any
 
+import numpy as np
 from sqlmodel import Session
 
 from app.core.settings import settings
-from app.db import crud
-from app.db.models import Chunk, EmbeddingRecord
-from app.embeddings.hf_dense import HuggingFaceDenseEmbedder
-from app.ingest.chunking import chunk_text
+from app.db import crud, filters, fts
+from app.db.models import Chunk, Document, EmbeddingRecord
+from app.embeddings.cache import text_digest
+from app.embeddings.hf_dense import HuggingFaceDenseEmbedder, with_model
+from app.ingest.chunking import TextChunk, annotate_pages, chunk_stream, chunk_text
+from app.ingest.extractors.base import ExtractedText
 from app.ingest.extractors.dispatcher import ExtractorDispatcher
-from app.storage.local import write_extracted_text
-from app.vectorstore.chroma import ChromaVectorStore
+from app.storage.local import copy_artifacts, open_extracted_writer, write_extracted_text
+from app.vectorstore.base import VectorStore
+from app.vectorstore.factory import create_vector_store
+from app.vectorstore.routing import kb_write_lock
 
 logger = logging.getLogger(__name__)
 
+_VECTOR_META_KEYS = ("source_type", "page_start", "page_end")
+
+
+@dataclass(frozen=True)
+class IngestItem:
+    doc_id: str
+    raw_path: Path
+    content_type: str | None
+
+
+@dataclass(frozen=True)
+class _ExistingChunk:
+    id: str
+    chunk_index: int
+    start_offset: int | None
+    end_offset: int | None
+
+
+@dataclass
+class _ChunkDiff:
+    """Existing chunks of one document, keyed by content hash, consumed as new chunks match them."""
+
+    reusable: dict[str, list[_ExistingChunk]] = field(default_factory=dict)
+    # Chunks whose vector was built with another embedding model are always replaced.
+    outdated: list[str] = field(default_factory=list)
+    reused: int = 0
+    embedded: int = 0
+
+    def take(self, content_hash: str) -> _ExistingChunk | None:
+        rows = self.reusable.get(content_hash)
+        return rows.pop(0) if rows else None
+
+    def stale_ids(self) -> list[str]:
+        return self.outdated + [r.id for rows in self.reusable.values() for r in rows]
+
+
+@dataclass
+class _Prepared:
+    item: IngestItem
+    chunks: list[TextChunk] = field(default_factory=list)
+    extracted_meta: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+
 
 class IngestionPipeline:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        *,
+        embedder: HuggingFaceDenseEmbedder | None = None,
+        vector_store: VectorStore | None = None,
+    ) -> None:
         self._extract = ExtractorDispatcher()
-        self._embedder = HuggingFaceDenseEmbedder()
-        self._vs = ChromaVectorStore()
+        self._embedder = embedder or HuggingFaceDenseEmbedder()
+        self._vs = vector_store or create_vector_store()
 
     def ingest_document(
         self,
@@ -40,76 +94,501 @@ class IngestionPipeline:
         if not doc or doc.kb_id != kb_id:
             raise ValueError("document not found for kb")
 
-        doc.status = "ingesting"
-        session.add(doc)
-        session.commit()
+        result = self.ingest_documents(
+            session=session,
+            kb_id=kb_id,
+            items=[IngestItem(doc_id=doc_id, raw_path=raw_path, content_type=content_type)],
+            chunk_size=chunk_size,
+            overlap=overlap,
+        )[doc_id]
+        if "error" in result:
+            raise ValueError(result["error"])
+        return result
 
-        extracted = self._extract.extract(path=str(raw_path), content_type=content_type)
-        write_extracted_text(kb_id, doc_id, extracted.text)
+    def ingest_documents(
+        self,
+        *,
+        session: Session,
+        kb_id: str,
+        items: list[IngestItem],
+        chunk_size: int = 1200,
+        overlap: int = 150,
+    ) -> dict[str, dict[str, Any]]:
+        """
+        Ingest several documents of one KB as a single pipeline.
 
-        base_meta = {"doc_id": doc_id, "source_name": extracted.meta.get("source_name")}
-        chunks = chunk_text(extracted.text, chunk_size=chunk_size, overlap=overlap, base_meta=base_meta)
+        Extraction runs in parallel (threads or a process pool, see EXTRACT_MODE),
+        chunks from all documents are pooled into full embedding batches, and SQLite
+        inserts / vector upserts are grouped per window.
+        A document that fails extraction is marked `error` without failing the others.
+        Returns a per-document result (or `{"error": ...}`) keyed by doc id.
+        """
+        docs: dict[str, Document] = {}
+        for it in items:
+            doc = crud.get_document(session, it.doc_id)
+            if doc and doc.kb_id == kb_id:
+                doc.status = "ingesting"
+                session.add(doc)
+                docs[it.doc_id] = doc
+        session.commit()
 
-        if not chunks:
-            doc.status = "error"
+        results: dict[str, dict[str, Any]] = {
+            it.doc_id: {"error": "document not found for kb"} for it in items if it.doc_id not in docs
+        }
+
+        todo: list[IngestItem] = []
+        for it in (it for it in items if it.doc_id in docs):
+            if _file_size(it.raw_path) <= settings.ingest_stream_threshold_bytes:
+                todo.append(it)
+                continue
+            # Very large files bypass pooling so memory stays bounded by one embedding window.
+            doc = docs[it.doc_id]
+            try:
+                diff = self._load_diff(session, kb_id, it.doc_id)
+                results[it.doc_id] = self._ingest_stream(
+                    session=session,
+                    kb_id=kb_id,
+                    item=it,
+                    doc=doc,
+                    diff=diff,
+                    chunk_size=chunk_size,
+                    overlap=overlap,
+                )
+                results[it.doc_id].update(self._finish_diff(session=session, kb_id=kb_id, diff=diff))
+                doc.status = "ready"
+            except Exception as e:  # noqa: BLE001
+                logger.exception("streamed ingestion failed for doc %s", it.doc_id)
+                session.rollback()
+                self._discard(session, kb_id, [it.doc_id])
+                results[it.doc_id] = {"error": str(e)}
+                doc.status = "error"
             session.add(doc)
+            crud.bump_kb_version(session, kb_id)
             session.commit()
-            raise ValueError("no text extracted from document")
 
-        # Persist chunks
-        chunk_rows: list[Chunk] = []
-        for c in chunks:
-            row = Chunk(
-                kb_id=kb_id,
-                doc_id=doc_id,
-                chunk_index=c.index,
-                text=c.text,
-                start_offset=c.start_offset,
-                end_offset=c.end_offset,
-                meta=c.meta,
-            )
-            session.add(row)
-            chunk_rows.append(row)
+        extracted = self._extract.extract_many([(str(it.raw_path), it.content_type) for it in todo])
+        prepared = [self._prepare(kb_id, it, ex, chunk_size, overlap) for it, ex in zip(todo, extracted)]
+
+        ok: list[_Prepared] = []
+        for p in prepared:
+            doc = docs[p.item.doc_id]
+            if p.error:
+                doc.status = "error"
+                session.add(doc)
+                results[p.item.doc_id] = {"error": p.error}
+            else:
+                ok.append(p)
         session.commit()
-        for r in chunk_rows:
-            session.refresh(r)
-
-        # Embed & upsert
-        texts = [r.text for r in chunk_rows]
-        vectors = self._embedder.embed_texts(texts)
-        metadatas = [
-            {
-                "kb_id": kb_id,
-                "doc_id": doc_id,
-                "chunk_id": r.id,
-                "chunk_index": r.chunk_index,
-                "source_name": r.meta.get("source_name") or doc.original_filename,
+
+        try:
+            diffs = {p.item.doc_id: self._load_diff(session, kb_id, p.item.doc_id) for p in ok}
+            dims = self._index(session=session, kb_id=kb_id, prepared=ok, docs=docs, diffs=diffs)
+            diff_stats = {
+                doc_id: self._finish_diff(session=session, kb_id=kb_id, diff=diff) for doc_id, diff in diffs.items()
             }
-            for r in chunk_rows
-        ]
-        self._vs.upsert(kb_id=kb_id, ids=[r.id for r in chunk_rows], vectors=vectors, texts=texts, metadatas=metadatas)
-
-        # Save embedding records
-        dims = len(vectors[0]) if vectors else 0
-        for r in chunk_rows:
-            session.add(
-                EmbeddingRecord(
-                    chunk_id=r.id,
-                    vector_id=r.id,
-                    embedding_model=settings.embedding_model,
-                    dims=dims,
-                )
-            )
+        except Exception as e:
+            session.rollback()
+            self._discard(session, kb_id, [p.item.doc_id for p in ok])
+            for p in ok:
+                doc = docs[p.item.doc_id]
+                doc.status = "error"
+                session.add(doc)
+                results[p.item.doc_id] = {"error": str(e)}
+            # Windows committed before the failure were searchable until the discard.
+            crud.bump_kb_version(session, kb_id)
+            session.commit()
+            raise
+
+        for p in ok:
+            doc = docs[p.item.doc_id]
+            doc.status = "ready"
+            session.add(doc)
+            results[p.item.doc_id] = {
+                "chunks": len(p.chunks),
+                "embedding_dims": dims,
+                "extracted_meta": p.extracted_meta,
+                **diff_stats[p.item.doc_id],
+            }
+        if ok:
+            crud.bump_kb_version(session, kb_id)
         session.commit()
+        return results
+
+    def clone_document(self, *, session: Session, src: Document, doc: Document) -> dict[str, Any]:
+        """
+        Make `doc` a ready copy of the already-ingested `src` (same raw bytes) without
+        extraction or embedding: chunk rows and vectors are copied into doc's KB (vectors are
+        re-embedded if that KB serves another embedding model).
+        """
+        src_rows = crud.list_chunks_for_doc(session, src.id)
+        copy_artifacts(src.kb_id, src.id, doc.kb_id, doc.id)
+
+        dims = 0
+        window = max(1, settings.ingest_embed_window)
+        for i in range(0, len(src_rows), window):
+            part = src_rows[i : i + window]
+            with kb_write_lock(doc.kb_id):
+                # Source vectors are only reusable while both KBs serve the same model.
+                model = self._kb_model(session, doc.kb_id)
+                same_model = self._kb_model(session, src.kb_id) == model
+                found = self._vs.get_vectors(kb_id=src.kb_id, ids=[r.id for r in part]) if same_model else {}
+                missing = [r.text for r in part if r.id not in found]
+                # Vectors absent from the source collection are re-embedded (cache hits in practice).
+                fresh = iter(with_model(self._embedder, model).embed_texts(missing)) if missing else iter(())
+                vectors = np.stack([found[r.id] if r.id in found else next(fresh) for r in part])
+
+                rows = [
+                    Chunk(
+                        kb_id=doc.kb_id,
+                        doc_id=doc.id,
+                        chunk_index=r.chunk_index,
+                        text=r.text,
+                        content_hash=r.content_hash or text_digest(r.text),
+                        start_offset=r.start_offset,
+                        end_offset=r.end_offset,
+                        meta={**r.meta, "doc_id": doc.id},
+                    )
+                    for r in part
+                ]
+                session.add_all(rows)
+                session.flush()
+                fts.index_chunks(session, rows)
+                filters.index_chunks(session, rows)
+
+                source_names = [r.meta.get("source_name") or doc.original_filename for r in rows]
+                self._vs.upsert(
+                    kb_id=doc.kb_id,
+                    ids=[r.id for r in rows],
+                    vectors=vectors,
+                    texts=[r.text for r in rows],
+                    metadatas=[
+                        vector_meta(
+                            kb_id=doc.kb_id,
+                            doc_id=doc.id,
+                            chunk_id=r.id,
+                            chunk_index=r.chunk_index,
+                            source_name=n,
+                            meta=r.meta,
+                        )
+                        for r, n in zip(rows, source_names)
+                    ],
+                )
+
+                dims = int(vectors.shape[1])
+                session.add_all(
+                    [EmbeddingRecord(chunk_id=r.id, vector_id=r.id, embedding_model=model, dims=dims) for r in rows]
+                )
+                crud.record_kb_embedding_model(session, doc.kb_id, model)
+                session.commit()
 
         doc.status = "ready"
         session.add(doc)
+        crud.bump_kb_version(session, doc.kb_id)
         session.commit()
+        return {"chunks": len(src_rows), "embedding_dims": dims, "cloned_from": src.id}
+
+    def _prepare(
+        self,
+        kb_id: str,
+        item: IngestItem,
+        extracted: ExtractedText | Exception,
+        chunk_size: int,
+        overlap: int,
+    ) -> _Prepared:
+        if isinstance(extracted, Exception):
+            logger.error("extraction failed for doc %s: %s", item.doc_id, extracted)
+            return _Prepared(item=item, error=str(extracted))
+        try:
+            write_extracted_text(kb_id, item.doc_id, extracted.text)
+
+            meta = dict(extracted.meta)
+            page_offsets = meta.pop("page_offsets", None) or []
+            chunks = chunk_text(extracted.text, chunk_size=chunk_size, overlap=overlap, base_meta=_base_meta(item, meta))
+            chunks = list(annotate_pages(chunks, page_offsets))
+        except Exception as e:  # noqa: BLE001
+            logger.exception("chunking failed for doc %s", item.doc_id)
+            return _Prepared(item=item, error=str(e))
+
+        if not chunks:
+            return _Prepared(item=item, error="no text extracted from document")
+        return _Prepared(item=item, chunks=chunks, extracted_meta=meta)
+
+    def _ingest_stream(
+        self,
+        *,
+        session: Session,
+        kb_id: str,
+        item: IngestItem,
+        doc: Document,
+        diff: _ChunkDiff,
+        chunk_size: int,
+        overlap: int,
+    ) -> dict[str, Any]:
+        stream = self._extract.extract_stream(path=str(item.raw_path), content_type=item.content_type)
+        meta = dict(stream.meta)
+        page_offsets = meta.pop("page_offsets", None) or []
+        source_name = stream.meta.get("source_name") or doc.original_filename
+
+        n = 0
+        dims = 0
+        with open_extracted_writer(kb_id, item.doc_id) as out:
+
+            def _tee() -> Iterator[str]:
+                for seg in stream.segments:
+                    out.write(seg)
+                    yield seg
+
+            chunks = annotate_pages(
+                chunk_stream(_tee(), chunk_size=chunk_size, overlap=overlap, base_meta=_base_meta(item, meta)),
+                page_offsets,
+            )
+            diffs = {item.doc_id: diff}
+            window: list[tuple[str, TextChunk, str]] = []
+            for c in chunks:
+                window.append((item.doc_id, c, source_name))
+                if len(window) >= settings.ingest_embed_window:
+                    dims = self._index_window(session=session, kb_id=kb_id, entries=window, diffs=diffs) or dims
+                    n += len(window)
+                    window = []
+            if window:
+                dims = self._index_window(session=session, kb_id=kb_id, entries=window, diffs=diffs) or dims
+                n += len(window)
+
+        if not n:
+            raise ValueError("no text extracted from document")
+        return {"chunks": n, "embedding_dims": dims, "extracted_meta": meta}
+
+    def _index(
+        self,
+        *,
+        session: Session,
+        kb_id: str,
+        prepared: list[_Prepared],
+        docs: dict[str, Document],
+        diffs: dict[str, _ChunkDiff],
+    ) -> int:
+        """Persist, embed and upsert the pooled chunks of `prepared` in windows; returns embedding dims."""
+        entries: list[tuple[str, TextChunk, str]] = []
+        for p in prepared:
+            fallback_name = docs[p.item.doc_id].original_filename
+            for c in p.chunks:
+                entries.append((p.item.doc_id, c, c.meta.get("source_name") or fallback_name))
+
+        dims = 0
+        window = max(1, settings.ingest_embed_window)
+        for i in range(0, len(entries), window):
+            part = entries[i : i + window]
+            dims = self._index_window(session=session, kb_id=kb_id, entries=part, diffs=diffs) or dims
+        return dims
+
+    def _kb_model(self, session: Session, kb_id: str) -> str:
+        # Taken from the route the vectors are written through (see RoutedVectorStore), so both agree.
+        embedding_model = getattr(self._vs, "embedding_model", None)
+        return embedding_model(kb_id) if embedding_model is not None else crud.kb_embedding_model(session, kb_id)
+
+    def _load_diff(self, session: Session, kb_id: str, doc_id: str) -> _ChunkDiff:
+        diff = _ChunkDiff()
+        model = self._kb_model(session, kb_id)
+        # A chunk re-embedded with another model before a switch still has its record for this one.
+        for row, row_model in crud.list_chunk_states(session, doc_id, model):
+            if row_model is None:
+                diff.outdated.append(row.id)
+                continue
+            h = row.content_hash or text_digest(row.text)
+            diff.reusable.setdefault(h, []).append(
+                _ExistingChunk(
+                    id=row.id,
+                    chunk_index=row.chunk_index,
+                    start_offset=row.start_offset,
+                    end_offset=row.end_offset,
+                )
+            )
+        return diff
+
+    def _finish_diff(self, *, session: Session, kb_id: str, diff: _ChunkDiff) -> dict[str, int]:
+        """Remove chunks that no longer occur in the document from SQLite and the vector store."""
+        stale = diff.stale_ids()
+        if stale:
+            # Under the KB lock so a re-embedding never writes a vector for a chunk being deleted.
+            with kb_write_lock(kb_id):
+                self._vs.delete(kb_id=kb_id, ids=stale)
+                crud.delete_chunks(session, stale)
+                session.commit()
+        return {"chunks_reused": diff.reused, "chunks_embedded": diff.embedded, "chunks_deleted": len(stale)}
+
+    def _discard(self, session: Session, kb_id: str, doc_ids: list[str]) -> None:
+        """
+        Remove every chunk of documents whose ingestion failed (rows, FTS, filters and vectors).
+
+        Windows commit on their own, so without this a document marked `error` would stay
+        partly searchable.
+        """
+        try:
+            ids = [r.id for doc_id in doc_ids for r in crud.list_chunks_for_doc(session, doc_id)]
+            if not ids:
+                return
+            with kb_write_lock(kb_id):
+                self._vs.delete(kb_id=kb_id, ids=ids)
+                crud.delete_chunks(session, ids)
+                session.commit()
+        except Exception:  # noqa: BLE001
+            logger.exception("could not discard chunks of failed docs %s", doc_ids)
+            session.rollback()
+
+    def _index_window(
+        self,
+        *,
+        session: Session,
+        kb_id: str,
+        entries: list[tuple[str, TextChunk, str]],
+        diffs: dict[str, _ChunkDiff],
+    ) -> int:
+        """
+        Persist, embed and upsert one window of (doc_id, chunk, source_name).
+
+        Chunks whose text already exists for the document keep their row and vector
+        (only their position is refreshed); returns embedding dims, or 0 if nothing
+        was embedded.
+        """
+        rows: list[Chunk] = []
+        sources: list[str] = []
+        moved: list[tuple[_ExistingChunk, TextChunk, str, str]] = []
+        for doc_id, c, source_name in entries:
+            h = text_digest(c.text)
+            diff = diffs[doc_id]
+            old = diff.take(h)
+            if old is None:
+                diff.embedded += 1
+                rows.append(
+                    Chunk(
+                        kb_id=kb_id,
+                        doc_id=doc_id,
+                        chunk_index=c.index,
+                        text=c.text,
+                        content_hash=h,
+                        start_offset=c.start_offset,
+                        end_offset=c.end_offset,
+                        meta=c.meta,
+                    )
+                )
+                sources.append(source_name)
+                continue
+            diff.reused += 1
+            if (old.chunk_index, old.start_offset, old.end_offset) != (c.index, c.start_offset, c.end_offset):
+                moved.append((old, c, doc_id, source_name))
+
+        if moved:
+            crud.update_chunk_positions(
+                session,
+                [
+                    {
+                        "id": old.id,
+                        "chunk_index": c.index,
+                        "start_offset": c.start_offset,
+                        "end_offset": c.end_offset,
+                        "content_hash": text_digest(c.text),
+                        "meta": c.meta,
+                    }
+                    for old, c, _, _ in moved
+                ],
+            )
+            # Page numbers move with the chunk; refresh its filter rows too.
+            moved_rows = [
+                Chunk(id=old.id, kb_id=kb_id, doc_id=doc_id, chunk_index=c.index, text=c.text, meta=c.meta)
+                for old, c, doc_id, _ in moved
+            ]
+            filters.delete_chunks(session, [r.id for r in moved_rows])
+            filters.index_chunks(session, moved_rows)
+            self._vs.update_metadata(
+                kb_id=kb_id,
+                ids=[old.id for old, _, _, _ in moved],
+                metadatas=[
+                    vector_meta(
+                        kb_id=kb_id, doc_id=doc_id, chunk_id=old.id, chunk_index=c.index, source_name=src, meta=c.meta
+                    )
+                    for old, c, doc_id, src in moved
+                ],
+            )
+
+        if not rows:
+            session.commit()
+            return 0
+
+        # The KB's model is resolved under its lock, so a re-embedding cannot switch models between
+        # this window's embedding and its upsert into the serving collection.
+        with kb_write_lock(kb_id):
+            model = self._kb_model(session, kb_id)
+
+            # Persist chunks (ids are generated client-side, so no refresh is needed)
+            session.add_all(rows)
+            session.flush()
+            fts.index_chunks(session, rows)
+            filters.index_chunks(session, rows)
+
+            # Embed & upsert
+            texts = [r.text for r in rows]
+            vectors = with_model(self._embedder, model).embed_texts(texts)
+            metadatas = [
+                vector_meta(
+                    kb_id=kb_id, doc_id=r.doc_id, chunk_id=r.id, chunk_index=r.chunk_index, source_name=src, meta=r.meta
+                )
+                for r, src in zip(rows, sources)
+            ]
+            self._vs.upsert(kb_id=kb_id, ids=[r.id for r in rows], vectors=vectors, texts=texts, metadatas=metadatas)
+
+            # Save embedding records
+            dims = int(vectors.shape[1])
+            session.add_all(
+                [
+                    EmbeddingRecord(
+                        chunk_id=r.id,
+                        vector_id=r.id,
+                        embedding_model=model,
+                        dims=dims,
+                    )
+                    for r in rows
+                ]
+            )
+            crud.record_kb_embedding_model(session, kb_id, model)
+            session.commit()
+        return dims
+
 
-        return {"chunks": len(chunk_rows), "embedding_dims": dims, "extracted_meta": extracted.meta}
+def _base_meta(item: IngestItem, extracted_meta: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "doc_id": item.doc_id,
+        "source_name": extracted_meta.get("source_name"),
+        "source_type": extracted_meta.get("source_type"),
+    }
 
 
-def utcnow() -> datetime:
-    return datetime.now(timezone.utc)
+def vector_meta(
+    *,
+    kb_id: str,
+    doc_id: str,
+    chunk_id: str,
+    chunk_index: int,
+    source_name: str,
+    meta: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    out = {
+        "kb_id": kb_id,
+        "doc_id": doc_id,
+        "chunk_id": chunk_id,
+        "chunk_index": chunk_index,
+        "source_name": source_name,
+    }
+    # Scalar chunk attributes are mirrored for stores that evaluate `where` themselves (Chroma
+    # rejects None values). Tags stay in SQLite: they change without re-ingestion.
+    for key in _VECTOR_META_KEYS:
+        value = (meta or {}).get(key)
+        if value is not None:
+            out[key] = value
+    return out
 
 
+def _file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
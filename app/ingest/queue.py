@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections.abc import Callable
+from typing import Any
+from uuid import uuid4
+
+from app.core.settings import settings
+from app.db import crud
+from app.db.models import IngestionJob, utcnow
+from app.db.session import SessionLocal
+from app.ingest.pipeline import IngestItem, IngestionPipeline
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionWorkerPool:
+    """
+    Durable ingestion queue backed by the `IngestionJob` table.
+
+    Worker threads claim the highest-priority queued job under a lease, keep it alive
+    with heartbeats while the pipeline runs, and any job whose lease lapses (the
+    process died mid-ingest) is requeued by the next claimer. Each worker holds a warm
+    `IngestionPipeline` for its whole lifetime.
+    """
+
+    def __init__(
+        self,
+        pipeline_factory: Callable[[], IngestionPipeline],
+        *,
+        workers: int,
+        lease_s: float,
+        poll_interval_s: float,
+        max_attempts: int,
+    ) -> None:
+        self._pipeline_factory = pipeline_factory
+        self._workers = max(0, workers)
+        self._lease_s = lease_s
+        self._poll_interval_s = poll_interval_s
+        self._max_attempts = max_attempts
+        self._worker_prefix = f"{os.getpid()}-{uuid4().hex[:8]}"
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._claim_lock = threading.Lock()
+        self._active: dict[str, str] = {}  # job_id -> worker_id
+        self._active_lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self._workers):
+            t = threading.Thread(target=self._worker, args=(f"{self._worker_prefix}-{i}",), name=f"ingest-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        if self._workers:
+            hb = threading.Thread(target=self._heartbeat, name="ingest-heartbeat", daemon=True)
+            hb.start()
+            self._threads.append(hb)
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout=timeout)
+        self._threads = []
+
+    def notify(self) -> None:
+        """Wake idle workers after a job was enqueued."""
+        self._wake.set()
+
+    def _claim(self, worker_id: str) -> list[IngestionJob]:
+        with self._claim_lock, SessionLocal() as session:
+            crud.requeue_expired_jobs(session, max_attempts=self._max_attempts)
+            job = crud.claim_next_job(session, worker_id=worker_id, lease_s=self._lease_s)
+            if job is None:
+                return []
+            jobs = [job]
+            if job.batch_id:
+                # Pull the rest of a bulk batch so its chunks share embedding batches.
+                jobs.extend(
+                    crud.claim_batch_jobs(
+                        session,
+                        batch_id=job.batch_id,
+                        worker_id=worker_id,
+                        lease_s=self._lease_s,
+                        limit=settings.ingest_bulk_max_docs - 1,
+                    )
+                )
+            return jobs
+
+    def _worker(self, worker_id: str) -> None:
+        pipeline = self._pipeline_factory()
+        while not self._stop.is_set():
+            try:
+                jobs = self._claim(worker_id)
+            except Exception:  # noqa: BLE001
+                logger.exception("failed to claim ingestion job")
+                jobs = []
+
+            if not jobs:
+                self._wake.wait(timeout=self._poll_interval_s)
+                self._wake.clear()
+                continue
+
+            job_ids = [j.id for j in jobs]
+            with self._active_lock:
+                for job_id in job_ids:
+                    self._active[job_id] = worker_id
+            try:
+                self._process(pipeline, job_ids)
+            finally:
+                with self._active_lock:
+                    for job_id in job_ids:
+                        self._active.pop(job_id, None)
+
+    def _heartbeat(self) -> None:
+        interval = max(1.0, self._lease_s / 3.0)
+        while not self._stop.wait(timeout=interval):
+            with self._active_lock:
+                by_worker: dict[str, list[str]] = {}
+                for job_id, worker_id in self._active.items():
+                    by_worker.setdefault(worker_id, []).append(job_id)
+            try:
+                with SessionLocal() as session:
+                    for worker_id, job_ids in by_worker.items():
+                        crud.extend_job_leases(session, job_ids=job_ids, worker_id=worker_id, lease_s=self._lease_s)
+            except Exception:  # noqa: BLE001
+                logger.exception("failed to renew ingestion job leases")
+
+    def _process(self, pipeline: IngestionPipeline, job_ids: list[str]) -> None:
+        with SessionLocal() as session:
+            jobs = [j for j in (crud.get_job(session, job_id) for job_id in job_ids) if j]
+            if not jobs:
+                return
+
+            errors: dict[str, str] = {}
+            items: list[IngestItem] = []
+            for j in jobs:
+                doc = crud.get_document(session, j.doc_id)
+                if not doc:
+                    errors[j.id] = "document not found"
+                    continue
+                raw_dir = settings.kb_files_dir / j.kb_id / "raw" / j.doc_id
+                # Take the first file in the raw dir (MVP).
+                files = sorted([p for p in raw_dir.glob("*") if p.is_file()])
+                if not files:
+                    errors[j.id] = "no raw file found for document"
+                    continue
+                items.append(IngestItem(doc_id=j.doc_id, raw_path=files[0], content_type=doc.content_type))
+
+            results: dict[str, dict[str, Any]] = {}
+            if items:
+                try:
+                    # All jobs of one claim belong to the same KB (single job or one bulk batch).
+                    results = pipeline.ingest_documents(session=session, kb_id=jobs[0].kb_id, items=items)
+                except Exception as e:
+                    logger.exception("ingestion of %d document(s) failed", len(items))
+                    session.rollback()
+                    results = {it.doc_id: {"error": str(e)} for it in items}
+
+            for doc_id, res in results.items():
+                if "error" not in res:
+                    logger.info(
+                        "ingested doc %s: %s chunks (%s reused, %s embedded, %s deleted)",
+                        doc_id,
+                        res.get("chunks"),
+                        res.get("chunks_reused"),
+                        res.get("chunks_embedded"),
+                        res.get("chunks_deleted"),
+                    )
+
+            now = utcnow()
+            for j in jobs:
+                err = errors.get(j.id) or results.get(j.doc_id, {}).get("error")
+                j.state = "failed" if err else "succeeded"
+                j.error = err
+                j.finished_at = now
+                j.lease_expires_at = None
+                session.add(j)
+            session.commit()
+
+    def stats(self) -> dict[str, Any]:
+        with SessionLocal() as session:
+            out = crud.job_queue_stats(session, window_s=settings.ingest_stats_window_s)
+        with self._active_lock:
+            active = len(self._active)
+        return {**out, "workers": self._workers, "active_in_process": active}
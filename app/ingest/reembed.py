@@ -0,0 +1,419 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable
+from datetime import timedelta
+from typing import Any
+from uuid import uuid4
+
+import numpy as np
+
+from app.core.settings import settings
+from app.db import crud
+from app.db.models import EmbeddingRecord, ReembedJob, utcnow
+from app.db.session import SessionLocal
+from app.embeddings.hf_dense import HuggingFaceDenseEmbedder, with_model
+from app.ingest.pipeline import vector_meta
+from app.vectorstore.routing import RoutedVectorStore, kb_write_lock
+
+logger = logging.getLogger(__name__)
+
+
+class _Released(Exception):
+    """The job was cancelled, requeued by another process, or the worker is stopping."""
+
+
+class ReembedWorker:
+    """
+    Re-embeds whole KBs with another embedding model, one `ReembedJob` at a time.
+
+    Chunk texts are read back from SQLite page by page (no extraction), embedded with the
+    target model and written to a shadow collection generation while the KB keeps serving
+    queries from its current one. The job then embeds whatever was ingested meanwhile (in
+    the same throttled steps) and, under the KB's write lock, switches the KB to the new
+    model and generation in one transaction; the replaced collection is dropped after
+    `reembed_drop_grace_s`.
+
+    The job competes with live question embedding for the same CPU/GPU, so each step first
+    waits until the query embedder has been idle for `reembed_query_idle_ms`, and the job
+    sleeps between steps to stay under `reembed_duty_cycle` of wall time.
+    """
+
+    def __init__(
+        self,
+        *,
+        embedder: HuggingFaceDenseEmbedder,
+        vector_store: RoutedVectorStore,
+        query_idle_s: Callable[[], float] | None = None,
+    ) -> None:
+        self._embedder = embedder
+        self._vs = vector_store
+        self._query_idle_s = query_idle_s or (lambda: float("inf"))
+        self._worker_id = f"{os.getpid()}-{uuid4().hex[:8]}"
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._active: str | None = None
+        self._beat_at = 0.0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        if settings.reembed_auto:
+            with SessionLocal() as session:
+                for job in crud.queue_model_migrations(session, model=settings.embedding_model):
+                    logger.info("queued re-embedding of KB %s: %s -> %s", job.kb_id, job.source_model, job.target_model)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="reembed", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stop after the current step; a running job is put back in the queue and resumes from its cursor."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def notify(self) -> None:
+        """Wake the worker after a job was queued or cancelled."""
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._retire()
+                with SessionLocal() as session:
+                    job = crud.claim_reembed_job(session, worker_id=self._worker_id, stale_s=settings.reembed_lease_s)
+            except Exception:  # noqa: BLE001
+                logger.exception("failed to claim re-embedding job")
+                job = None
+
+            if job is None:
+                self._wake.wait(timeout=settings.reembed_poll_interval_s)
+                self._wake.clear()
+                continue
+
+            self._active = job.id
+            self._beat_at = time.monotonic()
+            try:
+                self._process(job)
+            except _Released:
+                if self._stop.is_set():
+                    # Resumed from its cursor by the next worker to claim it.
+                    with SessionLocal() as session:
+                        crud.update_reembed_job(
+                            session, job.id, claimed_by=self._worker_id, state="queued", worker_id=None
+                        )
+                        session.commit()
+                logger.info("re-embedding job %s released", job.id)
+            except Exception as e:
+                logger.exception("re-embedding job %s failed", job.id)
+                with SessionLocal() as session:
+                    crud.update_reembed_job(
+                        session, job.id, claimed_by=self._worker_id, state="failed", error=str(e), finished_at=utcnow()
+                    )
+                    session.commit()
+            finally:
+                self._active = None
+                self._vs.invalidate(job.kb_id)
+
+    def _process(self, job: ReembedJob) -> None:
+        kb_id, target = job.kb_id, job.target_model
+        # Deletes and metadata updates now reach the shadow too (the claim marked the job running).
+        self._vs.invalidate(kb_id)
+        embedder = with_model(self._embedder, target)
+        logger.info("re-embedding KB %s: %s -> %s (generation %d)", kb_id, job.source_model, target, job.generation)
+
+        cursor = job.cursor
+        slept = 0.0
+        while True:
+            with SessionLocal() as session:
+                page = crud.list_chunks_to_reembed(
+                    session, kb_id=kb_id, model=target, after_rowid=cursor, limit=settings.reembed_page_size
+                )
+                total = crud.count_chunks(session, kb_id)
+            if not page:
+                break
+            step = max(1, settings.reembed_step_size)
+            for i in range(0, len(page), step):
+                part = page[i : i + step]
+                yielded = slept + self._throttle(job)
+                started = time.monotonic()
+                vectors = embedder.embed_texts([text for _, _, text in part])
+                with kb_write_lock(kb_id):
+                    self._write(job, part, vectors, cursor=part[-1][0], total=total, yielded=yielded)
+                slept = self._duty_cycle(job, time.monotonic() - started)
+            cursor = page[-1][0]
+
+        self._switch(job, embedder)
+
+    def _throttle(self, job: ReembedJob) -> float:
+        """Wait (up to reembed_max_yield_s) until no question has been embedded for reembed_query_idle_ms."""
+        idle_s = settings.reembed_query_idle_ms / 1000.0
+        started = time.monotonic()
+        while self._query_idle_s() < idle_s and time.monotonic() - started < settings.reembed_max_yield_s:
+            self._heartbeat(job)
+            if self._stop.wait(timeout=min(0.05, idle_s)):
+                break
+        if self._stop.is_set():
+            raise _Released()
+        return time.monotonic() - started
+
+    def _duty_cycle(self, job: ReembedJob, busy_s: float) -> float:
+        """Sleep so that a step of `busy_s` keeps the job under reembed_duty_cycle; returns the time slept."""
+        duty = min(1.0, max(0.01, settings.reembed_duty_cycle))
+        if duty >= 1.0:
+            return 0.0
+        started = time.monotonic()
+        until = started + busy_s * (1.0 - duty) / duty
+        while (left := until - time.monotonic()) > 0:
+            self._heartbeat(job)
+            if self._stop.wait(timeout=min(left, settings.reembed_lease_s / 4)):
+                break
+        return time.monotonic() - started
+
+    def _heartbeat(self, job: ReembedJob) -> None:
+        """Refresh the job's lease if a quarter of it passed since the last heartbeat (every `_write` is one)."""
+        if time.monotonic() - self._beat_at < settings.reembed_lease_s / 4:
+            return
+        with SessionLocal() as session:
+            held = crud.update_reembed_job(session, job.id, claimed_by=self._worker_id, heartbeat_at=utcnow())
+            session.commit()
+        if not held:
+            raise _Released()
+        self._beat_at = time.monotonic()
+
+    def _write(
+        self,
+        job: ReembedJob,
+        part: list[tuple[int, str, str]],
+        vectors: np.ndarray,
+        *,
+        cursor: int | None,
+        total: int,
+        yielded: float,
+    ) -> int:
+        """
+        Write one embedded step into the job's shadow collection with the target model's records,
+        skipping chunks deleted since they were read. Called under the KB lock.
+        """
+        with SessionLocal() as session:
+            live = crud.chunk_vector_rows(session, [cid for _, cid, _ in part])
+            keep = [i for i, (_, cid, _) in enumerate(part) if cid in live]
+            progress: dict[str, Any] = {} if cursor is None else {"cursor": cursor}
+            held = crud.update_reembed_job(
+                session,
+                job.id,
+                claimed_by=self._worker_id,
+                **progress,
+                total=total,
+                done=ReembedJob.done + len(keep),
+                yielded_s=ReembedJob.yielded_s + yielded,
+                heartbeat_at=utcnow(),
+            )
+            if not held:
+                session.rollback()
+                raise _Released()
+            self._beat_at = time.monotonic()
+            if keep:
+                rows = [live[part[i][1]] for i in keep]
+                self._vs.upsert_generation(
+                    kb_id=job.kb_id,
+                    generation=job.generation,
+                    ids=[c.id for c, _ in rows],
+                    vectors=vectors[keep],
+                    texts=[c.text for c, _ in rows],
+                    metadatas=[
+                        vector_meta(
+                            kb_id=job.kb_id,
+                            doc_id=c.doc_id,
+                            chunk_id=c.id,
+                            chunk_index=c.chunk_index,
+                            source_name=c.meta.get("source_name") or name,
+                            meta=c.meta,
+                        )
+                        for c, name in rows
+                    ],
+                )
+                dims = int(vectors.shape[1])
+                session.add_all(
+                    [
+                        EmbeddingRecord(chunk_id=c.id, vector_id=c.id, embedding_model=job.target_model, dims=dims)
+                        for c, _ in rows
+                    ]
+                )
+            session.commit()
+        return len(keep)
+
+    def _switch(self, job: ReembedJob, embedder: HuggingFaceDenseEmbedder) -> None:
+        kb_id = job.kb_id
+        step = max(1, settings.reembed_step_size)
+        cursor = 0
+        while True:
+            # Chunks ingested since their page was read, embedded outside the lock so ingestion goes on.
+            cursor = self._catch_up(job, embedder, cursor)
+            with kb_write_lock(kb_id):
+                # Ingestion waits on the lock from here on; what it added meanwhile is embedded under the
+                # lock only if it fits in one step, otherwise the lock is released for another pass.
+                with SessionLocal() as session:
+                    rest = crud.list_chunks_to_reembed(
+                        session, kb_id=kb_id, model=job.target_model, after_rowid=cursor, limit=step + 1
+                    )
+                    total = crud.count_chunks(session, kb_id)
+                if len(rest) > step:
+                    continue
+                if rest:
+                    vectors = embedder.embed_texts([text for _, _, text in rest])
+                    self._write(job, rest, vectors, cursor=None, total=total, yielded=0.0)
+                replaced = self._serving(kb_id)
+                with SessionLocal() as session:
+                    now = utcnow()
+                    held = crud.update_reembed_job(
+                        session,
+                        job.id,
+                        claimed_by=self._worker_id,
+                        state="succeeded",
+                        replaced_generation=replaced,
+                        switched_at=now,
+                        finished_at=now,
+                        heartbeat_at=now,
+                    )
+                    if not held:
+                        session.rollback()
+                        raise _Released()
+                    crud.switch_kb_index(session, kb_id=kb_id, model=job.target_model, generation=job.generation)
+                    session.commit()
+                self._vs.invalidate(kb_id)
+            break
+        logger.info("KB %s now serves %s (generation %d)", kb_id, job.target_model, job.generation)
+
+    def _catch_up(self, job: ReembedJob, embedder: HuggingFaceDenseEmbedder, cursor: int) -> int:
+        """
+        Embed the KB's chunks after rowid `cursor` still lacking a target-model record into the shadow,
+        in throttled steps like `_process`; the KB lock is held only to write each step. Returns the
+        rowid reached: chunks `_write` skips (e.g. without a document) are passed over, not retried.
+        """
+        step = max(1, settings.reembed_step_size)
+        slept = 0.0
+        while True:
+            with SessionLocal() as session:
+                page = crud.list_chunks_to_reembed(
+                    session,
+                    kb_id=job.kb_id,
+                    model=job.target_model,
+                    after_rowid=cursor,
+                    limit=settings.reembed_page_size,
+                )
+                total = crud.count_chunks(session, job.kb_id)
+            if not page:
+                return cursor
+            for i in range(0, len(page), step):
+                part = page[i : i + step]
+                yielded = slept + self._throttle(job)
+                started = time.monotonic()
+                vectors = embedder.embed_texts([text for _, _, text in part])
+                with kb_write_lock(job.kb_id):
+                    self._write(job, part, vectors, cursor=None, total=total, yielded=yielded)
+                    cursor = part[-1][0]
+                slept = self._duty_cycle(job, time.monotonic() - started)
+
+    def _retire(self) -> None:
+        """Drop collections no longer served: replaced ones past their grace period, abandoned shadows."""
+        cutoff = utcnow() - timedelta(seconds=settings.reembed_drop_grace_s)
+        with SessionLocal() as session:
+            jobs = crud.list_retirable_reembed_jobs(session, switched_before=cutoff)
+        for job in jobs:
+            with kb_write_lock(job.kb_id), SessionLocal() as session:
+                # Another job's records must survive; it is queued or running on top of this one's result.
+                settled = crud.active_reembed_job(session, job.kb_id) is None
+                serving_model = crud.kb_embedding_model(session, job.kb_id)
+                if job.state == "succeeded":
+                    if settled and serving_model == job.target_model:
+                        self._sweep(job)
+                    dropped = job.replaced_generation
+                else:
+                    # Records of the abandoned shadow.
+                    if settled:
+                        crud.delete_embedding_records(session, kb_id=job.kb_id, model=serving_model, keep=True)
+                    dropped = job.generation
+                    self._vs.invalidate(job.kb_id)
+                if dropped is not None and dropped != self._serving(job.kb_id):
+                    self._vs.drop_generation(kb_id=job.kb_id, generation=dropped)
+                db_job = crud.get_reembed_job(session, job.id)
+                if db_job is not None:
+                    db_job.retired_at = utcnow()
+                    session.add(db_job)
+                session.commit()
+            logger.info("dropped generation %s of KB %s (job %s)", dropped, job.kb_id, job.id)
+
+    def _sweep(self, job: ReembedJob) -> None:
+        """
+        Re-embed chunks written with the replaced model after the switch by another process that
+        had not seen it yet, so nothing is lost when the replaced collection is dropped.
+        """
+        embedder = with_model(self._embedder, job.target_model)
+        cursor = 0
+        while True:
+            with SessionLocal() as session:
+                page = crud.list_chunks_to_reembed(
+                    session,
+                    kb_id=job.kb_id,
+                    model=job.target_model,
+                    after_rowid=cursor,
+                    limit=settings.reembed_page_size,
+                )
+            if not page:
+                break
+            cursor = page[-1][0]
+            vectors = embedder.embed_texts([text for _, _, text in page])
+            with SessionLocal() as session:
+                live = crud.chunk_vector_rows(session, [cid for _, cid, _ in page])
+                keep = [i for i, (_, cid, _) in enumerate(page) if cid in live]
+                rows = [live[page[i][1]] for i in keep]
+                if rows:
+                    self._vs.upsert(
+                        kb_id=job.kb_id,
+                        ids=[c.id for c, _ in rows],
+                        vectors=vectors[keep],
+                        texts=[c.text for c, _ in rows],
+                        metadatas=[
+                            vector_meta(
+                                kb_id=job.kb_id,
+                                doc_id=c.doc_id,
+                                chunk_id=c.id,
+                                chunk_index=c.chunk_index,
+                                source_name=c.meta.get("source_name") or name,
+                                meta=c.meta,
+                            )
+                            for c, name in rows
+                        ],
+                    )
+                    dims = int(vectors.shape[1])
+                    session.add_all(
+                        [
+                            EmbeddingRecord(chunk_id=c.id, vector_id=c.id, embedding_model=job.target_model, dims=dims)
+                            for c, _ in rows
+                        ]
+                    )
+                session.commit()
+        with SessionLocal() as session:
+            crud.delete_embedding_records(session, kb_id=job.kb_id, model=job.target_model, keep=True)
+            session.commit()
+
+    def _serving(self, kb_id: str) -> int:
+        with SessionLocal() as session:
+            return crud.kb_index_route(session, kb_id)[0]
+
+    def stats(self) -> dict[str, Any]:
+        with SessionLocal() as session:
+            out = crud.reembed_job_stats(session)
+        return {**out, "auto": settings.reembed_auto, "active_in_process": self._active, "query_idle_s": self._idle()}
+
+    def _idle(self) -> float | None:
+        idle = self._query_idle_s()
+        return None if idle == float("inf") else round(idle, 3)
@@ -0,0 +1,20 @@
+from __future__ import annotations
+
+from collections.abc import AsyncIterator, Iterator
+from typing import Protocol
+
+
+class LLMClient(Protocol):
+    """
+    Text generation backend used by `/query`. The streaming methods yield text deltas in
+    order; joining them gives what `generate` would have returned. The async methods are
+    what the API routes call; the sync ones serve the Streamlit app and scripts.
+    """
+
+    def generate(self, *, system: str, user: str) -> str: ...
+
+    def generate_stream(self, *, system: str, user: str) -> Iterator[str]: ...
+
+    async def agenerate(self, *, system: str, user: str) -> str: ...
+
+    def agenerate_stream(self, *, system: str, user: str) -> AsyncIterator[str]: ...
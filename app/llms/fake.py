@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import AsyncIterator, Iterator
+
+
+class FakeLLMClient:
+    """
+    Offline stand-in for GeminiClient that streams canned tokens.
+
+    Inject it with `ServiceRegistry(llm=FakeLLMClient([...]))` to exercise `/query` and
+    its streaming variant without an API key; `delay_s` sleeps before each token to mimic
+    generation latency (`asyncio.sleep` on the async methods, so they never hold a thread).
+    """
+
+    def __init__(self, tokens: list[str] | None = None, *, delay_s: float = 0.0) -> None:
+        self.tokens = tokens if tokens is not None else ["Once ", "upon ", "a ", "time."]
+        self.delay_s = delay_s
+        self.calls = 0
+
+    def generate(self, *, system: str, user: str) -> str:
+        return "".join(self.generate_stream(system=system, user=user))
+
+    def generate_stream(self, *, system: str, user: str) -> Iterator[str]:
+        self.calls += 1
+        for token in self.tokens:
+            if self.delay_s:
+                time.sleep(self.delay_s)
+            yield token
+
+    async def agenerate(self, *, system: str, user: str) -> str:
+        return "".join([t async for t in self.agenerate_stream(system=system, user=user)])
+
+    async def agenerate_stream(self, *, system: str, user: str) -> AsyncIterator[str]:
+        self.calls += 1
+        for token in self.tokens:
+            if self.delay_s:
+                await asyncio.sleep(self.delay_s)
+            yield token
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
 import logging
+from collections.abc import AsyncIterator, Iterator
 
 from google import genai
+from google.genai import types
 
 from app.core.settings import settings
 
@@ -13,21 +15,56 @@ class GeminiClient:
     def __init__(self) -> None:
         if not settings.gemini_api_key:
             raise ValueError("GEMINI_API_KEY is not set")
-        self._client = genai.Client(api_key=settings.gemini_api_key)
+        # The SDK timeout (milliseconds) bounds each HTTP request, sync and async alike.
+        self._client = genai.Client(
+            api_key=settings.gemini_api_key,
+            http_options=types.HttpOptions(timeout=int(settings.gemini_timeout_s * 1000)),
+        )
 
     def generate(self, *, system: str, user: str) -> str:
-        # Minimal wrapper around SDK; keeps the door open to add retries/timeouts later.
+        # Minimal wrapper around SDK; keeps the door open to add retries later.
         resp = self._client.models.generate_content(
             model=settings.gemini_model,
-            contents=[
-                {"role": "user", "parts": [{"text": f"{system}\n\n{user}"}]},
-            ],
+            contents=_contents(system, user),
+        )
+        return _text(resp)
+
+    async def agenerate(self, *, system: str, user: str) -> str:
+        """Non-blocking `generate` on the SDK's asyncio client (`client.aio`)."""
+        resp = await self._client.aio.models.generate_content(
+            model=settings.gemini_model,
+            contents=_contents(system, user),
+        )
+        return _text(resp)
+
+    def generate_stream(self, *, system: str, user: str) -> Iterator[str]:
+        """Yield text deltas as the SDK streams them; chunks without text (e.g. safety metadata) are skipped."""
+        for chunk in self._client.models.generate_content_stream(
+            model=settings.gemini_model,
+            contents=_contents(system, user),
+        ):
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+
+    async def agenerate_stream(self, *, system: str, user: str) -> AsyncIterator[str]:
+        stream = await self._client.aio.models.generate_content_stream(
+            model=settings.gemini_model,
+            contents=_contents(system, user),
         )
+        async for chunk in stream:
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+
 
-        text = getattr(resp, "text", None)
-        if not text:
-            # Fallback: try to stringify the whole response for debugging.
-            return str(resp)
-        return text
+def _text(resp: object) -> str:
+    text = getattr(resp, "text", None)
+    if not text:
+        # Fallback: try to stringify the whole response for debugging.
+        return str(resp)
+    return text
 
 
+def _contents(system: str, user: str) -> list[dict]:
+    return [{"role": "user", "parts": [{"text": f"{system}\n\n{user}"}]}]
@@ -4,13 +4,15 @@ from fastapi import FastAPI
 
 from app.api.routes import router as api_router
 from app.core.logging import setup_logging
+from app.core.registry import ServiceRegistry
 from app.core.settings import settings
 from app.db.session import init_db
 
 
-def create_app() -> FastAPI:
+def create_app(services: ServiceRegistry | None = None) -> FastAPI:
     setup_logging()
     app = FastAPI(title=settings.app_name)
+    app.state.services = services or ServiceRegistry()
 
     @app.on_event("startup")
     def _startup() -> None:
@@ -18,6 +20,14 @@ def create_app() -> FastAPI:
         settings.kb_files_dir.mkdir(parents=True, exist_ok=True)
         settings.chroma_dir.mkdir(parents=True, exist_ok=True)
         init_db()
+        if settings.service_warmup:
+            app.state.services.warmup()
+        app.state.services.ingest_queue.start()
+        app.state.services.reembedder.start()
+
+    @app.on_event("shutdown")
+    async def _shutdown() -> None:
+        await app.state.services.aclose()
 
     app.include_router(api_router)
     return app
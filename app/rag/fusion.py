@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+from app.vectorstore.base import VectorSearchResult
+
+
+def reciprocal_rank_fusion(
+    ranked: list[list[VectorSearchResult]],
+    *,
+    weights: list[float],
+    k: int = 60,
+) -> list[VectorSearchResult]:
+    """
+    Weighted reciprocal rank fusion: each list contributes weight / (k + rank) per hit.
+
+    The first occurrence of an id supplies its text/meta; the returned score is the fused score.
+    """
+    fused: dict[str, float] = {}
+    first: dict[str, VectorSearchResult] = {}
+    for results, w in zip(ranked, weights):
+        if w <= 0:
+            continue
+        for rank, r in enumerate(results, start=1):
+            fused[r.id] = fused.get(r.id, 0.0) + w / (k + rank)
+            first.setdefault(r.id, r)
+
+    order = sorted(fused, key=fused.__getitem__, reverse=True)
+    return [VectorSearchResult(id=i, score=fused[i], text=first[i].text, meta=first[i].meta) for i in order]
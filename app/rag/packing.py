@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+
+from app.vectorstore.base import VectorSearchResult
+
+# Knapsack weights are counted in blocks of this many tokens to keep the DP table small.
+_TOKEN_QUANTUM = 8
+
+
+@dataclass
+class Candidate:
+    result: VectorSearchResult
+    relevance: float  # 0..1, from the retrieval order
+    tokens: int
+    start_offset: int | None = None
+    end_offset: int | None = None
+
+    @property
+    def doc_id(self) -> str | None:
+        return self.result.meta.get("doc_id")
+
+
+@dataclass
+class Span:
+    """One or more overlapping/adjacent chunks of the same document, merged into one context."""
+
+    members: list[Candidate]
+    text: str
+    tokens: int
+
+    @property
+    def score(self) -> float:
+        return max(m.result.score for m in self.members)
+
+
+@dataclass
+class PackResult:
+    spans: list[Span]
+    candidates: int
+    deduped: int
+    naive_tokens: int  # top_k candidates by retrieval order, as sent before packing
+    packed_tokens: int
+    merge_saved_tokens: int
+
+
+@dataclass
+class PackingStats:
+    queries: int = 0
+    candidates: int = 0
+    deduped: int = 0
+    naive_tokens: int = 0
+    packed_tokens: int = 0
+    merge_saved_tokens: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, r: PackResult) -> None:
+        with self._lock:
+            self.queries += 1
+            self.candidates += r.candidates
+            self.deduped += r.deduped
+            self.naive_tokens += r.naive_tokens
+            self.packed_tokens += r.packed_tokens
+            self.merge_saved_tokens += r.merge_saved_tokens
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            q = self.queries or 1
+            return {
+                "queries": self.queries,
+                "avg_candidates": self.candidates / q,
+                "avg_deduped": self.deduped / q,
+                "avg_naive_tokens": self.naive_tokens / q,
+                "avg_packed_tokens": self.packed_tokens / q,
+                "avg_tokens_saved": (self.naive_tokens - self.packed_tokens) / q,
+                "avg_merge_saved_tokens": self.merge_saved_tokens / q,
+            }
+
+
+def estimate_tokens(text: str, *, chars_per_token: float) -> int:
+    """Prompt-token estimate; Gemini averages about 4 characters per token for English text."""
+    return max(1, math.ceil(len(text) / chars_per_token))
+
+
+def mmr_order(
+    vectors: np.ndarray,
+    relevance: np.ndarray,
+    *,
+    lambda_: float,
+    dedup_threshold: float,
+) -> tuple[list[int], int]:
+    """
+    Greedy maximal-marginal-relevance order over `vectors` [n, dim].
+
+    `relevance` (0..1) comes from the retrieval order, so hybrid BM25 fusion is respected.
+    Each step picks argmax(lambda * relevance - (1 - lambda) * max cosine to the already
+    picked rows); the running max-similarity is updated with one matrix-vector product per
+    pick. Rows whose cosine to a picked row exceeds `dedup_threshold` are dropped. Returns
+    (picked indices in order, number dropped as duplicates).
+    """
+    n = len(vectors)
+    if n == 0:
+        return [], 0
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    max_sim = np.full(n, -1.0, dtype=np.float32)
+    open_ = np.ones(n, dtype=bool)
+    order: list[int] = []
+    deduped = 0
+    while open_.any():
+        gain = np.where(open_, lambda_ * relevance - (1.0 - lambda_) * np.maximum(max_sim, 0.0), -np.inf)
+        i = int(np.argmax(gain))
+        order.append(i)
+        open_[i] = False
+        sims = unit @ unit[i]
+        np.maximum(max_sim, sims, out=max_sim)
+        dup = open_ & (sims > dedup_threshold)
+        deduped += int(dup.sum())
+        open_ &= ~dup
+    return order, deduped
+
+
+def merge_spans(members: list[Candidate], *, chars_per_token: float) -> list[Span]:
+    """
+    Merge chunks of the same document whose offsets overlap or touch, in reading order.
+
+    `chunk_text` overlaps consecutive chunks on purpose; merging emits the shared text once.
+    Spans keep the rank of their best member.
+    """
+    rank = {id(m): i for i, m in enumerate(members)}
+    by_doc: dict[Any, list[Candidate]] = {}
+    loose: list[Candidate] = []
+    for m in members:
+        if m.doc_id is None or m.start_offset is None or m.end_offset is None:
+            loose.append(m)
+        else:
+            by_doc.setdefault(m.doc_id, []).append(m)
+
+    groups: list[list[Candidate]] = [[m] for m in loose]
+    for chunks in by_doc.values():
+        chunks.sort(key=lambda m: m.start_offset)  # type: ignore[arg-type,return-value]
+        current = [chunks[0]]
+        for m in chunks[1:]:
+            if m.start_offset <= current[-1].end_offset:  # type: ignore[operator]
+                current.append(m)
+            else:
+                groups.append(current)
+                current = [m]
+        groups.append(current)
+
+    spans = []
+    for g in groups:
+        text = g[0].result.text
+        for prev, m in zip(g, g[1:]):
+            overlap = prev.end_offset - m.start_offset  # type: ignore[operator]
+            text = _join_overlapping(text, m.result.text, overlap=overlap)
+        spans.append(Span(members=g, text=text, tokens=estimate_tokens(text, chars_per_token=chars_per_token)))
+    spans.sort(key=lambda s: min(rank[id(m)] for m in s.members))
+    return spans
+
+
+def knapsack(weights: list[int], values: list[float], *, budget: int, max_items: int) -> list[int]:
+    """
+    0/1 knapsack with a cardinality cap: indices maximizing total value with
+    sum(weights) <= budget and at most `max_items` items. Weights are in tokens.
+    """
+    n = len(weights)
+    cap = max(0, budget) // _TOKEN_QUANTUM
+    w = [math.ceil(x / _TOKEN_QUANTUM) for x in weights]
+    k = max(0, min(max_items, n))
+    neg = -np.inf
+    best = np.full((k + 1, cap + 1), neg)
+    best[0, :] = 0.0
+    take = np.zeros((n, k + 1, cap + 1), dtype=bool)
+    for i in range(n):
+        wi, vi = w[i], values[i]
+        if wi > cap:
+            continue
+        # Candidate value of taking item i on top of (c - 1 items, weight - wi); vectorized over c and weight.
+        with_i = np.full_like(best, neg)
+        with_i[1:, wi:] = best[:-1, : cap + 1 - wi] + vi
+        improved = with_i > best
+        take[i] = improved
+        best = np.where(improved, with_i, best)
+
+    c, b = np.unravel_index(int(np.argmax(best)), best.shape)
+    if not np.isfinite(best[c, b]) or best[c, b] <= 0:
+        return []
+    picked = []
+    for i in range(n - 1, -1, -1):
+        if c > 0 and take[i, c, b]:
+            picked.append(i)
+            b -= w[i]
+            c -= 1
+    return sorted(picked)
+
+
+def pack(
+    candidates: list[Candidate],
+    vectors: np.ndarray | None,
+    *,
+    top_k: int,
+    budget_tokens: int,
+    lambda_: float,
+    dedup_threshold: float,
+    chars_per_token: float,
+) -> PackResult:
+    """
+    Pick up to `top_k` chunks from over-fetched, relevance-ordered `candidates` and merge
+    neighbours, so the merged contexts fit `budget_tokens`.
+
+    MMR (when vectors are available) orders and de-duplicates the candidates; a knapsack
+    then chooses the subset with the highest rank-discounted value that fits the budget,
+    instead of stopping at the first chunk that does not. Budget freed by merging
+    overlapping neighbours is refilled in MMR order.
+    """
+    naive = candidates[:top_k]
+    naive_tokens = sum(c.tokens for c in naive)
+
+    deduped = 0
+    if vectors is not None and len(candidates) > 1:
+        rel = np.array([c.relevance for c in candidates], dtype=np.float32)
+        order, deduped = mmr_order(vectors, rel, lambda_=lambda_, dedup_threshold=dedup_threshold)
+        ordered = [candidates[i] for i in order]
+    else:
+        ordered = list(candidates)
+
+    # Rank-discounted values keep the knapsack close to the MMR order while letting it
+    # swap one oversized chunk for smaller ones that together fit.
+    values = [1.0 / (1.0 + i) for i in range(len(ordered))]
+    chosen = knapsack([c.tokens for c in ordered], values, budget=budget_tokens, max_items=top_k)
+    members = [ordered[i] for i in chosen]
+    spans = merge_spans(members, chars_per_token=chars_per_token)
+
+    # Merging frees the overlap; top up with the next candidates that still fit.
+    chosen_set = set(chosen)
+    for i, c in enumerate(ordered):
+        if len(members) >= top_k:
+            break
+        if i in chosen_set:
+            continue
+        trial = merge_spans(members + [c], chars_per_token=chars_per_token)
+        if sum(s.tokens for s in trial) <= budget_tokens:
+            members.append(c)
+            chosen_set.add(i)
+            spans = trial
+
+    packed_tokens = sum(s.tokens for s in spans)
+    member_tokens = sum(m.tokens for m in members)
+    return PackResult(
+        spans=spans,
+        candidates=len(candidates),
+        deduped=deduped,
+        naive_tokens=naive_tokens,
+        packed_tokens=packed_tokens,
+        merge_saved_tokens=max(0, member_tokens - packed_tokens),
+    )
+
+
+def _join_overlapping(a: str, b: str, *, overlap: int) -> str:
+    """Append `b` to `a`, dropping the prefix of `b` that repeats the end of `a` (chunk texts are stripped)."""
+    if overlap > 0:
+        # Longest match first; stripping can only shorten the shared text a little.
+        for n in range(min(overlap, len(a), len(b)), overlap // 2, -1):
+            if a.endswith(b[:n]):
+                return a + b[n:]
+    return f"{a}\n{b}"
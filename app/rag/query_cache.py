@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from app.core.settings import settings
+
+
+class TTLCache:
+    """Thread-safe LRU map whose entries also expire `ttl_s` seconds after being stored."""
+
+    def __init__(self, *, max_items: int, ttl_s: float) -> None:
+        self._max_items = max(1, max_items)
+        self._ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._items: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, key: Any) -> Any | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._items[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._items[key] = (time.monotonic() + self._ttl_s, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self._max_items:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "entries": len(self._items),
+                "max_items": self._max_items,
+                "ttl_s": self._ttl_s,
+            }
+
+
+class QueryCache:
+    """
+    Two-level `/query` cache.
+
+    Level 1 maps (kb_id, KB version, normalized question, top_k, filters) to retrieved
+    contexts, skipping the question embedding and vector/lexical search. Level 2
+    (optional) maps a hash of the model and full prompt to the Gemini answer; since the
+    prompt embeds the contexts, a changed KB yields a different prompt. Ingestion bumps
+    the KB version, so entries from before it are never looked up again and age out.
+    """
+
+    def __init__(self, *, max_items: int, ttl_s: float, answers: bool) -> None:
+        self.contexts = TTLCache(max_items=max_items, ttl_s=ttl_s)
+        self.answers = TTLCache(max_items=max_items, ttl_s=ttl_s) if answers else None
+
+    @staticmethod
+    def context_key(
+        *, kb_id: str, kb_version: int, question: str, top_k: int | None, filters: dict[str, Any] | None
+    ) -> tuple[str, int, str, int, str]:
+        return (
+            kb_id,
+            kb_version,
+            normalize_question(question),
+            top_k or settings.rag_top_k,
+            json.dumps(filters or {}, sort_keys=True, default=str),
+        )
+
+    @staticmethod
+    def answer_key(*, model: str, system: str, user: str) -> str:
+        h = hashlib.sha256()
+        for part in (model, system, user):
+            h.update(part.encode("utf-8"))
+            h.update(b"\x00")
+        return h.hexdigest()
+
+    def get_contexts(self, key: tuple[str, int, str, int, str]) -> list[dict[str, Any]] | None:
+        return self.contexts.get(key)
+
+    def put_contexts(self, key: tuple[str, int, str, int, str], contexts: list[dict[str, Any]]) -> None:
+        self.contexts.put(key, contexts)
+
+    def get_answer(self, key: str) -> str | None:
+        return self.answers.get(key) if self.answers is not None else None
+
+    def put_answer(self, key: str, answer: str) -> None:
+        if self.answers is not None:
+            self.answers.put(key, answer)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "contexts": self.contexts.stats(),
+            "answers": self.answers.stats() if self.answers is not None else {"enabled": False},
+        }
+
+
+def normalize_question(question: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation so trivial variants share an entry."""
+    return " ".join(question.casefold().split()).rstrip(" ?!.")
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import threading
+import time
+from functools import lru_cache
+from typing import Any
+
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from app.core.settings import settings
+from app.rag.query_cache import TTLCache
+from app.vectorstore.base import VectorSearchResult
+
+
+@lru_cache(maxsize=1)
+def _load() -> tuple[AutoTokenizer, AutoModelForSequenceClassification, torch.device]:
+    device = torch.device(settings.rerank_device)
+    tok = AutoTokenizer.from_pretrained(settings.rerank_model)
+    model = AutoModelForSequenceClassification.from_pretrained(settings.rerank_model)
+    model.eval()
+    model.to(device)
+    return tok, model, device
+
+
+class CrossEncoderReranker:
+    """
+    Re-scores (question, chunk) pairs with a local HF cross-encoder.
+
+    Only the top `rerank_candidates` hits are considered, in batches of
+    `rerank_batch_size`, in retrieval order. Once the per-query budget is spent, or the
+    next batch is predicted to overrun it, the remaining candidates keep their retrieval
+    order below the re-scored ones. Scores are cached per (question digest, chunk id), so a
+    repeated or paginated question only scores chunks it has not seen.
+    """
+
+    def __init__(self, *, cache: TTLCache | None = None) -> None:
+        self._cache = cache or TTLCache(max_items=settings.rerank_cache_items, ttl_s=settings.rerank_cache_ttl_s)
+        self._stats_lock = threading.Lock()
+        self.queries = 0
+        self.pairs_scored = 0
+        self.pairs_cached = 0
+        self.budget_cutoffs = 0
+        self.total_ms = 0.0
+
+    def rerank(
+        self, question: str, results: list[VectorSearchResult], *, budget_ms: float | None = None
+    ) -> list[VectorSearchResult]:
+        if not results:
+            return results
+        started = time.perf_counter()
+        budget_s = (settings.rerank_budget_ms if budget_ms is None else budget_ms) / 1000.0
+        head = results[: settings.rerank_candidates]
+        tail = results[settings.rerank_candidates :]
+
+        qkey = _question_digest(question)
+        scores: dict[str, float] = {}
+        pending: list[VectorSearchResult] = []
+        for r in head:
+            cached = self._cache.get((qkey, r.id))
+            if cached is None:
+                pending.append(r)
+            else:
+                scores[r.id] = cached
+        n_cached = len(scores)
+
+        cut = False
+        per_pair_s = 0.0
+        batch_size = max(1, settings.rerank_batch_size)
+        for i in range(0, len(pending), batch_size):
+            batch = pending[i : i + batch_size]
+            elapsed = time.perf_counter() - started
+            if elapsed + per_pair_s * len(batch) > budget_s:
+                cut = True
+                break
+            t = time.perf_counter()
+            for r, s in zip(batch, self._score(question, [r.text for r in batch])):
+                scores[r.id] = s
+                self._cache.put((qkey, r.id), s)
+            per_pair_s = (time.perf_counter() - t) / len(batch)
+
+        with self._stats_lock:
+            self.queries += 1
+            self.pairs_scored += len(scores) - n_cached
+            self.pairs_cached += n_cached
+            self.budget_cutoffs += int(cut)
+            self.total_ms += (time.perf_counter() - started) * 1000.0
+
+        if not scores:
+            return results
+        scored = sorted((r for r in head if r.id in scores), key=lambda r: scores[r.id], reverse=True)
+        unscored = [r for r in head if r.id not in scores] + tail
+        # Keep scores monotonic in the returned order: unscored hits sit just below the lowest re-scored one.
+        floor = min(scores.values())
+        return [dataclasses.replace(r, score=scores[r.id]) for r in scored] + [
+            dataclasses.replace(r, score=floor - 1.0 - i) for i, r in enumerate(unscored)
+        ]
+
+    def _score(self, question: str, texts: list[str]) -> list[float]:
+        tok, model, device = _load()
+        enc = tok(
+            [question] * len(texts),
+            texts,
+            padding=True,
+            truncation="only_second",
+            max_length=settings.rerank_max_length,
+            return_tensors="pt",
+        )
+        enc = {k: v.to(device) for k, v in enc.items()}
+        with torch.no_grad():
+            logits = model(**enc).logits
+        # Single-logit relevance heads (ms-marco style); otherwise use the last class.
+        return logits[:, -1].float().cpu().tolist()
+
+    def warmup(self) -> None:
+        self._score("warmup", ["warmup"])
+
+    def stats(self) -> dict[str, Any]:
+        with self._stats_lock:
+            q = self.queries or 1
+            return {
+                "model": settings.rerank_model,
+                "queries": self.queries,
+                "pairs_scored": self.pairs_scored,
+                "pairs_cached": self.pairs_cached,
+                "budget_cutoffs": self.budget_cutoffs,
+                "avg_ms": self.total_ms / q,
+                "cache": self._cache.stats(),
+            }
+
+
+def _question_digest(question: str) -> str:
+    return hashlib.sha256(f"{settings.rerank_model}\x00{question}".encode("utf-8")).hexdigest()
@@ -1,16 +1,72 @@
 from __future__ import annotations
 
-from typing import Any
+import asyncio
+import dataclasses
+import inspect
+import logging
+from collections.abc import Awaitable
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
 
 from app.core.settings import settings
-from app.embeddings.hf_dense import HuggingFaceDenseEmbedder
-from app.vectorstore.chroma import ChromaVectorStore
+from app.db import crud, filters, fts
+from app.db.session import SessionLocal
+from app.embeddings.hf_dense import HuggingFaceDenseEmbedder, with_model
+from app.rag.fusion import reciprocal_rank_fusion
+from app.rag.packing import Candidate, PackingStats, estimate_tokens, pack
+from app.vectorstore.base import VectorSearchResult, VectorStore
+from app.vectorstore.factory import create_vector_store
+
+if TYPE_CHECKING:
+    from app.rag.reranker import CrossEncoderReranker
+
+logger = logging.getLogger(__name__)
+
+# Without the SQLite pre-filter, only flat equality on these keys (present on both vectors and
+# FTS rows) can be applied to lexical hits; other `where` clauses fall back to dense-only retrieval.
+_LEXICAL_FILTER_KEYS = {"kb_id", "doc_id", "chunk_id", "chunk_index", "source_name"}
+# Chunk attributes copied onto lexical hits, matching the vector metadata.
+_LEXICAL_META_KEYS = ("source_type", "page_start", "page_end")
+# Metadata keys every vector carries (see `vector_meta` in the ingestion pipeline); tags are SQLite-only.
+_STORE_FILTER_KEYS = _LEXICAL_FILTER_KEYS | set(_LEXICAL_META_KEYS)
 
 
 class RetrievalService:
-    def __init__(self) -> None:
-        self._embedder = HuggingFaceDenseEmbedder()
-        self._vs = ChromaVectorStore()
+    def __init__(
+        self,
+        *,
+        embedder: HuggingFaceDenseEmbedder | None = None,
+        vector_store: VectorStore | None = None,
+        executor: Executor | None = None,
+        reranker: CrossEncoderReranker | None = None,
+    ) -> None:
+        self._embedder = embedder or HuggingFaceDenseEmbedder()
+        self._vs = vector_store or create_vector_store()
+        self._executor = executor
+        self._owns_executor = executor is None
+        self.packing_stats = PackingStats()
+        if reranker is None and settings.rerank_enabled:
+            from app.rag.reranker import CrossEncoderReranker
+
+            reranker = CrossEncoderReranker()
+        self.reranker = reranker
+
+    @property
+    def executor(self) -> Executor:
+        """Bounded pool for the async path's vector and BM25 searches (kept off the request threadpool)."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(1, settings.query_retrieval_threads), thread_name_prefix="retrieval"
+            )
+        return self._executor
+
+    def close(self) -> None:
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
 
     def retrieve(
         self,
@@ -20,31 +76,379 @@ class RetrievalService:
         top_k: int | None = None,
         where: dict[str, Any] | None = None,
     ) -> list[dict[str, Any]]:
-        qv = self._embedder.embed_texts([question])[0]
-        results = self._vs.query(
-            kb_id=kb_id,
-            query_vector=qv,
-            top_k=top_k or settings.rag_top_k,
-            where=where,
+        qv = with_model(self._embedder, self.embedding_model(kb_id)).embed_texts([question])[0]
+        return self.retrieve_with_vector(kb_id=kb_id, query_vector=qv, question=question, top_k=top_k, where=where)
+
+    def embedding_model(self, kb_id: str) -> str:
+        """Model the KB's questions must be embedded with to search its vectors."""
+        embedding_model = getattr(self._vs, "embedding_model", None)
+        if embedding_model is not None:
+            return embedding_model(kb_id)
+        with SessionLocal() as session:
+            return crud.kb_embedding_model(session, kb_id)
+
+    def retrieve_with_vector(
+        self,
+        *,
+        kb_id: str,
+        query_vector: np.ndarray,
+        question: str | None = None,
+        top_k: int | None = None,
+        where: dict[str, Any] | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Like `retrieve`, for callers that already embedded the question (e.g. via the micro-batcher).
+
+        When `question` is given and hybrid retrieval is enabled, dense hits are fused
+        with BM25 hits from the KB's FTS5 index via weighted reciprocal rank fusion. With
+        `rag_packing`, the over-fetched hits are then packed into the context token budget
+        (see `app.rag.packing.pack`). `where` may first be resolved to candidate chunk ids
+        in SQLite, per `rag_filter_prefilter` (see `app.db.filters`).
+        """
+        k, hybrid, n_candidates = _plan(question, top_k, where)
+        ids, store_where = self._candidates(kb_id, where)
+        results = self._dense(kb_id, query_vector, n_candidates, store_where, question, ids)
+        lexical = None
+        if hybrid:
+            assert question is not None
+            lexical = self._lexical(kb_id=kb_id, question=question, limit=n_candidates, where=where)
+        return self._finish(kb_id, question, results, lexical, k)
+
+    async def aretrieve_with_vector(
+        self,
+        *,
+        kb_id: str,
+        query_vector: np.ndarray | Awaitable[np.ndarray],
+        question: str | None = None,
+        top_k: int | None = None,
+        where: dict[str, Any] | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Async `retrieve_with_vector`: searches run on `executor`, and the BM25 search and the
+        filter pre-pass are started before `query_vector` is awaited, so they overlap the
+        question embedding.
+        """
+        loop = asyncio.get_running_loop()
+        k, hybrid, n_candidates = _plan(question, top_k, where)
+        ids_fut = loop.run_in_executor(self.executor, self._candidates, kb_id, where) if where else None
+        lexical_fut = None
+        if hybrid:
+            assert question is not None
+            lexical_fut = loop.run_in_executor(
+                self.executor, partial(self._lexical, kb_id=kb_id, question=question, limit=n_candidates, where=where)
+            )
+        try:
+            if inspect.isawaitable(query_vector):
+                query_vector = await query_vector
+            ids, store_where = await ids_fut if ids_fut is not None else (None, where)
+            results = await loop.run_in_executor(
+                self.executor, self._dense, kb_id, query_vector, n_candidates, store_where, question, ids
+            )
+            lexical = await lexical_fut if lexical_fut is not None else None
+            # Packing reads chunk offsets from SQLite and candidate vectors from the store.
+            return await loop.run_in_executor(self.executor, self._finish, kb_id, question, results, lexical, k)
+        finally:
+            for fut in (ids_fut, lexical_fut):
+                if fut is not None and not fut.done():
+                    fut.cancel()
+
+    def _finish(
+        self,
+        kb_id: str,
+        question: str | None,
+        results: list[VectorSearchResult],
+        lexical: list[VectorSearchResult] | None,
+        k: int,
+    ) -> list[dict[str, Any]]:
+        """Fuse dense and lexical hits (when lexical search ran), re-rank, then pack them into contexts."""
+        return self._select(kb_id, question, _fuse(results, lexical), k)
+
+    def _select(
+        self, kb_id: str, question: str | None, results: list[VectorSearchResult], k: int
+    ) -> list[dict[str, Any]]:
+        if self.reranker is not None and question:
+            results = self.reranker.rerank(question, results)
+        if not settings.rag_packing:
+            return _pack_by_chars(results, k)
+        return self._pack(kb_id, results[: k * max(1, settings.rag_pack_overfetch)], k)
+
+    async def afederated_retrieve(
+        self,
+        *,
+        kb_ids: list[str],
+        questions: list[str],
+        query_vectors: np.ndarray | dict[str, np.ndarray],
+        top_k: int | None = None,
+        where: dict[str, Any] | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Retrieve for several questions (`query_vectors` row i embeds `questions[i]`) across
+        several KBs, and merge everything into one packed context list. KBs serving different
+        embedding models need their own question vectors: pass them per KB id.
+
+        Each KB is searched once for all questions (`query_many` where the store has it),
+        and every KB search and BM25 search runs concurrently on `executor`, so latency
+        tracks the slowest single search rather than their sum. Each (KB, question) hit
+        list is fused as in `retrieve_with_vector`, then min-max normalized, since raw
+        scores are not comparable across collections (index layout, hit-list length and
+        RRF all shift them); a chunk found by several questions keeps its best normalized
+        score. The merged list is re-ranked against `questions[0]` and packed.
+        """
+        loop = asyncio.get_running_loop()
+        k, hybrid, n_candidates = _plan(questions[0], top_k, where)
+        dense = [
+            loop.run_in_executor(
+                self.executor,
+                partial(
+                    self._query_many,
+                    kb_id,
+                    query_vectors[kb_id] if isinstance(query_vectors, dict) else query_vectors,
+                    questions,
+                    n_candidates,
+                    where,
+                ),
+            )
+            for kb_id in kb_ids
+        ]
+        lexical = [
+            loop.run_in_executor(
+                self.executor, partial(self._lexical, kb_id=kb_id, question=q, limit=n_candidates, where=where)
+            )
+            for kb_id in kb_ids
+            for q in (questions if hybrid else [])
+        ]
+        try:
+            dense_hits, lexical_hits = await asyncio.gather(asyncio.gather(*dense), asyncio.gather(*lexical))
+        finally:
+            for fut in [*dense, *lexical]:
+                fut.cancel()
+
+        lists = []
+        for i, per_question in enumerate(dense_hits):
+            for j, results in enumerate(per_question):
+                lists.append(_fuse(results, lexical_hits[i * len(questions) + j] if hybrid else None))
+        merged = _merge_normalized(lists)
+        return await loop.run_in_executor(self.executor, self._select, kb_ids[0], questions[0], merged, k)
+
+    def _query_many(
+        self,
+        kb_id: str,
+        query_vectors: np.ndarray,
+        questions: list[str],
+        top_k: int,
+        where: dict[str, Any] | None,
+    ) -> list[list[VectorSearchResult]]:
+        ids, where = self._candidates(kb_id, where)
+        if ids is not None and not ids:
+            return [[] for _ in questions]
+        query_many = getattr(self._vs, "query_many", None)
+        if query_many is not None:
+            return query_many(
+                kb_id=kb_id, query_vectors=query_vectors, top_k=top_k, where=where, ids=ids, query_texts=questions
+            )
+        return [
+            self._vs.query(kb_id=kb_id, query_vector=qv, top_k=top_k, where=where, query_text=q, ids=ids)
+            for qv, q in zip(query_vectors, questions)
+        ]
+
+    def _candidates(
+        self, kb_id: str, where: dict[str, Any] | None
+    ) -> tuple[list[str] | None, dict[str, Any] | None]:
+        """
+        Split `where` between the SQLite pre-filter and the vector store: returns the chunk ids
+        of `kb_id` matching the pre-filtered part (None when nothing is pre-filtered) and the
+        part the store should still evaluate.
+
+        In `auto` mode, top-level conditions on keys the store indexes itself stay with the
+        store, whose columnar metadata mask beats an id round trip for broad conditions
+        (benchmarks/filtered_query.py); only the rest (e.g. `tags`) goes to SQLite.
+        """
+        mode = settings.rag_filter_prefilter
+        if not where or mode == "off" or not filters.supports(where):
+            return None, where
+        sql_part, store_part = [where], []
+        if mode == "auto":
+            conjuncts = [
+                sub for key, cond in where.items() for sub in (cond if key == "$and" else [{key: cond}])
+            ]
+            sql_part = [c for c in conjuncts if not filters.keys(c) <= _STORE_FILTER_KEYS]
+            store_part = [c for c in conjuncts if filters.keys(c) <= _STORE_FILTER_KEYS]
+            if not sql_part:
+                return None, where
+        with SessionLocal() as session:
+            ids = filters.matching_chunk_ids(session, kb_id=kb_id, where=_conjoin(sql_part))
+        return ids, (_conjoin(store_part) if store_part else None)
+
+    def _dense(
+        self,
+        kb_id: str,
+        query_vector: np.ndarray,
+        top_k: int,
+        where: dict[str, Any] | None,
+        question: str | None,
+        ids: list[str] | None,
+    ) -> list[VectorSearchResult]:
+        if ids is not None and not ids:
+            return []
+        return self._vs.query(
+            kb_id=kb_id, query_vector=query_vector, top_k=top_k, where=where, query_text=question, ids=ids
         )
 
-        contexts: list[dict[str, Any]] = []
-        total = 0
+    def _pack(self, kb_id: str, results: list[VectorSearchResult], k: int) -> list[dict[str, Any]]:
+        if not results:
+            return []
+        ids = [r.id for r in results]
+        # Federated results span several KBs; vectors live in each hit's own collection.
+        by_kb: dict[str, list[str]] = {}
         for r in results:
-            citation = r.meta.get("source_name") or r.meta.get("doc_id") or r.id
-            text = r.text
-            if total + len(text) > settings.rag_max_context_chars:
-                break
-            total += len(text)
-            contexts.append(
-                {
-                    "id": r.id,
-                    "score": r.score,
-                    "text": text,
-                    "meta": r.meta,
-                    "citation": citation,
-                }
+            by_kb.setdefault(r.meta.get("kb_id") or kb_id, []).append(r.id)
+        models: set[str] = set()
+        try:
+            with SessionLocal() as session:
+                offsets = crud.get_chunk_offsets(session, ids)
+                if len(by_kb) > 1:
+                    models = {crud.kb_embedding_model(session, owner) for owner in by_kb}
+        except Exception:  # noqa: BLE001
+            logger.exception("chunk offset lookup failed; packing without merging neighbours")
+            offsets = {}
+        vectors = None
+        # Vectors of KBs on different embedding models are not comparable; MMR is skipped then.
+        if len(models) <= 1:
+            found: dict[str, np.ndarray] = {}
+            for owner, owner_ids in by_kb.items():
+                found.update(self._vs.get_vectors(kb_id=owner, ids=owner_ids))
+            vectors = np.stack([found[i] for i in ids]) if all(i in found for i in ids) else None
+
+        cpt = settings.rag_chars_per_token
+        candidates = [
+            Candidate(
+                result=r,
+                relevance=rel,
+                tokens=estimate_tokens(r.text, chars_per_token=cpt),
+                start_offset=offsets.get(r.id, (None, None))[0],
+                end_offset=offsets.get(r.id, (None, None))[1],
             )
+            for r, rel in zip(results, _relevance(results))
+        ]
+        packed = pack(
+            candidates,
+            vectors,
+            top_k=k,
+            budget_tokens=settings.rag_context_token_budget,
+            lambda_=settings.rag_pack_mmr_lambda,
+            dedup_threshold=settings.rag_pack_dedup_threshold,
+            chars_per_token=cpt,
+        )
+        self.packing_stats.record(packed)
+
+        contexts = []
+        for span in packed.spans:
+            best = max(span.members, key=lambda m: m.result.score).result
+            ctx = _context(best, text=span.text, score=span.score)
+            if len(span.members) > 1:
+                ctx["merged_ids"] = [m.result.id for m in span.members]
+            contexts.append(ctx)
         return contexts
 
+    def _lexical(
+        self,
+        *,
+        kb_id: str,
+        question: str,
+        limit: int,
+        where: dict[str, Any] | None,
+    ) -> list[VectorSearchResult]:
+        in_sql = settings.rag_filter_prefilter != "off" and filters.supports(where)
+        try:
+            with SessionLocal() as session:
+                hits = fts.search(session, kb_id=kb_id, question=question, limit=limit, where=where if in_sql else None)
+        except Exception:  # noqa: BLE001
+            logger.exception("lexical search failed; using dense results only")
+            return []
+
+        out: list[VectorSearchResult] = []
+        for h in hits:
+            meta = {
+                **{key: h["meta"][key] for key in _LEXICAL_META_KEYS if key in h["meta"]},
+                "kb_id": kb_id,
+                "doc_id": h["doc_id"],
+                "chunk_id": h["id"],
+                "chunk_index": h["chunk_index"],
+                "source_name": h["source_name"],
+            }
+            if not in_sql and where and any(meta.get(key) != value for key, value in where.items()):
+                continue
+            out.append(VectorSearchResult(id=h["id"], score=h["score"], text=h["text"], meta=meta))
+        return out
+
+
+def _lexical_filter_ok(where: dict[str, Any] | None) -> bool:
+    if not where:
+        return True
+    if settings.rag_filter_prefilter != "off" and filters.supports(where):
+        return True
+    return all(k in _LEXICAL_FILTER_KEYS and not isinstance(v, dict) for k, v in where.items())
+
+
+def _conjoin(clauses: list[dict[str, Any]]) -> dict[str, Any]:
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _fuse(results: list[VectorSearchResult], lexical: list[VectorSearchResult] | None) -> list[VectorSearchResult]:
+    if not lexical:
+        return results
+    weight = settings.rag_hybrid_lexical_weight
+    return reciprocal_rank_fusion([results, lexical], weights=[1.0 - weight, weight], k=settings.rag_rrf_k)
+
+
+def _merge_normalized(lists: list[list[VectorSearchResult]]) -> list[VectorSearchResult]:
+    """Min-max normalize each hit list to 0..1, keep each chunk's best score, and sort."""
+    best: dict[str, VectorSearchResult] = {}
+    for results in lists:
+        if not results:
+            continue
+        for r, rel in zip(results, _relevance(results)):
+            seen = best.get(r.id)
+            if seen is None or rel > seen.score:
+                best[r.id] = dataclasses.replace(r, score=rel)
+    return sorted(best.values(), key=lambda r: r.score, reverse=True)
+
+
+def _plan(question: str | None, top_k: int | None, where: dict[str, Any] | None) -> tuple[int, bool, int]:
+    """(k, whether to fuse BM25 hits, dense/lexical candidates to fetch)."""
+    k = top_k or settings.rag_top_k
+    hybrid = bool(question) and settings.rag_hybrid_lexical_weight > 0 and _lexical_filter_ok(where)
+    n = k * max(1, settings.rag_pack_overfetch) if settings.rag_packing else k
+    if settings.rerank_enabled and question:
+        n = max(n, settings.rerank_candidates)
+    return k, hybrid, (max(n, settings.rag_hybrid_candidates) if hybrid else n)
+
+
+def _context(r: VectorSearchResult, *, text: str | None = None, score: float | None = None) -> dict[str, Any]:
+    return {
+        "id": r.id,
+        "score": r.score if score is None else score,
+        "text": r.text if text is None else text,
+        "meta": r.meta,
+        "citation": r.meta.get("source_name") or r.meta.get("doc_id") or r.id,
+    }
+
+
+def _pack_by_chars(results: list[VectorSearchResult], k: int) -> list[dict[str, Any]]:
+    contexts: list[dict[str, Any]] = []
+    total = 0
+    for r in results[:k]:
+        if total + len(r.text) > settings.rag_max_context_chars:
+            break
+        total += len(r.text)
+        contexts.append(_context(r))
+    return contexts
+
 
+def _relevance(results: list[VectorSearchResult]) -> list[float]:
+    """Min-max scaled scores in retrieval order (dense distances or fused RRF scores alike)."""
+    scores = np.array([r.score for r in results], dtype=np.float64)
+    lo, hi = float(scores.min()), float(scores.max())
+    if hi - lo < 1e-12:
+        return [1.0] * len(results)
+    return ((scores - lo) / (hi - lo)).tolist()
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+
+from app.core.settings import settings
+
+
+@dataclass
+class SemanticCacheEntry:
+    question: str
+    kb_version: int
+    model: str
+    scope: str
+    answer: str
+    contexts: list[dict[str, Any]]
+    created_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class _KbIndex:
+    dim: int
+    vectors: np.ndarray  # [capacity, dim] unit-norm question embeddings; rows past len(entries) unused
+    entries: list[SemanticCacheEntry] = field(default_factory=list)
+    version: int = 0  # newest KB version seen; every entry has this version once pruned
+
+    def keep(self, mask: np.ndarray) -> None:
+        n = len(self.entries)
+        kept = np.flatnonzero(mask)
+        self.vectors[: len(kept)] = self.vectors[:n][kept]
+        self.entries = [self.entries[i] for i in kept]
+
+
+class SemanticAnswerCache:
+    """
+    Per-KB nearest-neighbor cache of answered questions.
+
+    A lookup embeds nothing itself: it takes the question vector `/query` computes anyway,
+    and returns the stored answer and contexts of the most similar past question when the
+    cosine similarity reaches `threshold`. Only entries with the same KB version, model and
+    scope (top_k + filters) are candidates; entries from an older KB version are dropped on
+    the next access, since versions only move forward. A request that read an older version
+    than the newest one seen (it raced an ingestion) neither hits nor stores.
+    """
+
+    def __init__(self, *, threshold: float, max_entries: int, ttl_s: float) -> None:
+        self.threshold = threshold
+        self._max_entries = max(1, max_entries)
+        self._ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._kbs: dict[str, _KbIndex] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_dropped = 0
+        self._hit_similarity_sum = 0.0
+
+    @staticmethod
+    def scope(*, top_k: int | None, filters: dict[str, Any] | None) -> str:
+        return json.dumps([top_k or settings.rag_top_k, filters or {}], sort_keys=True, default=str)
+
+    def lookup(
+        self, *, kb_id: str, kb_version: int, model: str, scope: str, query_vector: np.ndarray
+    ) -> tuple[SemanticCacheEntry, float] | None:
+        q = _unit(query_vector)
+        with self._lock:
+            idx = self._kbs.get(kb_id)
+            if idx is not None:
+                self._prune(idx, kb_version)
+            if idx is None or not idx.entries or idx.dim != q.shape[0] or kb_version < idx.version:
+                self.misses += 1
+                return None
+
+            n = len(idx.entries)
+            sims = idx.vectors[:n] @ q
+            eligible = np.fromiter((e.model == model and e.scope == scope for e in idx.entries), dtype=bool, count=n)
+            sims[~eligible] = -np.inf
+            best = int(np.argmax(sims))
+            similarity = float(sims[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._hit_similarity_sum += similarity
+            return idx.entries[best], similarity
+
+    def store(
+        self,
+        *,
+        kb_id: str,
+        kb_version: int,
+        model: str,
+        scope: str,
+        query_vector: np.ndarray,
+        question: str,
+        answer: str,
+        contexts: list[dict[str, Any]],
+    ) -> None:
+        q = _unit(query_vector)
+        entry = SemanticCacheEntry(
+            question=question, kb_version=kb_version, model=model, scope=scope, answer=answer, contexts=contexts
+        )
+        with self._lock:
+            idx = self._kbs.get(kb_id)
+            if idx is None or idx.dim != q.shape[0]:
+                idx = _KbIndex(dim=q.shape[0], vectors=np.empty((self._max_entries, q.shape[0]), dtype=np.float32))
+                self._kbs[kb_id] = idx
+            self._prune(idx, kb_version)
+            if kb_version < idx.version:
+                return
+            if len(idx.entries) >= self._max_entries:
+                # Oldest first: entries are appended in insertion order.
+                mask = np.ones(len(idx.entries), dtype=bool)
+                mask[: len(idx.entries) - self._max_entries + 1] = False
+                idx.keep(mask)
+            idx.vectors[len(idx.entries)] = q
+            idx.entries.append(entry)
+
+    def clear(self, kb_id: str | None = None) -> None:
+        with self._lock:
+            if kb_id is None:
+                self._kbs.clear()
+            else:
+                self._kbs.pop(kb_id, None)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "mean_hit_similarity": (self._hit_similarity_sum / self.hits) if self.hits else None,
+                "stale_dropped": self.stale_dropped,
+                "entries": sum(len(idx.entries) for idx in self._kbs.values()),
+                "kbs": len(self._kbs),
+                "threshold": self.threshold,
+                "max_entries_per_kb": self._max_entries,
+                "ttl_s": self._ttl_s,
+            }
+
+    def _prune(self, idx: _KbIndex, kb_version: int) -> None:
+        idx.version = max(idx.version, kb_version)
+        if not idx.entries:
+            return
+        cutoff = time.monotonic() - self._ttl_s
+        mask = np.fromiter(
+            (e.kb_version >= idx.version and e.created_at > cutoff for e in idx.entries),
+            dtype=bool,
+            count=len(idx.entries),
+        )
+        if not mask.all():
+            self.stale_dropped += int((~mask).sum())
+            idx.keep(mask)
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm > 0 else v
@@ -1,7 +1,15 @@
 from __future__ import annotations
 
+import hashlib
+import os
 import re
+import shutil
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
+from typing import TextIO
+from uuid import uuid4
 
 from fastapi import UploadFile
 
@@ -29,23 +37,66 @@ def doc_artifacts_dir(kb_id: str, doc_id: str) -> Path:
     return kb_dir(kb_id) / "artifacts" / doc_id
 
 
-def save_upload(kb_id: str, doc_id: str, upload: UploadFile) -> Path:
-    target_dir = doc_raw_dir(kb_id, doc_id)
-    target_dir.mkdir(parents=True, exist_ok=True)
+@dataclass(frozen=True)
+class StoredBlob:
+    sha256: str
+    size: int
+    path: Path
+
+
+def blob_path(sha256: str) -> Path:
+    return settings.blob_dir / sha256[:2] / sha256
 
-    fname = safe_filename(upload.filename or "upload")
-    target_path = target_dir / fname
 
-    with target_path.open("wb") as f:
+def save_blob(upload: UploadFile) -> StoredBlob:
+    """Stream an upload into the content-addressed blob store, hashing as it is written."""
+    tmp_dir = settings.blob_dir / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = tmp_dir / uuid4().hex
+
+    h = hashlib.sha256()
+    size = 0
+    with tmp_path.open("wb") as f:
         while True:
             chunk = upload.file.read(1024 * 1024)
             if not chunk:
                 break
+            h.update(chunk)
+            size += len(chunk)
             f.write(chunk)
 
+    digest = h.hexdigest()
+    target = blob_path(digest)
+    if target.exists():
+        # Identical content is already stored once.
+        tmp_path.unlink()
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, target)
+    return StoredBlob(sha256=digest, size=size, path=target)
+
+
+def link_blob(kb_id: str, doc_id: str, filename: str, blob: StoredBlob) -> Path:
+    """Expose a blob as the document's raw file; hard-linked so the bytes are not duplicated."""
+    target_dir = doc_raw_dir(kb_id, doc_id)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    target_path = target_dir / safe_filename(filename)
+    if target_path.exists():
+        target_path.unlink()
+    try:
+        os.link(blob.path, target_path)
+    except OSError:
+        # Filesystems without hard links (or across devices) get a plain copy.
+        shutil.copyfile(blob.path, target_path)
     return target_path
 
 
+def copy_artifacts(src_kb_id: str, src_doc_id: str, kb_id: str, doc_id: str) -> None:
+    src = doc_artifacts_dir(src_kb_id, src_doc_id)
+    if src.exists():
+        shutil.copytree(src, doc_artifacts_dir(kb_id, doc_id), dirs_exist_ok=True)
+
+
 def write_extracted_text(kb_id: str, doc_id: str, text: str) -> Path:
     target_dir = doc_artifacts_dir(kb_id, doc_id)
     target_dir.mkdir(parents=True, exist_ok=True)
@@ -54,6 +105,15 @@ def write_extracted_text(kb_id: str, doc_id: str, text: str) -> Path:
     return path
 
 
+@contextmanager
+def open_extracted_writer(kb_id: str, doc_id: str) -> Iterator[TextIO]:
+    """Incremental counterpart of `write_extracted_text` for streamed extraction."""
+    target_dir = doc_artifacts_dir(kb_id, doc_id)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    with (target_dir / "extracted.txt").open("w", encoding="utf-8") as f:
+        yield f
+
+
 def read_extracted_text(kb_id: str, doc_id: str) -> str | None:
     path = doc_artifacts_dir(kb_id, doc_id) / "extracted.txt"
     if not path.exists():
@@ -3,6 +3,8 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Any, Protocol
 
+import numpy as np
+
 
 @dataclass(frozen=True)
 class VectorSearchResult:
@@ -13,23 +15,38 @@ class VectorSearchResult:
 
 
 class VectorStore(Protocol):
+    """
+    Per-KB vector collections. Vectors travel as float32 NumPy arrays: a [n, dim] matrix
+    on upsert, one [dim] row per id from `get_vectors`, and a [dim] query vector.
+    """
+
     def upsert(
         self,
         *,
         kb_id: str,
         ids: list[str],
-        vectors: list[list[float]],
+        vectors: np.ndarray,
         texts: list[str],
         metadatas: list[dict[str, Any]],
     ) -> None: ...
 
+    def get_vectors(self, *, kb_id: str, ids: list[str]) -> dict[str, np.ndarray]: ...
+
+    def update_metadata(self, *, kb_id: str, ids: list[str], metadatas: list[dict[str, Any]]) -> None: ...
+
+    def delete(self, *, kb_id: str, ids: list[str]) -> None: ...
+
     def query(
         self,
         *,
         kb_id: str,
-        query_vector: list[float],
+        query_vector: np.ndarray,
         top_k: int,
         where: dict[str, Any] | None = None,
-    ) -> list[VectorSearchResult]: ...
+        query_text: str | None = None,
+        ids: list[str] | None = None,
+    ) -> list[VectorSearchResult]:
+        """`ids`, when given, restricts the search to those vectors (pre-filtered candidates); `where` still applies."""
+        ...
 
 
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from typing import Any
 
+import numpy as np
+
 from app.core.settings import settings
 from app.vectorstore.base import VectorSearchResult
 
@@ -26,7 +28,7 @@ class ChromaVectorStore:
         *,
         kb_id: str,
         ids: list[str],
-        vectors: list[list[float]],
+        vectors: np.ndarray,
         texts: list[str],
         metadatas: list[dict[str, Any]],
     ) -> None:
@@ -34,23 +36,63 @@ class ChromaVectorStore:
             raise ValueError("ids/vectors/texts/metadatas lengths must match")
 
         col = self._get_collection(kb_id)
-        # Ensure kb_id is always present for filtering/debugging
-        metadatas = [{**m, "kb_id": kb_id} for m in metadatas]
+        # Ensure kb_id is always present for filtering/debugging (a routed write already carries the KB's own id)
+        metadatas = [{"kb_id": kb_id, **m} for m in metadatas]
         col.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
 
+    def get_vectors(self, *, kb_id: str, ids: list[str]) -> dict[str, np.ndarray]:
+        if not ids:
+            return {}
+        col = self._get_collection(kb_id)
+        res = col.get(ids=ids, include=["embeddings"])
+        embeddings = res.get("embeddings")
+        if embeddings is None or len(embeddings) == 0:
+            return {}
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        return {str(_id): matrix[i] for i, _id in enumerate(res.get("ids") or [])}
+
+    def update_metadata(self, *, kb_id: str, ids: list[str], metadatas: list[dict[str, Any]]) -> None:
+        if len(ids) != len(metadatas):
+            raise ValueError("ids/metadatas lengths must match")
+        if not ids:
+            return
+        col = self._get_collection(kb_id)
+        col.update(ids=ids, metadatas=[{"kb_id": kb_id, **m} for m in metadatas])
+
+    def delete(self, *, kb_id: str, ids: list[str]) -> None:
+        if not ids:
+            return
+        col = self._get_collection(kb_id)
+        col.delete(ids=ids)
+
+    def drop(self, kb_id: str) -> None:
+        try:
+            self._client.delete_collection(name=self._collection_name(kb_id))
+        except Exception:
+            # Already gone (never written, or dropped by another process).
+            pass
+
     def query(
         self,
         *,
         kb_id: str,
-        query_vector: list[float],
+        query_vector: np.ndarray,
         top_k: int,
         where: dict[str, Any] | None = None,
+        query_text: str | None = None,
+        ids: list[str] | None = None,
     ) -> list[VectorSearchResult]:
+        # query_text is only used by stores that re-score with the raw question.
         col = self._get_collection(kb_id)
+        if ids is not None and len(ids) <= settings.chroma_exact_max_ids:
+            return self._query_ids(col, query_vector, top_k, where, ids)
 
         final_where: dict[str, Any] | None = None
         if where:
             final_where = dict(where)
+        if ids is not None:
+            restrict = {"chunk_id": {"$in": list(ids)}}
+            final_where = {"$and": [final_where, restrict]} if final_where else restrict
 
         res = col.query(
             query_embeddings=[query_vector],
@@ -71,4 +113,27 @@ class ChromaVectorStore:
             out.append(VectorSearchResult(id=str(_id), score=score, text=str(doc), meta=dict(meta or {})))
         return out
 
-
+    def _query_ids(
+        self, col, query_vector: np.ndarray, top_k: int, where: dict[str, Any] | None, ids: list[str]
+    ) -> list[VectorSearchResult]:
+        """Exact search over a pre-filtered candidate set: fetch its vectors instead of searching the HNSW graph."""
+        if not ids or top_k <= 0:
+            return []
+        res = col.get(ids=list(ids), where=where or None, include=["embeddings", "documents", "metadatas"])
+        embeddings = res.get("embeddings")
+        if embeddings is None or len(embeddings) == 0:
+            return []
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        q = np.asarray(query_vector, dtype=np.float32)
+        # Negative squared L2, as Chroma's default space reports distances.
+        scores = -np.einsum("ij,ij->i", matrix - q, matrix - q)
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        found_ids = res.get("ids") or []
+        docs = res.get("documents") or []
+        metas = res.get("metadatas") or []
+        return [
+            VectorSearchResult(id=str(found_ids[i]), score=float(scores[i]), text=str(docs[i]), meta=dict(metas[i] or {}))
+            for i in top
+        ]
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import threading
+
+from app.core.settings import settings
+from app.vectorstore.base import VectorStore
+
+_lock = threading.Lock()
+_stores: dict[tuple[str, ...], VectorStore] = {}
+
+
+def _index_route(kb_id: str) -> tuple[int, int | None, str]:
+    from app.db import crud
+    from app.db.session import SessionLocal
+
+    with SessionLocal() as session:
+        return crud.kb_index_route(session, kb_id)
+
+
+def _collection_model(key: str) -> str:
+    from app.db import crud
+    from app.db.session import SessionLocal
+    from app.vectorstore.routing import parse_collection_key
+
+    kb_id, generation = parse_collection_key(key)
+    with SessionLocal() as session:
+        return crud.generation_model(session, kb_id, generation)
+
+
+def create_vector_store() -> VectorStore:
+    """
+    The backend selected by `VECTOR_STORE`, wrapped for late-interaction re-ranking if
+    enabled, and routed to each KB's serving collection generation (see app.vectorstore.routing).
+
+    One instance per backend and directory is shared by the whole process: stores cache their
+    on-disk state (the NumPy manifest, the route of each KB), so a second instance over the same
+    files would serve stale results or overwrite the first one's writes.
+    """
+    key = (settings.vector_store, str(settings.chroma_dir), str(settings.numpy_store_dir), settings.retrieval_mode)
+    if settings.retrieval_mode == "late_interaction":
+        key += (str(settings.late_interaction_dir),)
+    with _lock:
+        vs = _stores.get(key)
+        if vs is None:
+            vs = _stores[key] = _build()
+        return vs
+
+
+def _build() -> VectorStore:
+    vs: VectorStore
+    if settings.vector_store == "chroma":
+        from app.vectorstore.chroma import ChromaVectorStore
+
+        vs = ChromaVectorStore()
+    elif settings.vector_store == "numpy":
+        from app.vectorstore.numpy_store import NumpyVectorStore
+
+        vs = NumpyVectorStore()
+    else:
+        raise ValueError(f"unknown vector store backend: {settings.vector_store}")
+
+    if settings.retrieval_mode == "late_interaction":
+        from app.vectorstore.late_interaction import LateInteractionStore
+
+        vs = LateInteractionStore(vs, resolve_model=_collection_model)
+
+    from app.vectorstore.routing import RoutedVectorStore
+
+    return RoutedVectorStore(vs, resolve=_index_route)
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import math
+
+import numpy as np
+
+# Rows per distance block when assigning vectors to centroids.
+_ASSIGN_BLOCK_ROWS = 16384
+
+
+def auto_nlist(n_rows: int) -> int:
+    """Number of inverted lists for `n_rows` vectors (~4 * sqrt(n), the usual IVF rule of thumb)."""
+    return int(min(4096, max(16, 4 * math.sqrt(max(n_rows, 1)))))
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid (L2) for each row, as int32."""
+    c_norms = np.einsum("ij,ij->i", centroids, centroids)
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start : start + _ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        # argmin |x - c|^2 == argmax 2 x.c - |c|^2
+        out[start : start + len(block)] = np.argmax(2.0 * (block @ centroids.T) - c_norms[None, :], axis=1)
+    return out
+
+
+def train_kmeans(sample: np.ndarray, nlist: int, *, iters: int = 12, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means on a sample; empty clusters are re-seeded from random sample rows."""
+    sample = np.asarray(sample, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(sample))
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        labels = assign(sample, centroids)
+        counts = np.bincount(labels, minlength=nlist)
+        filled = counts > 0
+        order = np.argsort(labels, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        centroids[filled] = np.add.reduceat(sample[order], starts, axis=0) / counts[filled, None]
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), size=len(empty), replace=False)]
+    return centroids
+
+
+def probe(queries: np.ndarray, centroids: np.ndarray, nprobe: int) -> np.ndarray:
+    """[n_queries, nlist] bool table of the `nprobe` lists nearest to each query."""
+    nprobe = max(1, min(nprobe, len(centroids)))
+    c_norms = np.einsum("ij,ij->i", centroids, centroids)
+    scores = 2.0 * (queries @ centroids.T) - c_norms[None, :]
+    table = np.zeros(scores.shape, dtype=bool)
+    if nprobe == len(centroids):
+        table[:] = True
+    else:
+        top = np.argpartition(-scores, nprobe - 1, axis=1)[:, :nprobe]
+        np.put_along_axis(table, top, True, axis=1)
+    return table
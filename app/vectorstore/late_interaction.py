@@ -0,0 +1,482 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+from uuid import uuid4
+
+import numpy as np
+
+from app.core.settings import settings
+from app.vectorstore.base import VectorSearchResult, VectorStore
+from app.vectorstore.locking import file_lock, file_stamp
+
+if TYPE_CHECKING:
+    from app.embeddings.hf_dense import HuggingFaceDenseEmbedder
+
+
+@dataclass
+class _Segment:
+    name: str
+    ids: list[str]
+    offsets: np.ndarray  # [n_docs + 1] int64 token offsets
+    tokens: np.ndarray  # [n_tokens, dim] float16 or int8 (memory-mapped)
+    scales: np.ndarray | None  # [n_tokens] float16 per-token scales for int8
+
+
+class TokenIndex:
+    """
+    Append-only per-KB store of per-token embeddings, memory-mapped from disk.
+
+    Token vectors are projected to `dim` dimensions with a fixed random orthogonal
+    matrix (inner products are approximately preserved), re-normalized, and stored as
+    float16 or as int8 with a per-token scale. Each `append` writes a new segment;
+    deletes and overwrites are tombstones until `compact` rewrites the live rows.
+
+    Several processes may share a directory, as with the NumPy vector store: manifest
+    updates are made under a file lock against the latest manifest on disk, and reads
+    first reload the manifest if another process replaced it.
+    """
+
+    def __init__(self, root: Path, *, dim: int, dtype: str, max_segments: int) -> None:
+        if dtype not in {"float16", "int8"}:
+            raise ValueError(f"unsupported late-interaction dtype: {dtype}")
+        self._root = root
+        self._root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._max_segments = max_segments
+
+        self._dim = dim
+        self._dtype = dtype
+        self._segments: list[_Segment] = []
+        self._dead: set[tuple[str, int]] = set()
+        self._where: dict[str, tuple[int, int]] = {}
+        self._projection: np.ndarray | None = None
+        # Identity of the manifest file the in-memory state matches (None: no manifest yet).
+        self._stamp: tuple[int, int] | None = None
+        with self._lock:
+            self._reload_if_stale()
+
+    def _read_manifest(self) -> dict[str, Any]:
+        try:
+            return json.loads((self._root / "manifest.json").read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+
+    def _reload_if_stale(self) -> None:
+        """Adopt the manifest on disk if another process replaced it. Called with `_lock` held."""
+        stamp = file_stamp(self._root / "manifest.json")
+        if stamp == self._stamp:
+            return
+        manifest = self._read_manifest()
+        self._dim = manifest.get("dim", self._dim)
+        self._dtype = manifest.get("dtype", self._dtype)
+        # Segments are immutable on disk, so the ones already open are reused.
+        opened = {seg.name: seg for seg in self._segments}
+        self._segments = [opened.get(n) or self._open_segment(n) for n in manifest.get("segments", [])]
+        self._dead = {(s, int(r)) for s, r in manifest.get("tombstones", [])}
+        proj_path = self._root / "projection.npy"
+        if self._projection is None and proj_path.exists():
+            self._projection = np.load(proj_path)
+        self._where = {}
+        for si, seg in enumerate(self._segments):
+            for row, _id in enumerate(seg.ids):
+                if (seg.name, row) not in self._dead:
+                    self._where[_id] = (si, row)
+        self._stamp = stamp
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """Hold the cross-process manifest lock and `_lock`, with the in-memory state up to date."""
+        with file_lock(self._root / "manifest.lock"), self._lock:
+            self._reload_if_stale()
+            yield
+
+    def _write_manifest(self) -> None:
+        manifest = {
+            "dim": self._dim,
+            "dtype": self._dtype,
+            "segments": [s.name for s in self._segments],
+            "tombstones": sorted([list(t) for t in self._dead]),
+        }
+        tmp = self._root / "manifest.json.tmp"
+        tmp.write_text(json.dumps(manifest), encoding="utf-8")
+        os.replace(tmp, self._root / "manifest.json")
+        self._stamp = file_stamp(self._root / "manifest.json")
+
+    def _drop_orphans(self, names: list[str]) -> None:
+        # Segments this index wrote but did not get into the manifest; other writers' are left alone.
+        for name in names:
+            shutil.rmtree(self._root / name, ignore_errors=True)
+
+    def _open_segment(self, name: str) -> _Segment:
+        d = self._root / name
+        ids = json.loads((d / "ids.json").read_text(encoding="utf-8"))
+        scales_path = d / "scales.npy"
+        return _Segment(
+            name=name,
+            ids=ids,
+            offsets=np.load(d / "offsets.npy"),
+            tokens=np.load(d / "tokens.npy", mmap_mode="r"),
+            scales=np.load(scales_path, mmap_mode="r") if scales_path.exists() else None,
+        )
+
+    def _project(self, mat: np.ndarray) -> np.ndarray:
+        mat = np.asarray(mat, dtype=np.float32)
+        if self._projection is None:
+            in_dim = mat.shape[1]
+            if self._dim <= 0 or self._dim >= in_dim:
+                self._dim = in_dim
+                self._projection = np.eye(in_dim, dtype=np.float32)
+            else:
+                rng = np.random.default_rng(0)
+                q, _ = np.linalg.qr(rng.standard_normal((in_dim, self._dim)).astype(np.float32))
+                self._projection = q.astype(np.float32)
+            # Seeded, so every process derives the same matrix; replaced atomically for concurrent readers.
+            tmp = self._root / f"projection.{uuid4().hex[:12]}.npy"
+            np.save(tmp, self._projection)
+            os.replace(tmp, self._root / "projection.npy")
+        out = mat @ self._projection
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+    def append(self, ids: list[str], token_mats: list[np.ndarray]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            self._reload_if_stale()
+            mats = []
+            for m in token_mats:
+                m = np.asarray(m, dtype=np.float32)
+                if m.shape[0] == 0:
+                    # Keep one zero row so every document owns a non-empty token range.
+                    m = np.zeros((1, m.shape[1]), dtype=np.float32)
+                mats.append(self._project(m))
+            dtype = self._dtype
+
+        lengths = np.array([m.shape[0] for m in mats], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        flat = np.concatenate(mats, axis=0)
+
+        name = f"seg_{uuid4().hex[:12]}"
+        try:
+            d = self._root / name
+            d.mkdir()
+            if dtype == "int8":
+                scales = np.maximum(np.abs(flat).max(axis=1), 1e-12) / 127.0
+                q = np.clip(np.rint(flat / scales[:, None]), -127, 127).astype(np.int8)
+                np.save(d / "tokens.npy", q)
+                np.save(d / "scales.npy", scales.astype(np.float16))
+            else:
+                np.save(d / "tokens.npy", flat.astype(np.float16))
+            np.save(d / "offsets.npy", offsets)
+            (d / "ids.json").write_text(json.dumps(ids), encoding="utf-8")
+
+            seg = self._open_segment(name)
+            with self._exclusive():
+                self._kill(ids)
+                self._segments.append(seg)
+                si = len(self._segments) - 1
+                for row, _id in enumerate(ids):
+                    self._where[_id] = (si, row)
+                self._write_manifest()
+                compact = len(self._segments) > self._max_segments
+        except BaseException:
+            self._drop_orphans([name])
+            raise
+        if compact:
+            self.compact()
+
+    def _kill(self, ids: list[str]) -> None:
+        for _id in ids:
+            loc = self._where.pop(_id, None)
+            if loc is not None:
+                self._dead.add((self._segments[loc[0]].name, loc[1]))
+
+    def delete(self, ids: list[str]) -> None:
+        with self._exclusive():
+            self._kill(ids)
+            self._write_manifest()
+
+    def _block(self, seg: _Segment, row: int) -> np.ndarray:
+        start, end = int(seg.offsets[row]), int(seg.offsets[row + 1])
+        block = np.asarray(seg.tokens[start:end], dtype=np.float32)
+        if seg.scales is not None:
+            block = block * np.asarray(seg.scales[start:end], dtype=np.float32)[:, None]
+        return block
+
+    def maxsim(self, query_tokens: np.ndarray, ids: list[str]) -> np.ndarray:
+        """ColBERT MaxSim of the query against each id; -inf for ids without stored tokens."""
+        scores = np.full(len(ids), -np.inf, dtype=np.float32)
+        if query_tokens.shape[0] == 0:
+            return scores
+        with self._lock:
+            self._reload_if_stale()
+            q = self._project(query_tokens)
+            blocks: list[np.ndarray] = []
+            found: list[int] = []
+            for i, _id in enumerate(ids):
+                loc = self._where.get(_id)
+                if loc is None:
+                    continue
+                blocks.append(self._block(self._segments[loc[0]], loc[1]))
+                found.append(i)
+        if not blocks:
+            return scores
+
+        starts = np.concatenate([[0], np.cumsum([b.shape[0] for b in blocks])[:-1]])
+        sim = np.concatenate(blocks, axis=0) @ q.T  # [all candidate tokens, query tokens]
+        # Best doc token per query token, per candidate; summed over query tokens.
+        scores[found] = np.maximum.reduceat(sim, starts, axis=0).sum(axis=1)
+        return scores
+
+    def compact(self) -> None:
+        with self._exclusive():
+            self._compact_locked()
+
+    def _compact_locked(self) -> None:
+        """Rewrite the live rows into one segment. Called from `_exclusive`."""
+        live: list[tuple[str, _Segment, int]] = [
+            (_id, self._segments[si], row) for _id, (si, row) in self._where.items()
+        ]
+        if not live:
+            old = self._segments
+            self._segments, self._dead = [], set()
+            self._write_manifest()
+            for seg in old:
+                shutil.rmtree(self._root / seg.name, ignore_errors=True)
+            return
+
+        lengths = np.array([int(seg.offsets[row + 1] - seg.offsets[row]) for _, seg, row in live], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        name = f"seg_{uuid4().hex[:12]}"
+        d = self._root / name
+        try:
+            d.mkdir()
+            # Stream rows into the merged files so compaction never holds the KB in memory.
+            first = live[0][1]
+            tokens = np.lib.format.open_memmap(
+                d / "tokens.npy", mode="w+", dtype=first.tokens.dtype, shape=(int(offsets[-1]), first.tokens.shape[1])
+            )
+            scales = (
+                np.lib.format.open_memmap(d / "scales.npy", mode="w+", dtype=np.float16, shape=(int(offsets[-1]),))
+                if first.scales is not None
+                else None
+            )
+            for (_, seg, row), start in zip(live, offsets[:-1]):
+                s, e = int(seg.offsets[row]), int(seg.offsets[row + 1])
+                tokens[start : start + (e - s)] = seg.tokens[s:e]
+                if scales is not None and seg.scales is not None:
+                    scales[start : start + (e - s)] = seg.scales[s:e]
+            tokens.flush()
+            if scales is not None:
+                scales.flush()
+            del tokens, scales
+            np.save(d / "offsets.npy", offsets)
+            (d / "ids.json").write_text(json.dumps([_id for _id, _, _ in live]), encoding="utf-8")
+            merged = self._open_segment(name)
+        except BaseException:
+            self._drop_orphans([name])
+            raise
+
+        old = self._segments
+        self._segments = [merged]
+        self._dead = set()
+        self._where = {_id: (0, row) for row, (_id, _, _) in enumerate(live)}
+        self._write_manifest()
+        for seg in old:
+            shutil.rmtree(self._root / seg.name, ignore_errors=True)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            self._reload_if_stale()
+            n_tokens = sum(int(s.offsets[-1]) for s in self._segments)
+            disk = sum(f.stat().st_size for f in self._root.rglob("*") if f.is_file())
+            return {
+                "chunks": len(self._where),
+                "tokens": n_tokens,
+                "dim": self._dim,
+                "dtype": self._dtype,
+                "segments": len(self._segments),
+                "tombstones": len(self._dead),
+                "disk_bytes": disk,
+            }
+
+
+class LateInteractionStore:
+    """
+    VectorStore that adds ColBERT-style late interaction on top of a dense store.
+
+    The wrapped store keeps pooled vectors, texts and metadata and generates
+    candidates; this store keeps compressed per-token embeddings per KB and re-scores
+    the candidates with MaxSim when the query text is available.
+
+    Tokens are embedded with the model of the collection they belong to (`resolve_model`,
+    e.g. a re-embedding's target for the generation it builds). Question tokens are embedded
+    on the calling (retrieval) thread, outside the query micro-batcher and the persistent
+    embedding cache, which hold pooled vectors only; the last
+    LATE_INTERACTION_QUERY_CACHE_ITEMS of them are kept in memory instead.
+    """
+
+    def __init__(
+        self,
+        base: VectorStore,
+        *,
+        embedder: HuggingFaceDenseEmbedder | None = None,
+        root: Path | None = None,
+        resolve_model: Callable[[str], str] | None = None,
+    ) -> None:
+        # Imported here so TokenIndex stays usable (e.g. in benchmarks) without torch installed.
+        from app.embeddings.hf_dense import HuggingFaceDenseEmbedder
+
+        self._base = base
+        self._embedder = embedder or HuggingFaceDenseEmbedder()
+        self._root = root or settings.late_interaction_dir
+        self._resolve_model = resolve_model
+        self._models: dict[str, str] = {}
+        self._query_tokens: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+        self._indexes: dict[str, TokenIndex] = {}
+        self._lock = threading.Lock()
+
+    def _index(self, kb_id: str) -> TokenIndex:
+        with self._lock:
+            idx = self._indexes.get(kb_id)
+            if idx is None:
+                idx = TokenIndex(
+                    self._root / kb_id,
+                    dim=settings.late_interaction_dim,
+                    dtype=settings.late_interaction_dtype,
+                    max_segments=settings.late_interaction_max_segments,
+                )
+                self._indexes[kb_id] = idx
+            return idx
+
+    def _embedder_for(self, kb_id: str) -> HuggingFaceDenseEmbedder:
+        from app.embeddings.hf_dense import with_model
+
+        if self._resolve_model is None:
+            return self._embedder
+        with self._lock:
+            model = self._models.get(kb_id)
+        if model is None:
+            # A collection's model never changes (a re-embedding writes a new generation), so it is cached.
+            model = self._resolve_model(kb_id)
+            with self._lock:
+                self._models[kb_id] = model
+        return with_model(self._embedder, model)
+
+    def _embed_questions(self, kb_id: str, texts: list[str]) -> list[np.ndarray]:
+        embedder = self._embedder_for(kb_id)
+        model = getattr(embedder, "model", "")
+        with self._lock:
+            out = [self._query_tokens.get((model, t)) for t in texts]
+            for t, q in zip(texts, out):
+                if q is not None:
+                    self._query_tokens.move_to_end((model, t))
+        missing = list(dict.fromkeys(t for t, q in zip(texts, out) if q is None))
+        if missing:
+            fresh = dict(zip(missing, embedder.embed_tokens(missing)))
+            with self._lock:
+                for t, q in fresh.items():
+                    self._query_tokens[(model, t)] = q
+                while len(self._query_tokens) > max(0, settings.late_interaction_query_cache_items):
+                    self._query_tokens.popitem(last=False)
+            out = [q if q is not None else fresh[t] for t, q in zip(texts, out)]
+        return out  # type: ignore[return-value]
+
+    def upsert(
+        self,
+        *,
+        kb_id: str,
+        ids: list[str],
+        vectors: np.ndarray,
+        texts: list[str],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        self._base.upsert(kb_id=kb_id, ids=ids, vectors=vectors, texts=texts, metadatas=metadatas)
+        self._index(kb_id).append(ids, self._embedder_for(kb_id).embed_tokens(texts))
+
+    def get_vectors(self, *, kb_id: str, ids: list[str]) -> dict[str, np.ndarray]:
+        return self._base.get_vectors(kb_id=kb_id, ids=ids)
+
+    def update_metadata(self, *, kb_id: str, ids: list[str], metadatas: list[dict[str, Any]]) -> None:
+        self._base.update_metadata(kb_id=kb_id, ids=ids, metadatas=metadatas)
+
+    def delete(self, *, kb_id: str, ids: list[str]) -> None:
+        self._base.delete(kb_id=kb_id, ids=ids)
+        self._index(kb_id).delete(ids)
+
+    def query(
+        self,
+        *,
+        kb_id: str,
+        query_vector: np.ndarray,
+        top_k: int,
+        where: dict[str, Any] | None = None,
+        query_text: str | None = None,
+        ids: list[str] | None = None,
+    ) -> list[VectorSearchResult]:
+        n = max(top_k, settings.late_interaction_candidates) if query_text else top_k
+        candidates = self._base.query(kb_id=kb_id, query_vector=query_vector, top_k=n, where=where, ids=ids)
+        if not query_text or not candidates:
+            return candidates[:top_k]
+        return self._rescore(kb_id, candidates, self._embed_questions(kb_id, [query_text])[0], top_k)
+
+    def query_many(
+        self,
+        *,
+        kb_id: str,
+        query_vectors: np.ndarray,
+        top_k: int,
+        where: dict[str, Any] | None = None,
+        ids: list[str] | None = None,
+        query_texts: list[str] | None = None,
+    ) -> list[list[VectorSearchResult]]:
+        """`query` for several questions: one candidate search and one token forward pass for all of them."""
+        texts = list(query_texts) if query_texts else [None] * len(query_vectors)
+        n = max(top_k, settings.late_interaction_candidates) if any(texts) else top_k
+        query_many = getattr(self._base, "query_many", None)
+        if query_many is not None:
+            lists = query_many(kb_id=kb_id, query_vectors=query_vectors, top_k=n, where=where, ids=ids)
+        else:
+            lists = [
+                self._base.query(kb_id=kb_id, query_vector=qv, top_k=n, where=where, ids=ids) for qv in query_vectors
+            ]
+
+        todo = [i for i, (t, c) in enumerate(zip(texts, lists)) if t and c]
+        tokens = self._embed_questions(kb_id, [texts[i] for i in todo]) if todo else []
+        out = [c[:top_k] for c in lists]
+        for i, q in zip(todo, tokens):
+            out[i] = self._rescore(kb_id, lists[i], q, top_k)
+        return out
+
+    def _rescore(
+        self, kb_id: str, candidates: list[VectorSearchResult], query_tokens: np.ndarray, top_k: int
+    ) -> list[VectorSearchResult]:
+        scores = self._index(kb_id).maxsim(query_tokens, [c.id for c in candidates])
+        # Candidates without stored tokens (ingested before this mode) keep dense order after scored ones.
+        order = sorted(range(len(candidates)), key=lambda i: (not np.isfinite(scores[i]), -scores[i], i))
+        out: list[VectorSearchResult] = []
+        for i in order[:top_k]:
+            c = candidates[i]
+            out.append(replace(c, score=float(scores[i])) if np.isfinite(scores[i]) else c)
+        return out
+
+    def drop(self, kb_id: str) -> None:
+        with self._lock:
+            self._indexes.pop(kb_id, None)
+            self._models.pop(kb_id, None)
+        shutil.rmtree(self._root / kb_id, ignore_errors=True)
+        drop = getattr(self._base, "drop", None)
+        if drop is not None:
+            drop(kb_id)
+
+    def stats(self, kb_id: str) -> dict[str, Any]:
+        return self._index(kb_id).stats()
@@ -0,0 +1,828 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+from uuid import uuid4
+
+import numpy as np
+
+from app.core.settings import settings
+from app.vectorstore import ivf, quantization
+from app.vectorstore.base import VectorSearchResult
+from app.vectorstore.locking import file_lock, file_stamp
+
+logger = logging.getLogger(__name__)
+
+# Elements decoded and scored per matrix product: keeps the float32 working set of a
+# block (decoded from float16/int8 codes, or paged in from the memory map) cache-sized.
+_SEARCH_BLOCK_ELEMS = 1 << 22
+_COMPACT_BLOCK_ROWS = 16384
+# k-means is trained on at most this many live rows.
+_IVF_TRAIN_SAMPLE = 100_000
+
+
+@dataclass(frozen=True)
+class _Column:
+    """One metadata key of a segment: float64 values for numeric keys, else int32 codes into `vocab`."""
+
+    values: np.ndarray
+    present: np.ndarray
+    vocab: dict[Any, int] | None
+
+
+@dataclass
+class _Segment:
+    name: str
+    ids: list[str]
+    texts: list[str]
+    metas: list[dict[str, Any]]
+    vectors: np.ndarray  # [n, code width] codes in `dtype` (memory-mapped)
+    norms: np.ndarray  # [n] float32 squared L2 norms of the vectors the codes stand for
+    alive: np.ndarray  # [n] bool; replaced, never mutated, so readers can hold a snapshot
+    dtype: str
+    dim: int
+    scales: np.ndarray | None = None  # [dim] float32 per-dimension scales (int8)
+    full: np.ndarray | None = None  # [n, dim] float32 copy for re-scoring (memory-mapped), if kept
+    # IVF: rows are sorted by inverted list; list l holds rows list_offsets[l]:list_offsets[l + 1]
+    ivf: str | None = None
+    lists: np.ndarray | None = None
+    list_offsets: np.ndarray | None = None
+    columns: dict[str, _Column] = field(default_factory=dict)
+
+    def rows(self, rows: np.ndarray) -> np.ndarray:
+        """float32 rows: the full-precision copy if kept, else decoded from the codes."""
+        if self.full is not None:
+            return np.asarray(self.full[rows], dtype=np.float32)
+        return quantization.decode(
+            self.vectors[rows], self.dtype, dim=self.dim, scales=self.scales, norms=self.norms[rows]
+        )
+
+    def column(self, key: str) -> _Column:
+        """Columnar view of one metadata key, built on first use."""
+        col = self.columns.get(key)
+        if col is None:
+            present = np.array([key in m for m in self.metas], dtype=bool)
+            raw = [m.get(key) for m in self.metas]
+            if all(_is_number(v) for v, p in zip(raw, present) if p):
+                values = np.array([float(v) if p else np.nan for v, p in zip(raw, present)], dtype=np.float64)
+                col = _Column(values=values, present=present, vocab=None)
+            else:
+                vocab: dict[Any, int] = {}
+                codes = [vocab.setdefault(v, len(vocab)) if p else -1 for v, p in zip(raw, present)]
+                col = _Column(values=np.array(codes, dtype=np.int32), present=present, vocab=vocab)
+            self.columns[key] = col
+        return col
+
+
+@dataclass(frozen=True)
+class _IvfState:
+    name: str
+    centroids: np.ndarray  # [nlist, dim] float32
+    trained_rows: int
+
+
+class _Collection:
+    """
+    One KB: append-only segments of vectors, texts and metadata under `root`.
+
+    Each upsert writes a new segment; overwritten and deleted rows are tombstoned in
+    the manifest. Compaction rewrites the live rows of all segments into one, in a
+    background thread, while queries and writes carry on against the old segments.
+
+    With `index="ivf"`, compaction also trains k-means centroids once the KB reaches
+    `ivf_min_rows` live rows (retraining when it has doubled since), and every segment
+    written against the current centroids is stored grouped by nearest centroid, so a
+    query only scores the rows of its `nprobe` nearest lists.
+
+    Vectors are stored as `dtype` codes (see `quantization`). With `rescore > 0` and a
+    lossy dtype, each segment also keeps a float32 copy on disk, and the top
+    `top_k * rescore` candidates are re-scored against it; only those rows are read.
+
+    Other processes (another API worker, the Streamlit app) may open the same directory:
+    manifest updates are made under a file lock against the latest manifest on disk, and
+    every read first reloads the manifest if it was replaced since this process last saw it.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        dtype: str,
+        max_segments: int,
+        dead_ratio: float,
+        index: str = "flat",
+        ivf_nlist: int = 0,
+        ivf_min_rows: int = 20000,
+        rescore: int = 0,
+    ) -> None:
+        if dtype not in quantization.DTYPES:
+            raise ValueError(f"unsupported vector store dtype: {dtype}")
+        if index not in {"flat", "ivf"}:
+            raise ValueError(f"unsupported vector store index: {index}")
+        self._root = root
+        self._root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()  # guards the segment list, alive masks and id map
+        self._write_lock = threading.Lock()  # serializes writers (and compaction swap-in)
+        self._compact_lock = threading.Lock()  # one compaction at a time
+        self._max_segments = max_segments
+        self._dead_ratio = dead_ratio
+        self._index = index
+        self._ivf_nlist = ivf_nlist
+        self._ivf_min_rows = ivf_min_rows
+        self._rescore = rescore
+        self._compacting = False
+
+        self._dim: int | None = None
+        self._dtype: str = dtype
+        self._segments: list[_Segment] = []
+        self._ivf: _IvfState | None = None
+        self._where: dict[str, tuple[int, int]] = {}
+        # Identity of the manifest file the in-memory state matches (None: no manifest yet).
+        self._stamp: tuple[int, int] | None = None
+        with self._lock:
+            self._reload_if_stale()
+
+    # -- persistence -------------------------------------------------------------------
+
+    def _read_manifest(self) -> dict[str, Any]:
+        try:
+            return json.loads((self._root / "manifest.json").read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+
+    def _reload_if_stale(self) -> None:
+        """Adopt the manifest on disk if another process replaced it. Called with `_lock` held."""
+        stamp = file_stamp(self._root / "manifest.json")
+        if stamp == self._stamp:
+            return
+        manifest = self._read_manifest()
+        self._dim = manifest.get("dim")
+        self._dtype = manifest.get("dtype", self._dtype)
+        # Segments are immutable on disk, so the ones already open are reused; only liveness is reloaded.
+        opened = {seg.name: seg for seg in self._segments}
+        segments = [opened.get(n) or self._open_segment(n) for n in manifest.get("segments", [])]
+        dead: dict[str, list[int]] = {}
+        for name, row in manifest.get("tombstones", []):
+            dead.setdefault(name, []).append(int(row))
+        for seg in segments:
+            alive = np.ones(len(seg.ids), dtype=bool)
+            alive[dead.get(seg.name, [])] = False
+            seg.alive = alive
+        meta = manifest.get("ivf")
+        if not meta:
+            self._ivf = None
+        elif self._ivf is None or self._ivf.name != meta["name"]:
+            centroids = np.load(self._root / f"{meta['name']}.npy")
+            self._ivf = _IvfState(name=meta["name"], centroids=centroids, trained_rows=int(meta["trained_rows"]))
+        self._segments = segments
+        self._stamp = stamp
+        self._reindex()
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """Hold the cross-process manifest lock and `_lock`, with the in-memory state up to date."""
+        self._root.mkdir(parents=True, exist_ok=True)
+        with file_lock(self._root / "manifest.lock"), self._lock:
+            self._reload_if_stale()
+            yield
+
+    def _write_manifest(self) -> None:
+        tombstones = [[seg.name, int(r)] for seg in self._segments for r in np.flatnonzero(~seg.alive)]
+        manifest = {
+            "dim": self._dim,
+            "dtype": self._dtype,
+            "segments": [s.name for s in self._segments],
+            "tombstones": tombstones,
+            "ivf": {"name": self._ivf.name, "trained_rows": self._ivf.trained_rows} if self._ivf else None,
+        }
+        tmp = self._root / "manifest.json.tmp"
+        tmp.write_text(json.dumps(manifest), encoding="utf-8")
+        os.replace(tmp, self._root / "manifest.json")
+        self._stamp = file_stamp(self._root / "manifest.json")
+
+    def _drop_orphans(self, names: list[str]) -> None:
+        # Segments and centroid files this collection wrote but did not get into the manifest (a failed
+        # upsert, a compaction superseded by another process's). Unlisted files of other writers are left
+        # alone: they may be segments another process is about to add.
+        for name in names:
+            shutil.rmtree(self._root / name, ignore_errors=True)
+            (self._root / f"{name}.npy").unlink(missing_ok=True)
+
+    def _open_segment(self, name: str) -> _Segment:
+        d = self._root / name
+        rows = json.loads((d / "rows.json").read_text(encoding="utf-8"))
+        has_lists = rows.get("ivf") is not None
+        dtype = rows.get("dtype", self._dtype)
+        return _Segment(
+            name=name,
+            ids=rows["ids"],
+            texts=rows["texts"],
+            metas=rows["metas"],
+            vectors=np.load(d / "vectors.npy", mmap_mode="r"),
+            norms=np.load(d / "norms.npy"),
+            alive=np.ones(len(rows["ids"]), dtype=bool),
+            dtype=dtype,
+            dim=int(self._dim or 0),
+            scales=np.load(d / "scales.npy") if (d / "scales.npy").exists() else None,
+            full=np.load(d / "full.npy", mmap_mode="r") if (d / "full.npy").exists() else None,
+            ivf=rows.get("ivf"),
+            lists=np.load(d / "lists.npy") if has_lists else None,
+            list_offsets=np.load(d / "list_offsets.npy") if has_lists else None,
+        )
+
+    def _write_segment(
+        self,
+        ids: list[str],
+        texts: list[str],
+        metas: list[dict[str, Any]],
+        blocks: Any,
+        n: int,
+        lists: np.ndarray | None = None,
+        ivf_state: _IvfState | None = None,
+        scales: np.ndarray | None = None,
+    ) -> str:
+        """
+        Write a segment from an iterable of float32 row blocks without materializing all rows.
+
+        With `ivf_state`, rows must already be sorted by `lists` (their nearest centroid).
+        int8 needs the per-dimension `scales` up front, since rows are encoded as they stream in.
+        """
+        name = f"seg_{uuid4().hex[:12]}"
+        d = self._root / name
+        d.mkdir()
+        assert self._dim is not None
+        dtype, dim = self._dtype, self._dim
+        out = np.lib.format.open_memmap(
+            d / "vectors.npy",
+            mode="w+",
+            dtype=quantization.code_dtype(dtype),
+            shape=(n, quantization.code_width(dtype, dim)),
+        )
+        full = None
+        if self._rescore > 0 and dtype != "float32":
+            full = np.lib.format.open_memmap(d / "full.npy", mode="w+", dtype=np.float32, shape=(n, dim))
+        norms = np.empty(n, dtype=np.float32)
+        pos = 0
+        for block in blocks:
+            end = pos + len(block)
+            codes = quantization.encode(block, dtype, scales)
+            out[pos:end] = codes
+            if full is not None:
+                full[pos:end] = block
+            # Norms of what the codes decode to, so estimated distances stay consistent.
+            exact = np.einsum("ij,ij->i", block, block)
+            approx = quantization.decode(codes, dtype, dim=dim, scales=scales, norms=exact)
+            norms[pos:end] = np.einsum("ij,ij->i", approx, approx)
+            pos = end
+        out.flush()
+        del out
+        if full is not None:
+            full.flush()
+            del full
+        np.save(d / "norms.npy", norms)
+        if scales is not None:
+            np.save(d / "scales.npy", scales)
+        if ivf_state is not None:
+            assert lists is not None
+            np.save(d / "lists.npy", lists)
+            np.save(d / "list_offsets.npy", np.searchsorted(lists, np.arange(len(ivf_state.centroids) + 1)))
+        rows = {
+            "ids": ids,
+            "texts": texts,
+            "metas": metas,
+            "dtype": dtype,
+            "ivf": ivf_state.name if ivf_state else None,
+        }
+        (d / "rows.json").write_text(json.dumps(rows), encoding="utf-8")
+        return name
+
+    def _reindex(self) -> None:
+        self._where = {}
+        for si, seg in enumerate(self._segments):
+            for row in np.flatnonzero(seg.alive):
+                self._where[seg.ids[row]] = (si, int(row))
+
+    # -- writes ------------------------------------------------------------------------
+
+    def append(self, ids: list[str], vectors: np.ndarray, texts: list[str], metas: list[dict[str, Any]]) -> None:
+        if not ids:
+            return
+        with self._write_lock:
+            with self._lock:
+                self._reload_if_stale()
+            if self._dim is None:
+                self._dim = int(vectors.shape[1])
+            if vectors.shape[1] != self._dim:
+                raise ValueError(f"vector dimension {vectors.shape[1]} does not match collection dimension {self._dim}")
+            # Last write wins for ids repeated within one batch.
+            last = {_id: i for i, _id in enumerate(ids)}
+            if len(last) != len(ids):
+                keep = sorted(last.values())
+                ids, texts, metas = [ids[i] for i in keep], [texts[i] for i in keep], [metas[i] for i in keep]
+                vectors = vectors[keep]
+            state = self._ivf if self._index == "ivf" else None
+            lists = None
+            if state is not None:
+                lists = ivf.assign(vectors, state.centroids)
+                order = np.argsort(lists, kind="stable")
+                lists, vectors = lists[order], vectors[order]
+                ids, texts, metas = [ids[i] for i in order], [texts[i] for i in order], [metas[i] for i in order]
+            scales = quantization.int8_scales(np.abs(vectors).max(axis=0)) if self._dtype == "int8" else None
+            name = self._write_segment(ids, texts, metas, [vectors], len(ids), lists, state, scales)
+            try:
+                seg = self._open_segment(name)
+                with self._exclusive():
+                    if self._dim is not None and self._dim != seg.dim:
+                        raise ValueError(f"vector dimension {seg.dim} does not match collection dimension {self._dim}")
+                    self._dim = seg.dim
+                    self._kill(ids)
+                    self._segments.append(seg)
+                    si = len(self._segments) - 1
+                    for row, _id in enumerate(ids):
+                        self._where[_id] = (si, row)
+                    self._write_manifest()
+            except BaseException:
+                self._drop_orphans([name])
+                raise
+        self._maybe_compact()
+
+    def delete(self, ids: list[str]) -> None:
+        with self._write_lock:
+            with self._exclusive():
+                self._kill(ids)
+                self._write_manifest()
+        self._maybe_compact()
+
+    def _kill(self, ids: list[str]) -> None:
+        rows: dict[int, list[int]] = {}
+        for _id in ids:
+            loc = self._where.pop(_id, None)
+            if loc is not None:
+                rows.setdefault(loc[0], []).append(loc[1])
+        for si, dead in rows.items():
+            seg = self._segments[si]
+            alive = seg.alive.copy()
+            alive[dead] = False
+            seg.alive = alive
+
+    # -- compaction --------------------------------------------------------------------
+
+    def _needs_compaction(self) -> bool:
+        total = sum(len(s.ids) for s in self._segments)
+        live = len(self._where)
+        dead = total - live
+        if len(self._segments) > self._max_segments or (total > 0 and dead / total > self._dead_ratio):
+            return True
+        return self._index == "ivf" and live >= self._ivf_min_rows and self._needs_training(live)
+
+    def _needs_training(self, live: int) -> bool:
+        return self._ivf is None or live >= 2 * self._ivf.trained_rows
+
+    def _maybe_compact(self) -> None:
+        with self._lock:
+            if self._compacting or not self._needs_compaction():
+                return
+            self._compacting = True
+        threading.Thread(target=self._compact_background, name="vector-compaction", daemon=True).start()
+
+    def _compact_background(self) -> None:
+        try:
+            with self._compact_lock:
+                self._compact()
+        except Exception:
+            logger.exception("Vector store compaction failed for %s", self._root)
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def compact(self) -> None:
+        """Rewrite live rows into a single segment, waiting for a running background compaction first."""
+        with self._compact_lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        with self._lock:
+            self._reload_if_stale()
+            snapshot = [(seg, np.flatnonzero(seg.alive)) for seg in self._segments]
+        if not snapshot:
+            return
+        src_seg = np.concatenate([np.full(len(rows), si, dtype=np.int64) for si, (_, rows) in enumerate(snapshot)])
+        src_row = np.concatenate([rows for _, rows in snapshot]).astype(np.int64)
+        n = len(src_row)
+
+        def _gather(positions: np.ndarray) -> np.ndarray:
+            out = np.empty((len(positions), self._dim or 0), dtype=np.float32)
+            segs = src_seg[positions]
+            for si in np.unique(segs):
+                sel = segs == si
+                out[sel] = snapshot[si][0].rows(src_row[positions[sel]])
+            return out
+
+        state: _IvfState | None = None
+        trained: str | None = None
+        lists: np.ndarray | None = None
+        order = np.arange(n)
+        if self._index == "ivf" and n >= self._ivf_min_rows:
+            state = self._ivf
+            if self._needs_training(n):
+                rng = np.random.default_rng(n)
+                sample = np.sort(rng.choice(n, size=min(n, _IVF_TRAIN_SAMPLE), replace=False))
+                nlist = self._ivf_nlist or ivf.auto_nlist(n)
+                state = _IvfState(
+                    name=f"ivf_{uuid4().hex[:12]}",
+                    centroids=ivf.train_kmeans(_gather(sample), nlist),
+                    trained_rows=n,
+                )
+                np.save(self._root / f"{state.name}.npy", state.centroids)
+                trained = state.name
+            assert state is not None
+            lists = np.concatenate(
+                [
+                    ivf.assign(_gather(np.arange(start, min(n, start + _COMPACT_BLOCK_ROWS))), state.centroids)
+                    for start in range(0, n, _COMPACT_BLOCK_ROWS)
+                ]
+            )
+            order = np.argsort(lists, kind="stable")
+            lists = lists[order]
+
+        blocks = [np.arange(start, min(n, start + _COMPACT_BLOCK_ROWS)) for start in range(0, n, _COMPACT_BLOCK_ROWS)]
+        scales = None
+        if self._dtype == "int8" and n:
+            absmax = np.zeros(self._dim or 0, dtype=np.float32)
+            for positions in blocks:
+                absmax = np.maximum(absmax, np.abs(_gather(positions)).max(axis=0))
+            scales = quantization.int8_scales(absmax)
+
+        name = None
+        if n:
+            name = self._write_segment(
+                [snapshot[src_seg[i]][0].ids[src_row[i]] for i in order],
+                [snapshot[src_seg[i]][0].texts[src_row[i]] for i in order],
+                [snapshot[src_seg[i]][0].metas[src_row[i]] for i in order],
+                (_gather(order[start : start + _COMPACT_BLOCK_ROWS]) for start in range(0, n, _COMPACT_BLOCK_ROWS)),
+                n,
+                lists,
+                state,
+                scales,
+            )
+            merged = self._open_segment(name)
+
+        old = [seg for seg, _ in snapshot]
+        with self._write_lock:
+            with self._exclusive():
+                if [seg.name for seg in self._segments[: len(old)]] != [seg.name for seg in old]:
+                    # Another process compacted (or dropped) the collection meanwhile; its result stands.
+                    self._drop_orphans([n for n in (name, trained) if n is not None])
+                    return
+                # Rows overwritten or deleted while compaction ran stay dead in the merged segment.
+                if name is not None:
+                    merged.alive = np.array(
+                        [snapshot[src_seg[i]][0].alive[src_row[i]] for i in order], dtype=bool
+                    )
+                    self._segments = [merged] + self._segments[len(old) :]
+                else:
+                    self._segments = self._segments[len(old) :]
+                previous = self._ivf
+                if state is not None:
+                    self._ivf = state
+                self._reindex()
+                self._write_manifest()
+        for seg in old:
+            shutil.rmtree(self._root / seg.name, ignore_errors=True)
+        if previous is not None and state is not None and previous.name != state.name:
+            (self._root / f"{previous.name}.npy").unlink(missing_ok=True)
+
+    # -- reads -------------------------------------------------------------------------
+
+    def get(self, ids: list[str]) -> dict[str, tuple[np.ndarray, str, dict[str, Any]]]:
+        with self._lock:
+            self._reload_if_stale()
+            found = {_id: self._where[_id] for _id in ids if _id in self._where}
+            segments = list(self._segments)
+        out: dict[str, tuple[np.ndarray, str, dict[str, Any]]] = {}
+        for _id, (si, row) in found.items():
+            seg = segments[si]
+            out[_id] = (seg.rows(np.array([row]))[0], seg.texts[row], dict(seg.metas[row]))
+        return out
+
+    def search(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+        where: dict[str, Any] | None,
+        nprobe: int | None = None,
+        *,
+        ids: list[str] | None = None,
+    ) -> list[list[tuple[float, _Segment, int]]]:
+        """
+        Top-k rows per query row, scored as negative squared L2 distance (Chroma's default space).
+
+        `ids` restricts the search to those rows; a small candidate set is scored exactly,
+        reading only its own rows, so a selective pre-filter makes the query cheaper.
+        """
+        n_q = queries.shape[0]
+        with self._lock:
+            self._reload_if_stale()
+            snapshot = [(seg, seg.alive) for seg in self._segments]
+            state = self._ivf if self._index == "ivf" else None
+            allowed = None
+            if ids is not None:
+                allowed = [np.zeros(len(seg.ids), dtype=bool) for seg, _ in snapshot]
+                for loc in filter(None, map(self._where.get, ids)):
+                    allowed[loc[0]][loc[1]] = True
+        if top_k <= 0 or not snapshot:
+            return [[] for _ in range(n_q)]
+        if self._dim is not None and queries.shape[1] != self._dim:
+            raise ValueError(f"query dimension {queries.shape[1]} does not match collection dimension {self._dim}")
+
+        # [n_q, nlist] lists each query probes; segments written against other centroids are scanned exactly.
+        table = ivf.probe(queries, state.centroids, nprobe or settings.ivf_nprobe) if state else None
+        q_norms = np.einsum("ij,ij->i", queries, queries)
+        rescoring = self._rescore > 0 and self._dtype != "float32"
+        fetch = top_k * self._rescore if rescoring else top_k
+        cand_scores: list[np.ndarray] = []  # each [k_i, n_q]
+        cand_seg: list[np.ndarray] = []
+        cand_row: list[np.ndarray] = []
+        for si, (seg, alive) in enumerate(snapshot):
+            mask = alive if not where else alive & _where_mask(seg, where)
+            if allowed is not None:
+                mask = mask & allowed[si]
+            use_ivf = (
+                table is not None
+                and seg.ivf == state.name  # type: ignore[union-attr]
+                and int(mask.sum()) > self._ivf_min_rows
+            )
+            if use_ivf:
+                assert table is not None and seg.list_offsets is not None and seg.lists is not None
+                offsets = seg.list_offsets
+                rows = np.concatenate(
+                    [np.arange(offsets[lst], offsets[lst + 1]) for lst in np.flatnonzero(table.any(axis=0))]
+                )
+                rows = rows[mask[rows]]
+            else:
+                rows = np.flatnonzero(mask)
+            if len(rows) == 0:
+                continue
+            full = len(rows) == len(seg.ids)
+            block_size = max(256, _SEARCH_BLOCK_ELEMS // max(1, seg.vectors.shape[1]))
+            for start in range(0, len(rows), block_size):
+                block_rows = rows[start : start + block_size]
+                if full:
+                    block = seg.vectors[block_rows[0] : block_rows[-1] + 1]
+                else:
+                    block = seg.vectors[block_rows]
+                dots = quantization.dots(
+                    block, queries, seg.dtype, dim=seg.dim, scales=seg.scales, norms=seg.norms[block_rows]
+                )  # [rows, n_q]
+                scores = 2.0 * dots - seg.norms[block_rows][:, None] - q_norms[None, :]
+                if use_ivf and n_q > 1:
+                    # Rows from a list probed by another query in the batch do not count for this one.
+                    scores[~table[:, seg.lists[block_rows]].T] = -np.inf  # type: ignore[index]
+                k = min(fetch, len(block_rows))
+                if k < len(block_rows):
+                    top = np.argpartition(-scores, k - 1, axis=0)[:k]
+                else:
+                    top = np.broadcast_to(np.arange(len(block_rows))[:, None], (k, n_q))
+                cand_scores.append(np.take_along_axis(scores, top, axis=0))
+                cand_row.append(block_rows[top])
+                cand_seg.append(np.full(top.shape, si, dtype=np.int64))
+
+        if not cand_scores:
+            return [[] for _ in range(n_q)]
+        all_scores = np.concatenate(cand_scores, axis=0)
+        all_rows = np.concatenate(cand_row, axis=0)
+        all_segs = np.concatenate(cand_seg, axis=0)
+        k = min(fetch, all_scores.shape[0])
+        out: list[list[tuple[float, _Segment, int]]] = []
+        for j in range(n_q):
+            col = all_scores[:, j]
+            top = np.argpartition(-col, k - 1)[:k] if k < len(col) else np.arange(len(col))
+            top = top[np.argsort(-col[top], kind="stable")]
+            top = top[np.isfinite(col[top])]
+            hits = [(float(col[i]), snapshot[int(all_segs[i, j])][0], int(all_rows[i, j])) for i in top]
+            out.append(_rescore(queries[j], hits)[:top_k] if rescoring else hits)
+        return out
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            self._reload_if_stale()
+            total = sum(len(s.ids) for s in self._segments)
+            live = len(self._where)
+            segments = len(self._segments)
+            compacting = self._compacting
+        disk = sum(f.stat().st_size for f in self._root.rglob("*") if f.is_file())
+        return {
+            "backend": "numpy",
+            "dim": self._dim,
+            "dtype": self._dtype,
+            "segments": segments,
+            "rows": total,
+            "live_rows": live,
+            "tombstones": total - live,
+            "compacting": compacting,
+            "rescore": self._rescore if self._dtype != "float32" else 0,
+            "index": self._index,
+            "ivf_nlist": len(self._ivf.centroids) if self._ivf else None,
+            "ivf_trained_rows": self._ivf.trained_rows if self._ivf else None,
+            "disk_bytes": disk,
+        }
+
+
+class NumpyVectorStore:
+    """
+    In-process `VectorStore` backed by per-KB memory-mapped NumPy matrices.
+
+    Search is a batched matrix product with `argpartition` top-k, exact by default or
+    restricted to the nearest IVF lists with `NUMPY_STORE_INDEX=ivf`; metadata filters
+    (Chroma `where` syntax) are evaluated against per-segment columnar arrays.
+    """
+
+    def __init__(self, root: Path | None = None) -> None:
+        self._root = root or settings.numpy_store_dir
+        self._lock = threading.Lock()
+        self._collections: dict[str, _Collection] = {}
+
+    def _collection(self, kb_id: str) -> _Collection:
+        with self._lock:
+            col = self._collections.get(kb_id)
+            if col is None:
+                col = _Collection(
+                    self._root / f"kb_{kb_id}",
+                    dtype=settings.numpy_store_dtype,
+                    max_segments=settings.numpy_store_max_segments,
+                    dead_ratio=settings.numpy_store_compact_dead_ratio,
+                    index=settings.numpy_store_index,
+                    ivf_nlist=settings.ivf_nlist,
+                    ivf_min_rows=settings.ivf_min_rows,
+                    rescore=settings.numpy_store_rescore,
+                )
+                self._collections[kb_id] = col
+            return col
+
+    def upsert(
+        self,
+        *,
+        kb_id: str,
+        ids: list[str],
+        vectors: np.ndarray,
+        texts: list[str],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        if not (len(ids) == len(vectors) == len(texts) == len(metadatas)):
+            raise ValueError("ids/vectors/texts/metadatas lengths must match")
+        if not ids:
+            return
+        # Ensure kb_id is always present for filtering/debugging (a routed write already carries the KB's own id)
+        metadatas = [{"kb_id": kb_id, **m} for m in metadatas]
+        self._collection(kb_id).append(list(ids), np.asarray(vectors, dtype=np.float32), list(texts), metadatas)
+
+    def get_vectors(self, *, kb_id: str, ids: list[str]) -> dict[str, np.ndarray]:
+        if not ids:
+            return {}
+        return {_id: vec for _id, (vec, _, _) in self._collection(kb_id).get(ids).items()}
+
+    def update_metadata(self, *, kb_id: str, ids: list[str], metadatas: list[dict[str, Any]]) -> None:
+        if len(ids) != len(metadatas):
+            raise ValueError("ids/metadatas lengths must match")
+        if not ids:
+            return
+        col = self._collection(kb_id)
+        current = col.get(ids)
+        # Rows are immutable; re-append the existing vector and text with the new metadata.
+        keep = [i for i, _id in enumerate(ids) if _id in current]
+        if not keep:
+            return
+        col.append(
+            [ids[i] for i in keep],
+            np.stack([current[ids[i]][0] for i in keep]),
+            [current[ids[i]][1] for i in keep],
+            [{"kb_id": kb_id, **metadatas[i]} for i in keep],
+        )
+
+    def delete(self, *, kb_id: str, ids: list[str]) -> None:
+        if not ids:
+            return
+        self._collection(kb_id).delete(list(ids))
+
+    def query(
+        self,
+        *,
+        kb_id: str,
+        query_vector: np.ndarray,
+        top_k: int,
+        where: dict[str, Any] | None = None,
+        query_text: str | None = None,
+        ids: list[str] | None = None,
+    ) -> list[VectorSearchResult]:
+        # query_text is only used by stores that re-score with the raw question.
+        return self.query_many(
+            kb_id=kb_id, query_vectors=np.asarray(query_vector)[None, :], top_k=top_k, where=where, ids=ids
+        )[0]
+
+    def query_many(
+        self,
+        *,
+        kb_id: str,
+        query_vectors: np.ndarray,
+        top_k: int,
+        where: dict[str, Any] | None = None,
+        nprobe: int | None = None,
+        ids: list[str] | None = None,
+        query_texts: list[str] | None = None,
+    ) -> list[list[VectorSearchResult]]:
+        """Search several query vectors with one matrix product per segment block (`nprobe` overrides IVF_NPROBE)."""
+        # query_texts is only used by stores that re-score with the raw questions.
+        queries = np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), -1)
+        hits = self._collection(kb_id).search(queries, top_k, where, nprobe, ids=ids)
+        return [
+            [
+                VectorSearchResult(id=seg.ids[row], score=score, text=seg.texts[row], meta=dict(seg.metas[row]))
+                for score, seg, row in per_query
+            ]
+            for per_query in hits
+        ]
+
+    def compact(self, kb_id: str) -> None:
+        self._collection(kb_id).compact()
+
+    def drop(self, kb_id: str) -> None:
+        """Delete a collection and its files (waits for a running compaction of it first)."""
+        with self._lock:
+            col = self._collections.pop(kb_id, None)
+        if col is not None:
+            with col._compact_lock:
+                pass
+        shutil.rmtree(self._root / f"kb_{kb_id}", ignore_errors=True)
+
+    def stats(self, kb_id: str) -> dict[str, Any]:
+        return self._collection(kb_id).stats()
+
+
+def _rescore(query: np.ndarray, hits: list[tuple[float, _Segment, int]]) -> list[tuple[float, _Segment, int]]:
+    """Replace estimated scores with exact ones where the segment kept a float32 copy, and re-sort."""
+    q_norm = float(query @ query)
+    out = []
+    for score, seg, row in hits:
+        if seg.full is not None:
+            v = np.asarray(seg.full[row], dtype=np.float32)
+            score = float(2.0 * (v @ query) - v @ v - q_norm)
+        out.append((score, seg, row))
+    out.sort(key=lambda h: -h[0])
+    return out
+
+
+def _is_number(v: Any) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _where_mask(seg: _Segment, where: dict[str, Any]) -> np.ndarray:
+    mask = np.ones(len(seg.ids), dtype=bool)
+    for key, cond in where.items():
+        if key == "$and":
+            for sub in cond:
+                mask &= _where_mask(seg, sub)
+        elif key == "$or":
+            any_mask = np.zeros(len(seg.ids), dtype=bool)
+            for sub in cond:
+                any_mask |= _where_mask(seg, sub)
+            mask &= any_mask
+        elif key.startswith("$"):
+            raise ValueError(f"unsupported filter operator: {key}")
+        else:
+            ops = cond if isinstance(cond, dict) else {"$eq": cond}
+            for op, value in ops.items():
+                mask &= _field_mask(seg, key, op, value)
+    return mask
+
+
+def _field_mask(seg: _Segment, key: str, op: str, value: Any) -> np.ndarray:
+    col = seg.column(key)
+    if op in {"$eq", "$ne", "$in", "$nin"}:
+        wanted = [value] if op in {"$eq", "$ne"} else list(value)
+        if col.vocab is None:
+            numbers = [float(v) for v in wanted if _is_number(v)]
+            hit = np.isin(col.values, numbers) if numbers else np.zeros(len(col.values), dtype=bool)
+        else:
+            codes = [col.vocab[v] for v in wanted if v in col.vocab]
+            hit = np.isin(col.values, codes) if codes else np.zeros(len(col.values), dtype=bool)
+        return col.present & (hit if op in {"$eq", "$in"} else ~hit)
+    if op in {"$gt", "$gte", "$lt", "$lte"}:
+        if col.vocab is not None or not _is_number(value):
+            raise ValueError(f"{op} filter on '{key}' requires numeric metadata and a numeric value")
+        with np.errstate(invalid="ignore"):
+            cmp = {
+                "$gt": col.values > value,
+                "$gte": col.values >= value,
+                "$lt": col.values < value,
+                "$lte": col.values <= value,
+            }[op]
+        return col.present & cmp
+    raise ValueError(f"unsupported filter operator: {op}")
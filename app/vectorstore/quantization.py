@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import numpy as np
+
+DTYPES = ("float32", "float16", "int8", "binary")
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def code_width(dtype: str, dim: int) -> int:
+    """Columns of the stored code matrix for `dim`-dimensional vectors."""
+    return (dim + 7) // 8 if dtype == "binary" else dim
+
+
+def code_dtype(dtype: str) -> str:
+    return {"float32": "float32", "float16": "float16", "int8": "int8", "binary": "uint8"}[dtype]
+
+
+def int8_scales(absmax: np.ndarray) -> np.ndarray:
+    """Per-dimension scales mapping [-absmax, absmax] onto [-127, 127]."""
+    return (np.maximum(absmax, 1e-12) / 127.0).astype(np.float32)
+
+
+def encode(block: np.ndarray, dtype: str, scales: np.ndarray | None = None) -> np.ndarray:
+    """Quantize float32 rows; int8 needs per-dimension `scales`, binary keeps one sign bit per dimension."""
+    if dtype == "int8":
+        assert scales is not None
+        return np.clip(np.rint(block / scales), -127, 127).astype(np.int8)
+    if dtype == "binary":
+        return np.packbits(block > 0, axis=1)
+    return block.astype(dtype)
+
+
+def decode(codes: np.ndarray, dtype: str, *, dim: int, scales: np.ndarray | None, norms: np.ndarray) -> np.ndarray:
+    """Approximate float32 rows; binary codes decode to sign vectors rescaled to the stored norms."""
+    if dtype == "int8":
+        assert scales is not None
+        return np.asarray(codes, dtype=np.float32) * scales
+    if dtype == "binary":
+        signs = np.unpackbits(np.asarray(codes), axis=1, count=dim).astype(np.float32) * 2.0 - 1.0
+        return signs * (np.sqrt(norms) / np.sqrt(dim))[:, None]
+    return np.asarray(codes, dtype=np.float32)
+
+
+def dots(
+    codes: np.ndarray,
+    queries: np.ndarray,
+    dtype: str,
+    *,
+    dim: int,
+    scales: np.ndarray | None,
+    norms: np.ndarray,
+) -> np.ndarray:
+    """[rows, n_queries] (estimated) inner products between stored rows and float32 queries."""
+    if dtype == "int8":
+        assert scales is not None
+        # (codes * scales) . q == codes . (q * scales)
+        return np.asarray(codes, dtype=np.float32) @ (queries * scales).T
+    if dtype == "binary":
+        # Angle estimated from the Hamming distance between sign bits (random-hyperplane LSH).
+        q_bits = np.packbits(queries > 0, axis=1)
+        ham = hamming(np.asarray(codes), q_bits).astype(np.float32)
+        q_norms = np.linalg.norm(queries, axis=1)
+        return np.cos(np.pi * ham / dim) * np.sqrt(norms)[:, None] * q_norms[None, :]
+    return np.asarray(codes, dtype=np.float32) @ queries.T
+
+
+def hamming(codes: np.ndarray, q_bits: np.ndarray) -> np.ndarray:
+    """[rows, n_queries] Hamming distances between packed bit rows."""
+    xor = codes[:, None, :] ^ q_bits[None, :, :]
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor).sum(axis=2, dtype=np.int32)
+    return _POPCOUNT[xor].sum(axis=2, dtype=np.int32)
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+from app.vectorstore.base import VectorSearchResult, VectorStore
+
+# Routes resolved from the database are re-read after this long, so a switch made by another
+# process is picked up well within the replaced collection's grace period.
+_ROUTE_TTL_S = 2.0
+
+_kb_locks: dict[str, threading.RLock] = {}
+_kb_locks_guard = threading.Lock()
+
+
+def kb_write_lock(kb_id: str) -> threading.RLock:
+    """
+    Per-KB lock held around "resolve the KB's model, embed, write" sequences (ingestion windows)
+    and around a re-embedding's switch-over, so no vector embedded with the old model is written
+    after the switch. Process-wide.
+    """
+    with _kb_locks_guard:
+        lock = _kb_locks.get(kb_id)
+        if lock is None:
+            lock = _kb_locks[kb_id] = threading.RLock()
+        return lock
+
+
+def collection_key(kb_id: str, generation: int) -> str:
+    """Backend collection of one generation of a KB's vectors; generation 0 keeps the original name."""
+    return kb_id if generation == 0 else f"{kb_id}.g{generation}"
+
+
+def parse_collection_key(key: str) -> tuple[str, int]:
+    """(kb_id, generation) of a `collection_key`."""
+    kb_id, sep, generation = key.rpartition(".g")
+    return (kb_id, int(generation)) if sep and generation.isdigit() else (key, 0)
+
+
+@dataclass
+class _Route:
+    serving: int
+    shadow: int | None
+    model: str
+    resolved_at: float
+
+
+class RoutedVectorStore:
+    """
+    VectorStore that sends each KB to the collection currently serving it.
+
+    Rows keep the KB's own id in their `kb_id` metadata whichever collection holds them.
+
+    Re-embedding a KB (app.ingest.reembed) builds a new generation of its collection while
+    queries keep using the serving one. Meanwhile, deletes and metadata updates are applied
+    to both, so the shadow never brings back a chunk removed during the rebuild; new vectors
+    only go to the serving collection, and the re-embedding picks their chunks up from SQLite.
+
+    Questions must be embedded with `embedding_model(kb_id)`, read from the same cached route
+    as the collection, so a search never pairs one model's question with the other's vectors
+    while routes lag behind a switch. `invalidate` makes this process follow a change at once;
+    other processes follow within `_ROUTE_TTL_S`.
+    """
+
+    def __init__(self, base: VectorStore, *, resolve: Callable[[str], tuple[int, int | None, str]]) -> None:
+        self._base = base
+        self._resolve = resolve
+        self._routes: dict[str, _Route] = {}
+        self._lock = threading.Lock()
+
+    def _route(self, kb_id: str) -> _Route:
+        now = time.monotonic()
+        with self._lock:
+            route = self._routes.get(kb_id)
+        if route is None or now - route.resolved_at > _ROUTE_TTL_S:
+            serving, shadow, model = self._resolve(kb_id)
+            route = _Route(serving=serving, shadow=shadow, model=model, resolved_at=now)
+            with self._lock:
+                self._routes[kb_id] = route
+        return route
+
+    def invalidate(self, kb_id: str) -> None:
+        """Re-read the KB's route on next use (after a re-embedding started, switched or ended)."""
+        with self._lock:
+            self._routes.pop(kb_id, None)
+
+    def embedding_model(self, kb_id: str) -> str:
+        """Model of the vectors in the KB's serving collection."""
+        return self._route(kb_id).model
+
+    def _serving(self, kb_id: str) -> str:
+        return collection_key(kb_id, self._route(kb_id).serving)
+
+    def _targets(self, kb_id: str) -> list[str]:
+        route = self._route(kb_id)
+        keys = [collection_key(kb_id, route.serving)]
+        if route.shadow is not None and route.shadow != route.serving:
+            keys.append(collection_key(kb_id, route.shadow))
+        return keys
+
+    def upsert(
+        self,
+        *,
+        kb_id: str,
+        ids: list[str],
+        vectors: np.ndarray,
+        texts: list[str],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        metadatas = [{**m, "kb_id": kb_id} for m in metadatas]
+        self._base.upsert(kb_id=self._serving(kb_id), ids=ids, vectors=vectors, texts=texts, metadatas=metadatas)
+
+    def upsert_generation(
+        self,
+        *,
+        kb_id: str,
+        generation: int,
+        ids: list[str],
+        vectors: np.ndarray,
+        texts: list[str],
+        metadatas: list[dict[str, Any]],
+    ) -> None:
+        """Write into one generation of a KB's vectors directly (the shadow collection being built)."""
+        metadatas = [{**m, "kb_id": kb_id} for m in metadatas]
+        self._base.upsert(
+            kb_id=collection_key(kb_id, generation), ids=ids, vectors=vectors, texts=texts, metadatas=metadatas
+        )
+
+    def get_vectors(self, *, kb_id: str, ids: list[str]) -> dict[str, np.ndarray]:
+        return self._base.get_vectors(kb_id=self._serving(kb_id), ids=ids)
+
+    def update_metadata(self, *, kb_id: str, ids: list[str], metadatas: list[dict[str, Any]]) -> None:
+        metadatas = [{**m, "kb_id": kb_id} for m in metadatas]
+        for key in self._targets(kb_id):
+            self._base.update_metadata(kb_id=key, ids=ids, metadatas=metadatas)
+
+    def delete(self, *, kb_id: str, ids: list[str]) -> None:
+        for key in self._targets(kb_id):
+            self._base.delete(kb_id=key, ids=ids)
+
+    def query(
+        self,
+        *,
+        kb_id: str,
+        query_vector: np.ndarray,
+        top_k: int,
+        where: dict[str, Any] | None = None,
+        query_text: str | None = None,
+        ids: list[str] | None = None,
+    ) -> list[VectorSearchResult]:
+        return self._base.query(
+            kb_id=self._serving(kb_id), query_vector=query_vector, top_k=top_k, where=where, query_text=query_text, ids=ids
+        )
+
+    def query_many(
+        self,
+        *,
+        kb_id: str,
+        query_vectors: np.ndarray,
+        top_k: int,
+        where: dict[str, Any] | None = None,
+        ids: list[str] | None = None,
+        query_texts: list[str] | None = None,
+    ) -> list[list[VectorSearchResult]]:
+        key = self._serving(kb_id)
+        query_many = getattr(self._base, "query_many", None)
+        if query_many is not None:
+            return query_many(
+                kb_id=key, query_vectors=query_vectors, top_k=top_k, where=where, ids=ids, query_texts=query_texts
+            )
+        texts = query_texts or [None] * len(query_vectors)
+        return [
+            self._base.query(kb_id=key, query_vector=qv, top_k=top_k, where=where, query_text=q, ids=ids)
+            for qv, q in zip(query_vectors, texts)
+        ]
+
+    def drop_generation(self, *, kb_id: str, generation: int) -> None:
+        """Delete one generation's collection (a replaced or abandoned one); never the serving one."""
+        if generation == self._route(kb_id).serving:
+            raise ValueError(f"generation {generation} of KB {kb_id} is serving")
+        drop = getattr(self._base, "drop", None)
+        if drop is not None:
+            drop(collection_key(kb_id, generation))
+
+    def compact(self, kb_id: str) -> None:
+        compact = getattr(self._base, "compact", None)
+        if compact is not None:
+            compact(self._serving(kb_id))
+
+    def stats(self, kb_id: str) -> dict[str, Any]:
+        route = self._route(kb_id)
+        stats = getattr(self._base, "stats", None)
+        out = stats(collection_key(kb_id, route.serving)) if stats is not None else {}
+        return {**out, "generation": route.serving, "shadow_generation": route.shadow}
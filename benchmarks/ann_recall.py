@@ -0,0 +1,115 @@
+"""
+Recall@k vs. latency of the numpy store's IVF index, with exact search as ground truth.
+
+Builds a KB of clustered synthetic unit-norm vectors (a Gaussian mixture, closer to real
+embeddings than uniform noise), compacts it so the IVF centroids are trained, then sweeps
+`nprobe`. Queries are perturbed copies of stored vectors; ground truth is brute force.
+
+Usage:
+    python benchmarks/ann_recall.py [--vectors 200000] [--dim 384] [--k 10] [--nprobe 1,2,4,8,16,32,64]
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.settings import settings  # noqa: E402
+from app.vectorstore.numpy_store import NumpyVectorStore  # noqa: E402
+
+
+def _dataset(n: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(clusters, size=n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--vectors", type=int, default=200_000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--clusters", type=int, default=500)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--nlist", type=int, default=0)
+    ap.add_argument("--nprobe", default="1,2,4,8,16,32,64")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    data = _dataset(args.vectors, args.dim, args.clusters, rng)
+    picks = rng.integers(args.vectors, size=args.queries)
+    queries = data[picks] + 0.3 * rng.standard_normal((args.queries, args.dim)).astype(np.float32) / np.sqrt(args.dim)
+
+    # Ground truth: exact L2 top-k.
+    d2 = (
+        np.einsum("ij,ij->i", data, data)[None, :]
+        - 2.0 * (queries @ data.T)
+        + np.einsum("ij,ij->i", queries, queries)[:, None]
+    )
+    truth = [set(np.argpartition(row, args.k)[: args.k].tolist()) for row in d2]
+    del d2
+
+    settings.numpy_store_max_segments = 10**6  # no background compaction while loading
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.numpy_store_index = "ivf"
+        settings.ivf_nlist = args.nlist
+        settings.ivf_min_rows = args.vectors + 1  # load without training
+        loader = NumpyVectorStore(Path(tmp))
+        t0 = time.perf_counter()
+        for start in range(0, args.vectors, 4096):
+            end = min(args.vectors, start + 4096)
+            loader.upsert(
+                kb_id="bench",
+                ids=[str(i) for i in range(start, end)],
+                vectors=data[start:end],
+                texts=[""] * (end - start),
+                metadatas=[{}] * (end - start),
+            )
+        ingest_s = time.perf_counter() - t0
+
+        # Reopen the same files with a low training threshold; compaction trains the centroids.
+        settings.ivf_min_rows = 1000
+        store = NumpyVectorStore(Path(tmp))
+        t0 = time.perf_counter()
+        store.compact("bench")
+        train_s = time.perf_counter() - t0
+        stats = store.stats("bench")
+        print(
+            f"vectors={args.vectors} dim={args.dim} nlist={stats['ivf_nlist']} "
+            f"ingest={ingest_s:.1f}s compact+train={train_s:.1f}s"
+        )
+        settings.numpy_store_index = "flat"
+        exact = NumpyVectorStore(Path(tmp))
+
+        def _sweep(label: str, run) -> None:
+            latencies, recalls = [], []
+            for q, gt in zip(queries, truth):
+                t = time.perf_counter()
+                hits = run(q)
+                latencies.append((time.perf_counter() - t) * 1000.0)
+                recalls.append(len(gt & {int(h.id) for h in hits}) / args.k)
+            latencies.sort()
+            print(
+                f"{label:>12}: recall@{args.k}={statistics.mean(recalls):.3f} "
+                f"p50={statistics.median(latencies):.2f}ms p99={latencies[int(0.99 * (len(latencies) - 1))]:.2f}ms"
+            )
+
+        for nprobe in [int(x) for x in args.nprobe.split(",")]:
+            _sweep(
+                f"nprobe={nprobe}",
+                lambda q, p=nprobe: store.query_many(kb_id="bench", query_vectors=q[None, :], top_k=args.k, nprobe=p)[0],
+            )
+
+        _sweep("exact", lambda q: exact.query(kb_id="bench", query_vector=q, top_k=args.k))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+CPU embedding throughput (chunks/sec) on a synthetic mixed-length corpus.
+
+Compares the previous fixed batch of 8 in input order against the length-bucketed,
+token-budgeted batching used by HuggingFaceDenseEmbedder. The embedding cache is
+bypassed so every chunk hits the model.
+
+Usage:
+    python benchmarks/embedding_throughput.py [--chunks 512]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+import torch
+
+from app.core.settings import settings
+from app.embeddings.hf_dense import HuggingFaceDenseEmbedder, _load, _mean_pool
+
+WORDS = "the old king of veyra rode north through ash and snow to the gate of the silent order".split()
+
+
+def _corpus(n: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        # Mostly short chunks with a long tail, like real chunked lore.
+        length = rng.choice([8, 12, 20, 30, 40, 60, 250])
+        out.append(" ".join(rng.choice(WORDS) for _ in range(length)))
+    return out
+
+
+def _fixed_batches(texts: list[str], batch_size: int = 8) -> None:
+    tok, model, device = _load()
+    for i in range(0, len(texts), batch_size):
+        enc = tok(
+            texts[i : i + batch_size],
+            padding=True,
+            truncation=True,
+            max_length=settings.embedding_max_length,
+            return_tensors="pt",
+        )
+        enc = {k: v.to(device) for k, v in enc.items()}
+        with torch.no_grad():
+            res = model(**enc)
+            _mean_pool(res.last_hidden_state, enc["attention_mask"])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=512)
+    args = ap.parse_args()
+
+    texts = _corpus(args.chunks)
+    _load()
+    embedder = HuggingFaceDenseEmbedder(use_cache=False)
+    embedder.embed_texts(texts[:8])  # warm-up
+
+    t0 = time.perf_counter()
+    _fixed_batches(texts)
+    fixed = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    embedder.embed_texts(texts)
+    bucketed = time.perf_counter() - t0
+
+    print(f"chunks={len(texts)} device={settings.embedding_device}")
+    print(f"fixed batch=8:    {len(texts) / fixed:8.1f} chunks/sec")
+    print(
+        f"length-bucketed:  {len(texts) / bucketed:8.1f} chunks/sec "
+        f"(batch_size={settings.embedding_batch_size}, token_budget={settings.embedding_token_budget})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Latency of federated retrieval across several KBs vs. a single-KB query.
+
+Builds `--kbs` numpy collections of `--vectors` random rows each (temp dir), then times
+`RetrievalService.aretrieve_with_vector` on one KB against `afederated_retrieve` over all
+of them with 1..`--questions` query vectors. The embedding step is excluded: with the
+micro-batcher the extra questions ride in the same forward pass. Lexical search is off,
+since the synthetic KBs have no FTS rows.
+
+Usage:
+    python benchmarks/federated_query.py [--kbs 3] [--questions 3] [--vectors 20000] [--runs 50]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+_TMP = tempfile.TemporaryDirectory()
+# Packing reads chunk offsets from SQLite; point the engine at a scratch DB before importing the app.
+os.environ["SQLITE_PATH"] = str(Path(_TMP.name) / "app.db")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.settings import settings  # noqa: E402
+from app.db.session import init_db  # noqa: E402
+from app.rag.retriever import RetrievalService  # noqa: E402
+from app.vectorstore.numpy_store import NumpyVectorStore  # noqa: E402
+
+
+def _unit(rng: np.random.Generator, n: int, dim: int) -> np.ndarray:
+    v = rng.standard_normal((n, dim)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+async def _time(fn, runs: int) -> list[float]:
+    await fn()  # warm the collections and the executor
+    out = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        await fn()
+        out.append((time.perf_counter() - t) * 1000.0)
+    return out
+
+
+async def _run(args: argparse.Namespace) -> None:
+    rng = np.random.default_rng(0)
+    store = NumpyVectorStore(Path(_TMP.name) / "vectors")
+    kb_ids = [f"kb{i}" for i in range(args.kbs)]
+    for kb_id in kb_ids:
+        for start in range(0, args.vectors, 4096):
+            end = min(args.vectors, start + 4096)
+            store.upsert(
+                kb_id=kb_id,
+                ids=[f"{kb_id}-c{i}" for i in range(start, end)],
+                vectors=_unit(rng, end - start, args.dim),
+                texts=[f"chunk {i}" for i in range(start, end)],
+                metadatas=[{"doc_id": f"{kb_id}-d{i // 50}", "chunk_index": i % 50} for i in range(start, end)],
+            )
+
+    retriever = RetrievalService(embedder=object(), vector_store=store)  # type: ignore[arg-type]
+    queries = _unit(rng, args.questions, args.dim)
+    questions = [f"question {i}" for i in range(args.questions)]
+
+    def report(label: str, ms: list[float]) -> None:
+        print(f"{label:<28} p50={statistics.median(ms):7.1f}ms p99={sorted(ms)[int(0.99 * (len(ms) - 1))]:7.1f}ms")
+
+    print(f"kbs={args.kbs} vectors/kb={args.vectors} dim={args.dim} threads={settings.query_retrieval_threads}")
+    report(
+        "single kb, 1 question",
+        await _time(lambda: retriever.aretrieve_with_vector(kb_id=kb_ids[0], query_vector=queries[0]), args.runs),
+    )
+    for n in range(1, args.questions + 1):
+        report(
+            f"{args.kbs} kbs, {n} question(s)",
+            await _time(
+                lambda n=n: retriever.afederated_retrieve(
+                    kb_ids=kb_ids, questions=questions[:n], query_vectors=queries[:n]
+                ),
+                args.runs,
+            ),
+        )
+    retriever.close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--kbs", type=int, default=3)
+    ap.add_argument("--questions", type=int, default=3)
+    ap.add_argument("--vectors", type=int, default=20000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--runs", type=int, default=50)
+    args = ap.parse_args()
+
+    settings.rag_hybrid_lexical_weight = 0.0
+    settings.rerank_enabled = False
+    init_db()
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
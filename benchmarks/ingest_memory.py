@@ -0,0 +1,77 @@
+"""
+Peak Python memory of extract + chunk for a large text file: whole-document vs streaming.
+
+Only the extraction/chunking stages are measured (no model, no vector store), so the
+script runs without torch/chromadb installed.
+
+Usage:
+    python benchmarks/ingest_memory.py [--mb 64]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.ingest.chunking import chunk_stream, chunk_text  # noqa: E402
+from app.ingest.extractors.plaintext import PlainTextExtractor  # noqa: E402
+
+WORDS = "the old king of veyra rode north through ash and snow to the gate of the silent order".split()
+
+
+def _write_corpus(path: Path, mb: int) -> None:
+    rng = random.Random(0)
+    target = mb * 1024 * 1024
+    written = 0
+    with path.open("w", encoding="utf-8") as f:
+        while written < target:
+            para = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 200))) + "\n\n"
+            f.write(para)
+            written += len(para)
+
+
+def _peak(fn) -> tuple[int, int]:
+    tracemalloc.start()
+    n = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return n, peak
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=int, default=64)
+    args = ap.parse_args()
+
+    ext = PlainTextExtractor()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "lore.txt"
+        _write_corpus(path, args.mb)
+        size = os.path.getsize(path)
+
+        def whole() -> int:
+            text = ext.extract(path=str(path), content_type=None).text
+            return len(chunk_text(text))
+
+        def streamed() -> int:
+            stream = ext.extract_stream(path=str(path), content_type=None)
+            return sum(1 for _ in chunk_stream(stream.segments))
+
+        n_whole, peak_whole = _peak(whole)
+        n_stream, peak_stream = _peak(streamed)
+
+    mib = 1024 * 1024
+    print(f"file={size / mib:.1f} MiB")
+    print(f"whole-document: chunks={n_whole} peak={peak_whole / mib:8.1f} MiB")
+    print(f"streaming:      chunks={n_stream} peak={peak_stream / mib:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Disk footprint and MaxSim re-scoring latency of the late-interaction TokenIndex.
+
+Synthetic unit-norm token embeddings stand in for model output, so no model is needed.
+Query cost depends on the number of candidates re-scored, not on KB size (token rows
+are read from memory-mapped segments), so footprint is reported per chunk and
+extrapolated linearly to `--extrapolate` chunks.
+
+Usage:
+    python benchmarks/late_interaction.py [--chunks 20000] [--tokens 200] [--dim 128] [--dtype float16]
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.vectorstore.late_interaction import TokenIndex  # noqa: E402
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=20000)
+    ap.add_argument("--tokens", type=int, default=200, help="average tokens per chunk")
+    ap.add_argument("--hidden", type=int, default=768, help="model hidden size before projection")
+    ap.add_argument("--dim", type=int, default=128)
+    ap.add_argument("--dtype", default="float16", choices=["float16", "int8"])
+    ap.add_argument("--candidates", type=int, default=100)
+    ap.add_argument("--query-tokens", type=int, default=16)
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--extrapolate", type=int, default=100_000)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    def _mat(n: int) -> np.ndarray:
+        m = rng.standard_normal((n, args.hidden)).astype(np.float32)
+        return m / np.linalg.norm(m, axis=1, keepdims=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        idx = TokenIndex(Path(tmp), dim=args.dim, dtype=args.dtype, max_segments=1_000_000)
+        ids = [f"c{i}" for i in range(args.chunks)]
+        t0 = time.perf_counter()
+        for i in range(0, args.chunks, 1000):
+            part = ids[i : i + 1000]
+            lengths = rng.integers(args.tokens // 2, args.tokens * 3 // 2, size=len(part))
+            idx.append(part, [_mat(int(n)) for n in lengths])
+        build = time.perf_counter() - t0
+        idx.compact()
+        stats = idx.stats()
+
+        latencies = []
+        for _ in range(args.queries):
+            cand = [ids[j] for j in rng.choice(args.chunks, size=args.candidates, replace=False)]
+            q = _mat(args.query_tokens)
+            t0 = time.perf_counter()
+            idx.maxsim(q, cand)
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+
+    per_chunk = stats["disk_bytes"] / args.chunks
+    latencies.sort()
+    print(f"chunks={args.chunks} tokens={stats['tokens']} dim={stats['dim']} dtype={stats['dtype']} build={build:.1f}s")
+    print(f"disk={stats['disk_bytes'] / 2**20:.1f} MiB ({per_chunk / 1024:.1f} KiB/chunk)")
+    print(f"extrapolated to {args.extrapolate} chunks: {per_chunk * args.extrapolate / 2**30:.2f} GiB")
+    print(
+        f"MaxSim over {args.candidates} candidates: p50={statistics.median(latencies):.2f}ms "
+        f"p99={latencies[int(0.99 * (len(latencies) - 1))]:.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
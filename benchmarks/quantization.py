@@ -0,0 +1,93 @@
+"""
+Size and recall of the numpy store's storage precisions (float32 / float16 / int8 / binary).
+
+For each dtype and re-scoring factor, loads clustered synthetic unit-norm vectors into a
+fresh KB, compacts it, and reports the bytes scanned per query (the code matrix, which is
+what has to stay in memory), total bytes on disk (including the float32 copy kept for
+re-scoring), recall@k against brute-force float32 search, and query p50.
+
+Usage:
+    python benchmarks/quantization.py [--vectors 100000] [--dim 768] [--rescore 0,4,10]
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.settings import settings  # noqa: E402
+from app.vectorstore.numpy_store import NumpyVectorStore  # noqa: E402
+
+
+def _dataset(n: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(clusters, size=n)] + 0.8 * rng.standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--vectors", type=int, default=100_000)
+    ap.add_argument("--dim", type=int, default=768)
+    ap.add_argument("--clusters", type=int, default=500)
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--dtypes", default="float32,float16,int8,binary")
+    ap.add_argument("--rescore", default="0,4,10")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    data = _dataset(args.vectors, args.dim, args.clusters, rng)
+    queries = data[rng.integers(args.vectors, size=args.queries)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32) / np.sqrt(args.dim)
+    d2 = np.einsum("ij,ij->i", data, data)[None, :] - 2.0 * (queries @ data.T)
+    truth = [set(np.argpartition(row, args.k)[: args.k].tolist()) for row in d2]
+    del d2
+
+    settings.numpy_store_index = "flat"
+    settings.numpy_store_max_segments = 10**6
+    print(f"vectors={args.vectors} dim={args.dim} k={args.k}")
+    for dtype in args.dtypes.split(","):
+        for rescore in [int(x) for x in args.rescore.split(",")]:
+            if dtype == "float32" and rescore:
+                continue
+            settings.numpy_store_dtype = dtype
+            settings.numpy_store_rescore = rescore
+            with tempfile.TemporaryDirectory() as tmp:
+                store = NumpyVectorStore(Path(tmp))
+                for start in range(0, args.vectors, 8192):
+                    end = min(args.vectors, start + 8192)
+                    store.upsert(
+                        kb_id="bench",
+                        ids=[str(i) for i in range(start, end)],
+                        vectors=data[start:end],
+                        texts=[""] * (end - start),
+                        metadatas=[{}] * (end - start),
+                    )
+                store.compact("bench")
+                scanned = sum(f.stat().st_size for f in Path(tmp).rglob("vectors.npy"))
+                disk = store.stats("bench")["disk_bytes"]
+
+                latencies, recalls = [], []
+                for q, gt in zip(queries, truth):
+                    t = time.perf_counter()
+                    hits = store.query(kb_id="bench", query_vector=q, top_k=args.k)
+                    latencies.append((time.perf_counter() - t) * 1000.0)
+                    recalls.append(len(gt & {int(h.id) for h in hits}) / args.k)
+
+            print(
+                f"{dtype:>8} rescore={rescore:<3} scanned={scanned / 2**20:7.1f} MiB disk={disk / 2**20:7.1f} MiB "
+                f"recall@{args.k}={statistics.mean(recalls):.3f} p50={statistics.median(latencies):.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
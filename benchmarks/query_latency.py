@@ -0,0 +1,62 @@
+"""
+Measure p50/p99 latency of `POST /kbs/{kb_id}/query` against a running server.
+
+Usage:
+    python benchmarks/query_latency.py --kb-id <kb_id> [--base-url http://127.0.0.1:8000] [-n 50] [-c 4]
+
+Run it once against the old build and once against the new one to compare.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+QUESTIONS = [
+    "Who rules the city of Veyra?",
+    "Describe the northern mountain passes.",
+    "What factions oppose the crown?",
+    "Summarize the history of the old empire.",
+]
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base-url", default="http://127.0.0.1:8000")
+    ap.add_argument("--kb-id", required=True)
+    ap.add_argument("-n", "--requests", type=int, default=50)
+    ap.add_argument("-c", "--concurrency", type=int, default=4)
+    ap.add_argument("--top-k", type=int, default=6)
+    args = ap.parse_args()
+
+    url = f"{args.base_url}/kbs/{args.kb_id}/query"
+
+    def _one(i: int) -> float:
+        payload = {"question": QUESTIONS[i % len(QUESTIONS)], "top_k": args.top_k}
+        t0 = time.perf_counter()
+        with httpx.Client(timeout=120.0) as client:
+            resp = client.post(url, json=payload)
+        resp.raise_for_status()
+        return (time.perf_counter() - t0) * 1000.0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = list(pool.map(_one, range(args.requests)))
+    wall = time.perf_counter() - t0
+
+    print(f"requests={len(latencies)} concurrency={args.concurrency} wall={wall:.2f}s")
+    print(f"p50={_percentile(latencies, 50):.1f}ms p99={_percentile(latencies, 99):.1f}ms mean={statistics.mean(latencies):.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Concurrency scaling of `/kbs/{kb_id}/query` against a stubbed LLM.
+
+Drives the real FastAPI app in-process (httpx ASGI transport) with a temp SQLite DB, a
+numpy vector store of `--vectors` random rows, a stub embedder that sleeps `--embed-ms`
+per batch (behind the real micro-batcher) and a FakeLLMClient that streams `--llm-ms` of
+tokens. Query caches are disabled. For each concurrency level it reports throughput and
+latency for two LLM call paths:
+
+- `async`: the route's non-blocking `agenerate` (no thread held while "Gemini" works);
+- `threadpool`: the old blocking `generate` via `run_in_threadpool`, which is capped by
+  the default AnyIO thread limit (40), so throughput plateaus past that many requests.
+
+Usage:
+    python benchmarks/query_load.py [--concurrency 10,40,80,160,320] [--llm-ms 500] [--embed-ms 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+_TMP = tempfile.TemporaryDirectory()
+# The SQLite engine is created at import time, so point it at a scratch DB first.
+os.environ["SQLITE_PATH"] = str(Path(_TMP.name) / "app.db")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import httpx  # noqa: E402
+from starlette.concurrency import run_in_threadpool  # noqa: E402
+
+from app.api import deps  # noqa: E402
+from app.core.registry import ServiceRegistry  # noqa: E402
+from app.core.settings import settings  # noqa: E402
+from app.db import crud  # noqa: E402
+from app.db.session import SessionLocal, init_db  # noqa: E402
+from app.embeddings.batcher import EmbeddingMicroBatcher  # noqa: E402
+from app.llms.fake import FakeLLMClient  # noqa: E402
+from app.main import create_app  # noqa: E402
+from app.rag.retriever import RetrievalService  # noqa: E402
+from app.vectorstore.numpy_store import NumpyVectorStore  # noqa: E402
+
+
+class _StubEmbedder:
+    def __init__(self, dim: int, delay_s: float) -> None:
+        self.dim = dim
+        self.delay_s = delay_s
+        self._rng = np.random.default_rng(0)
+
+    def embed_texts(self, texts: list[str]) -> np.ndarray:
+        time.sleep(self.delay_s)  # stands in for the forward pass (releases the GIL, like torch)
+        v = self._rng.standard_normal((len(texts), self.dim)).astype(np.float32)
+        return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+class _BlockingFakeLLM(FakeLLMClient):
+    """The pre-async path: a blocking call parked on a request-threadpool thread."""
+
+    async def agenerate(self, *, system: str, user: str) -> str:
+        return await run_in_threadpool(self.generate, system=system, user=user)
+
+
+def _pct(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+async def _level(client: httpx.AsyncClient, kb_id: str, concurrency: int, requests: int) -> tuple[float, list[float]]:
+    gate = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def one(i: int) -> None:
+        async with gate:
+            t = time.perf_counter()
+            r = await client.post(f"/kbs/{kb_id}/query", json={"question": f"who rules veyra #{i}"})
+            r.raise_for_status()
+            latencies.append((time.perf_counter() - t) * 1000.0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return time.perf_counter() - t0, latencies
+
+
+async def _run(mode: str, kb_id: str, store: NumpyVectorStore, args: argparse.Namespace) -> None:
+    tokens = ["tok "] * args.tokens
+    llm_cls = FakeLLMClient if mode == "async" else _BlockingFakeLLM
+    llm = llm_cls(tokens, delay_s=args.llm_ms / 1000.0 / args.tokens)
+    stub = _StubEmbedder(args.dim, args.embed_ms / 1000.0)
+    batcher = EmbeddingMicroBatcher(
+        stub,  # type: ignore[arg-type]
+        max_batch=settings.query_embed_max_batch,
+        max_wait_ms=settings.query_embed_max_wait_ms,
+        threads=settings.query_embed_threads,
+        max_queue=settings.query_embed_max_queue,
+    )
+    retriever = RetrievalService(embedder=stub, vector_store=store)  # type: ignore[arg-type]
+
+    app = create_app(ServiceRegistry(llm=llm))
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one INFO line per request otherwise
+    app.dependency_overrides[deps.get_query_embedder] = lambda: batcher
+    app.dependency_overrides[deps.get_retriever] = lambda: retriever
+    app.dependency_overrides[deps.get_query_cache] = lambda: None
+    app.dependency_overrides[deps.get_semantic_cache] = lambda: None
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for concurrency in [int(x) for x in args.concurrency.split(",")]:
+            requests = max(args.min_requests, concurrency * 3)
+            elapsed, latencies = await _level(client, kb_id, concurrency, requests)
+            print(
+                f"{mode:>10} c={concurrency:<4} {requests / elapsed:7.1f} req/s "
+                f"p50={statistics.median(latencies):7.0f}ms p99={_pct(latencies, 0.99):7.0f}ms"
+            )
+    await batcher.aclose()
+    retriever.close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", default="10,40,80,160,320")
+    ap.add_argument("--min-requests", type=int, default=200)
+    ap.add_argument("--llm-ms", type=float, default=500.0)
+    ap.add_argument("--tokens", type=int, default=20)
+    ap.add_argument("--embed-ms", type=float, default=5.0)
+    ap.add_argument("--vectors", type=int, default=20000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--modes", default="threadpool,async")
+    args = ap.parse_args()
+
+    settings.query_cache_enabled = False
+    settings.semantic_cache_enabled = False
+    init_db()
+    with SessionLocal() as session:
+        kb_id = crud.create_kb(session, name="load-test", description=None).id
+
+    store = NumpyVectorStore(Path(_TMP.name) / "vectors")
+    rng = np.random.default_rng(1)
+    for start in range(0, args.vectors, 4096):
+        end = min(args.vectors, start + 4096)
+        v = rng.standard_normal((end - start, args.dim)).astype(np.float32)
+        store.upsert(
+            kb_id=kb_id,
+            ids=[f"c{i}" for i in range(start, end)],
+            vectors=v / np.linalg.norm(v, axis=1, keepdims=True),
+            texts=[f"chunk {i}" for i in range(start, end)],
+            metadatas=[{"doc_id": f"d{i // 50}", "chunk_index": i % 50} for i in range(start, end)],
+        )
+
+    print(f"llm={args.llm_ms:.0f}ms embed={args.embed_ms:.0f}ms/batch vectors={args.vectors}")
+    for mode in args.modes.split(","):
+        asyncio.run(_run(mode.strip(), kb_id, store, args))
+
+
+if __name__ == "__main__":
+    main()
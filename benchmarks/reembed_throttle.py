@@ -0,0 +1,178 @@
+"""
+Question-embedding latency while a KB is re-embedded in the background, with and without throttling.
+
+Builds a temp SQLite DB with one KB of `--chunks` chunks per case and runs the real
+`ReembedWorker` on it while the real micro-batcher embeds questions in bursts of `--qps`
+questions/s for `--burst-s`, separated by `--gap-s` of silence. Both sides use a stub
+embedder on one shared "device" (a lock held for `--batch-ms` + `--text-ms` per text), so
+a re-embedding step of REEMBED_STEP_SIZE texts delays any question queued behind it, as one
+GPU or a saturated CPU would. For each case it reports question-embedding p50/p99 and the
+re-embedding rate:
+
+- `idle`: no re-embedding;
+- `unthrottled`: REEMBED_QUERY_IDLE_MS=0, REEMBED_DUTY_CYCLE=1;
+- `throttled`: the default REEMBED_QUERY_IDLE_MS and REEMBED_DUTY_CYCLE.
+
+Usage:
+    python benchmarks/reembed_throttle.py [--chunks 20000] [--seconds 10] [--qps 20] [--text-ms 2] [--batch-ms 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+_TMP = tempfile.TemporaryDirectory()
+# The SQLite engine is created at import time, so point it at a scratch DB first.
+os.environ["SQLITE_PATH"] = str(Path(_TMP.name) / "app.db")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.settings import settings  # noqa: E402
+from app.db import crud  # noqa: E402
+from app.db.models import Chunk, Document  # noqa: E402
+from app.db.session import SessionLocal, init_db  # noqa: E402
+from app.embeddings.batcher import EmbeddingMicroBatcher  # noqa: E402
+from app.ingest.reembed import ReembedWorker  # noqa: E402
+from app.vectorstore.factory import create_vector_store  # noqa: E402
+
+_DEVICE = threading.Lock()
+
+
+class _StubEmbedder:
+    """Random unit vectors; holds the shared device for a fixed cost per batch and per text."""
+
+    def __init__(self, model: str, dim: int, batch_s: float, text_s: float) -> None:
+        self.model = model
+        self._dim = dim
+        self._batch_s = batch_s
+        self._text_s = text_s
+        self._rng = np.random.default_rng(0)
+
+    def embed_texts(self, texts: list[str]) -> np.ndarray:
+        with _DEVICE:
+            time.sleep(self._batch_s + self._text_s * len(texts))
+        v = self._rng.standard_normal((len(texts), self._dim)).astype(np.float32)
+        return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def _build(n: int) -> str:
+    with SessionLocal() as session:
+        kb = crud.create_kb(session, name="reembed", description=None)
+        kb.embedding_model = "A"
+        session.add(kb)
+        docs = [Document(kb_id=kb.id, original_filename=f"doc{d}.txt", status="ready") for d in range(n // 100 + 1)]
+        session.add_all(docs)
+        session.commit()
+        for start in range(0, n, 5000):
+            session.add_all(
+                [
+                    Chunk(kb_id=kb.id, doc_id=docs[i // 100].id, chunk_index=i % 100, text=f"chunk {i}")
+                    for i in range(start, min(n, start + 5000))
+                ]
+            )
+            session.commit()
+        crud.create_reembed_job(session, kb, target_model="B")
+        return kb.id
+
+
+async def _questions(batcher: EmbeddingMicroBatcher, args: argparse.Namespace) -> list[float]:
+    latencies: list[float] = []
+
+    async def one(i: int) -> None:
+        t = time.perf_counter()
+        await batcher.embed(f"who rules veyra #{i}")
+        latencies.append((time.perf_counter() - t) * 1000.0)
+
+    tasks, i = [], 0
+    end = time.monotonic() + args.seconds
+    while time.monotonic() < end:
+        burst_end = min(end, time.monotonic() + args.burst_s)
+        while time.monotonic() < burst_end:
+            tasks.append(asyncio.create_task(one(i)))
+            i += 1
+            await asyncio.sleep(1.0 / args.qps)
+        await asyncio.sleep(max(0.0, min(args.gap_s, end - time.monotonic())))
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+async def _case(label: str, args: argparse.Namespace) -> None:
+    stub = _StubEmbedder("A", args.dim, args.batch_ms / 1000.0, args.text_ms / 1000.0)
+    batcher = EmbeddingMicroBatcher(
+        stub,  # type: ignore[arg-type]
+        max_batch=settings.query_embed_max_batch,
+        max_wait_ms=settings.query_embed_max_wait_ms,
+        threads=settings.query_embed_threads,
+        max_queue=settings.query_embed_max_queue,
+    )
+    worker = None
+    if label != "idle":
+        kb_id = _build(args.chunks)
+        worker = ReembedWorker(
+            embedder=_StubEmbedder("B", args.dim, args.batch_ms / 1000.0, args.text_ms / 1000.0),  # type: ignore[arg-type]
+            vector_store=create_vector_store(),  # type: ignore[arg-type]
+            query_idle_s=batcher.idle_s,
+        )
+        worker.start()
+
+    t0 = time.perf_counter()
+    latencies = await _questions(batcher, args)
+    elapsed = time.perf_counter() - t0
+    rate = ""
+    if worker is not None:
+        worker.stop(timeout=30.0)
+        with SessionLocal() as session:
+            job = crud.active_reembed_job(session, kb_id)
+            done = job.done if job is not None else args.chunks
+            if job is not None:
+                # Stopping requeued it; the next case's worker must not resume it.
+                crud.cancel_reembed_job(session, job.id)
+        rate = f" re-embedded={done / elapsed:7.0f} chunks/s"
+    await batcher.aclose()
+    print(
+        f"{label:<12} questions={len(latencies):<5} p50={statistics.median(latencies):6.1f}ms "
+        f"p99={sorted(latencies)[int(0.99 * (len(latencies) - 1))]:6.1f}ms{rate}"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=20000)
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--qps", type=float, default=20.0)
+    ap.add_argument("--burst-s", type=float, default=1.0)
+    ap.add_argument("--gap-s", type=float, default=1.0)
+    ap.add_argument("--text-ms", type=float, default=2.0)
+    ap.add_argument("--batch-ms", type=float, default=5.0)
+    ap.add_argument("--dim", type=int, default=384)
+    args = ap.parse_args()
+
+    settings.vector_store = "numpy"
+    settings.numpy_store_dir = Path(_TMP.name) / "vectors"
+    settings.embedding_model = "A"
+    settings.embedding_cache_enabled = False
+    settings.reembed_auto = False
+    settings.reembed_poll_interval_s = 0.2
+    init_db()
+
+    idle_ms, duty = settings.reembed_query_idle_ms, settings.reembed_duty_cycle
+    print(f"chunks={args.chunks} step={settings.reembed_step_size} qps={args.qps} text={args.text_ms}ms")
+    cases = [("idle", idle_ms, duty), ("unthrottled", 0.0, 1.0), ("throttled", idle_ms, duty)]
+    for label, query_idle_ms, duty_cycle in cases:
+        settings.reembed_query_idle_ms = query_idle_ms
+        settings.reembed_duty_cycle = duty_cycle
+        asyncio.run(_case(label, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Memory and throughput of handing embeddings from the embedder to the vector store.
+
+Simulates a `--chunks` ingest in windows of INGEST_EMBED_WINDOW rows with synthetic
+embedder output (no model needed), upserting into the numpy store either as before
+(`list[list[float]]`: one Python float object per element, converted back by the store)
+or as the float32 ndarray the embedder now returns. Reports wall time and the
+tracemalloc peak of each path.
+
+Usage:
+    python benchmarks/vector_handoff.py [--chunks 50000] [--dim 768]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.settings import settings  # noqa: E402
+from app.vectorstore.numpy_store import NumpyVectorStore  # noqa: E402
+
+
+def _run(as_lists: bool, args: argparse.Namespace) -> tuple[float, int]:
+    rng = np.random.default_rng(0)
+    window = settings.ingest_embed_window
+    with tempfile.TemporaryDirectory() as tmp:
+        store = NumpyVectorStore(Path(tmp))
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        for start in range(0, args.chunks, window):
+            end = min(args.chunks, start + window)
+            matrix = rng.standard_normal((end - start, args.dim), dtype=np.float32)  # embedder output
+            vectors = [v.tolist() for v in matrix] if as_lists else matrix
+            store.upsert(
+                kb_id="bench",
+                ids=[f"c{i}" for i in range(start, end)],
+                vectors=vectors,  # type: ignore[arg-type]
+                texts=[""] * (end - start),
+                metadatas=[{}] * (end - start),
+            )
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=50000)
+    ap.add_argument("--dim", type=int, default=768)
+    args = ap.parse_args()
+
+    settings.numpy_store_max_segments = 10**6  # keep background compaction out of the measurement
+    for label, as_lists in (("list[list[float]]", True), ("np.ndarray", False)):
+        elapsed, peak = _run(as_lists, args)
+        print(
+            f"{label:>18}: {args.chunks} chunks in {elapsed:.2f}s ({args.chunks / elapsed:.0f} chunks/s), "
+            f"peak traced memory {peak / 2**20:.1f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
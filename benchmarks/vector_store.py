@@ -0,0 +1,102 @@
+"""
+Ingest and query latency of the vector store backends on synthetic unit-norm vectors.
+
+Upserts `--vectors` rows in batches of `--batch` (as the ingestion pipeline does), then
+measures single-query p50/p99 for top-k with and without a `doc_id` metadata filter.
+Chroma is skipped when `chromadb` is not installed. Both stores write to a temp dir.
+
+Usage:
+    python benchmarks/vector_store.py [--vectors 50000] [--dim 768] [--backends numpy,chroma]
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.core.settings import settings  # noqa: E402
+
+
+def _make_store(backend: str, root: Path) -> Any:
+    if backend == "numpy":
+        from app.vectorstore.numpy_store import NumpyVectorStore
+
+        return NumpyVectorStore(root)
+    settings.chroma_dir = root
+    from app.vectorstore.chroma import ChromaVectorStore
+
+    return ChromaVectorStore()
+
+
+def _pct(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+def _run(backend: str, vectors: np.ndarray, args: argparse.Namespace) -> None:
+    rng = np.random.default_rng(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            store = _make_store(backend, Path(tmp))
+        except ImportError as exc:
+            print(f"{backend}: skipped ({exc})")
+            return
+
+        n = len(vectors)
+        t0 = time.perf_counter()
+        for start in range(0, n, args.batch):
+            end = min(n, start + args.batch)
+            store.upsert(
+                kb_id="bench",
+                ids=[f"c{i}" for i in range(start, end)],
+                vectors=vectors[start:end],
+                texts=[f"chunk {i}" for i in range(start, end)],
+                metadatas=[{"doc_id": f"d{i // 50}", "chunk_index": i % 50} for i in range(start, end)],
+            )
+        ingest_s = time.perf_counter() - t0
+
+        def _latencies(where: dict[str, Any] | None) -> list[float]:
+            out = []
+            for _ in range(args.queries):
+                q = vectors[rng.integers(n)] + 0.05 * rng.standard_normal(vectors.shape[1]).astype(np.float32)
+                t = time.perf_counter()
+                store.query(kb_id="bench", query_vector=q, top_k=args.top_k, where=where)
+                out.append((time.perf_counter() - t) * 1000.0)
+            return out
+
+        plain = _latencies(None)
+        filtered = _latencies({"doc_id": {"$in": [f"d{i}" for i in range(0, n // 50, 10)]}})
+
+    print(f"{backend}: ingest {n} vectors in {ingest_s:.1f}s ({n / ingest_s:.0f} vectors/s)")
+    print(f"{backend}: query p50={statistics.median(plain):.2f}ms p99={_pct(plain, 0.99):.2f}ms")
+    print(f"{backend}: filtered query p50={statistics.median(filtered):.2f}ms p99={_pct(filtered, 0.99):.2f}ms")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--vectors", type=int, default=50000)
+    ap.add_argument("--dim", type=int, default=768)
+    ap.add_argument("--batch", type=int, default=512)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=6)
+    ap.add_argument("--backends", default="numpy,chroma")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.vectors, args.dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    for backend in args.backends.split(","):
+        _run(backend.strip(), vectors, args)
+
+
+if __name__ == "__main__":
+    main()
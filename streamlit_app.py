@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from collections.abc import Iterator
 from dataclasses import dataclass
 from typing import Any
 
@@ -39,6 +40,19 @@ def _get_retriever():
     return RetrievalService()
 
 
+@st.cache_resource
+def _get_llm() -> GeminiClient:
+    """Create the Gemini client once; the SDK client is safe to reuse across reruns."""
+    return GeminiClient()
+
+
+def _tee(stream: Iterator[str], into: list[str]) -> Iterator[str]:
+    """Yield `stream` while keeping what arrived, so a failure mid-answer still leaves the partial text."""
+    for token in stream:
+        into.append(token)
+        yield token
+
+
 def _list_kbs() -> list[dict[str, Any]]:
     with SessionLocal() as session:
         kbs = crud.list_kbs(session)
@@ -130,26 +144,30 @@ def main() -> None:
 
     # Generate response (no internal API calls; direct backend imports)
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            try:
+        contexts: list[dict[str, Any]] = []
+        answer = ""
+        streamed: list[str] = []
+        try:
+            with st.spinner("Retrieving..."):
                 # Retrieval is optional: if vectorstore/embedding deps fail, still let chat work.
                 try:
                     retriever = _get_retriever()
                     contexts = retriever.retrieve(kb_id=kb_id, question=user_text, top_k=top_k, where=None)
                 except Exception as e:  # noqa: BLE001
-                    contexts = []
                     st.warning(f"Retrieval disabled (vectorstore init failed): {e}")
                 system = build_storyteller_system_prompt()
                 user_prompt = build_user_prompt(user_text, contexts=contexts)
-                client = GeminiClient()
-                answer = client.generate(system=system, user=user_prompt)
-            except Exception as e:  # noqa: BLE001
-                answer = f"Error: {e}"
-                contexts = []
+                client = _get_llm()
 
-            st.write(answer)
+            # Contexts are ready before the first token; show them while the answer streams in.
             if show_contexts:
                 _render_contexts(contexts)
+            answer = st.write_stream(_tee(client.generate_stream(system=system, user=user_prompt), streamed))
+        except Exception as e:  # noqa: BLE001
+            # Keep the partial answer and the contexts already shown; the error follows them.
+            error = f"Error: {e}"
+            st.write(error)
+            answer = "\n\n".join(p for p in ("".join(streamed), error) if p)
 
     st.session_state.messages.append(ChatTurn(role="assistant", content=answer, contexts=contexts))
 
@@ -0,0 +1,10 @@
+from __future__ import annotations
+
+import os
+import tempfile
+from pathlib import Path
+
+# The SQLite engine is created when app.db.session is imported, so point it at a scratch DB
+# before any test module imports the app.
+_TMP = tempfile.TemporaryDirectory(prefix="rag-tests-")
+os.environ["SQLITE_PATH"] = str(Path(_TMP.name) / "app.db")
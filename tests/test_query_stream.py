@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import json
+from collections.abc import AsyncIterator
+from typing import Any
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api import deps
+from app.core.registry import ServiceRegistry
+from app.db import crud
+from app.db.session import SessionLocal, init_db
+from app.llms.fake import FakeLLMClient
+from app.main import create_app
+from app.rag.query_cache import QueryCache
+
+_CONTEXT = {"id": "c1", "score": 0.9, "text": "Veyra is ruled by Queen Mira.", "meta": {}, "citation": "lore.md"}
+
+
+class _StubEmbedder:
+    """Stands in for the query micro-batcher: a fixed unit vector, no model."""
+
+    async def embed(self, text: str, *, model: str | None = None) -> np.ndarray:
+        return np.ones(8, dtype=np.float32) / np.sqrt(8)
+
+
+class _StubRetriever:
+    """Returns one canned context for any KB."""
+
+    def embedding_model(self, kb_id: str) -> str:
+        return "stub"
+
+    async def aretrieve_with_vector(self, *, kb_id: str, query_vector: Any, **kwargs: Any) -> list[dict[str, Any]]:
+        if not isinstance(query_vector, np.ndarray):
+            await query_vector
+        return [dict(_CONTEXT)]
+
+
+class _FailingLLM(FakeLLMClient):
+    """Streams one token, then fails like a dropped Gemini connection."""
+
+    async def agenerate_stream(self, *, system: str, user: str) -> AsyncIterator[str]:
+        self.calls += 1
+        yield "Once "
+        raise RuntimeError("upstream connection reset")
+
+
+@pytest.fixture()
+def kb_id() -> str:
+    init_db()
+    with SessionLocal() as session:
+        return crud.create_kb(session, name="stream", description=None).id
+
+
+def _client(llm: FakeLLMClient, *, cache: QueryCache | None = None) -> TestClient:
+    app = create_app(ServiceRegistry(llm=llm))
+    app.dependency_overrides[deps.get_query_embedder] = lambda: _StubEmbedder()
+    app.dependency_overrides[deps.get_retriever] = lambda: _StubRetriever()
+    app.dependency_overrides[deps.get_query_cache] = lambda: cache
+    app.dependency_overrides[deps.get_semantic_cache] = lambda: None
+    # Not used as a context manager: startup (model warm-up, background workers) is skipped.
+    return TestClient(app)
+
+
+def _stream(client: TestClient, kb_id: str, question: str = "Who rules Veyra?") -> list[tuple[str, dict[str, Any]]]:
+    r = client.post(f"/kbs/{kb_id}/query/stream", json={"question": question})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+    events = []
+    for block in r.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_sends_contexts_then_tokens_then_done(kb_id: str) -> None:
+    llm = FakeLLMClient(["Once ", "upon ", "a ", "time."])
+    events = _stream(_client(llm), kb_id)
+
+    assert [name for name, _ in events] == ["contexts", "token", "token", "token", "token", "done"]
+    contexts = events[0][1]
+    assert contexts["kb_id"] == kb_id
+    assert contexts["contexts"] == [_CONTEXT]
+    assert [data["text"] for name, data in events if name == "token"] == ["Once ", "upon ", "a ", "time."]
+    assert events[-1][1] == {"answer": "Once upon a time.", "cached": {"contexts": False, "answer": False}}
+
+
+def test_cached_answer_is_streamed_as_one_token(kb_id: str) -> None:
+    llm = FakeLLMClient(["Once ", "upon ", "a ", "time."])
+    client = _client(llm, cache=QueryCache(max_items=16, ttl_s=60.0, answers=True))
+    _stream(client, kb_id)
+
+    events = _stream(client, kb_id)
+
+    assert [name for name, _ in events] == ["contexts", "token", "done"]
+    assert events[1][1] == {"text": "Once upon a time."}
+    assert events[2][1] == {"answer": "Once upon a time.", "cached": {"contexts": True, "answer": True}}
+    assert llm.calls == 1
+
+
+def test_generation_failure_ends_with_error_event(kb_id: str) -> None:
+    cache = QueryCache(max_items=16, ttl_s=60.0, answers=True)
+    events = _stream(_client(_FailingLLM(), cache=cache), kb_id)
+
+    assert [name for name, _ in events] == ["contexts", "token", "error"]
+    assert events[-1][1] == {"detail": "upstream connection reset"}
+    # A partial answer is not cached.
+    assert cache.stats()["answers"]["entries"] == 0
+
+
+def test_unknown_kb_is_404_before_streaming() -> None:
+    init_db()
+    r = _client(FakeLLMClient()).post("/kbs/missing/query/stream", json={"question": "Who rules Veyra?"})
+
+    assert r.status_code == 404
+    assert r.json() == {"detail": "knowledge base not found"}